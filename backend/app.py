@@ -1,20 +1,71 @@
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from pathlib import Path
 import json,uuid
 import os
+import threading
+import time
+from typing import List
 from datetime import datetime,timezone
 
-from backend.llm import call_llm, agent_query as llm_agent_query
+from backend.llm import call_llm, call_llm_batch, stream_llm, triage_batch, agent_prompt, warmup_local_model, registry, prefix_cache, response_cache
+from backend.store import Store, DraftRepository, ProcessedRepository, EmailRepository, import_json
+from backend.inbox import InboxService, thread_key
+from backend.prompts import PromptService
+from backend.jobs import JobQueue, JobRunner
+from backend.constrained import decode_stats
+from backend.classifier import CategoryRouter
+from backend.extract import reference_date
+from backend.config import INBOX_PATH, PROMPT_PATH, PROCESSED_PATH, DRAFTS_PATH, STORE_PATH
+from backend.vector_index import VectorIndex, related_context_k, semantic_enabled
+from backend.search_index import SearchIndex, processed_fields, snippet, text_search_enabled
+from backend.sync import MODE_TEMPLATES, SYNC_REASONS, plan_sync, stamp, template_version
+from backend.metrics import metrics, stage, begin_request, server_timing_enabled, server_timing_header
+from backend.listing import paginate, parse_fields, project, in_range, until_bound, json_response, dumps, sort_key
 
-BASE = Path(__file__).resolve().parent.parent  
+# drafts and processed results live in SQLite; the legacy JSON files
+# (DRAFTS_PATH, PROCESSED_PATH) are imported once on first startup
+store = Store(STORE_PATH)
+drafts_repo = DraftRepository(store)
+processed_repo = ProcessedRepository(store)
 
-INBOX_PATH = BASE / "data" / "mock_inbox.json"
-PROMPT_PATH = BASE / "prompts" / "default_p.json"
-PROCESSED_PATH = BASE / "data" / "processed.json"
-DRAFTS_PATH = BASE / "data" / "drafts.json"
+# parsed once, re-read only when the inbox file changes or new mail is
+# ingested (python -m backend.ingest)
+inbox_service = InboxService(INBOX_PATH, ingested=EmailRepository(store))
 
-app = FastAPI(title="Email Productivity Agent - Backend")
+# Prompt Brain templates, loaded once; a save bumps the version and swaps them in
+prompt_service = PromptService(PROMPT_PATH, store)
+# drop cached responses and preambles of any template edited since the last version
+prompt_service.on_change(response_cache.sync_templates)
+prompt_service.on_change(prefix_cache.sync_templates)
+
+# email embeddings for /search and related-email context, next to the store
+vector_index = VectorIndex(store, STORE_PATH.with_name(STORE_PATH.stem + ".vectors.npy"))
+
+# BM25 full-text index over emails (with their processed category/tasks) and drafts
+search_index = SearchIndex(store, STORE_PATH.with_name(STORE_PATH.stem + ".search"))
+
+# confident categorizations are answered without the LLM
+category_router = CategoryRouter()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # LOCAL_MODEL_WARMUP=eager loads the local model before serving requests
+    import_json(store, DRAFTS_PATH, PROCESSED_PATH)
+    search_index.sync_drafts(drafts_repo.list())
+    category_router.train_from_processed(processed_repo.all())
+    warmup_local_model()
+    job_runner.start()
+    yield
+    job_runner.stop()
+    registry.clear()
+    search_index.save()
+    store.close()
+
+app = FastAPI(title="Email Productivity Agent - Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,50 +75,631 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---- Metrics ----
+HTTP_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route.", labels=("method", "route", "status")
+)
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    timings = begin_request()
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+    route = request.scope.get("route")
+    HTTP_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=str(response.status_code),
+    )
+    if server_timing_enabled():
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
+def _collect_stats():
+    cache = response_cache.stats()
+    prefix = prefix_cache.stats()
+    models = registry.stats()
+    tiers = category_router.stats()
+    jobs = job_runner.metrics()
+    vectors = vector_index.stats()
+    text = search_index.stats()
+    return [
+        ("llm_response_cache_lookups_total", "counter", "Response cache lookups by result.",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("llm_response_cache_hit_ratio", "gauge", "Response cache hits / lookups.", [({}, cache["hit_rate"])]),
+        ("llm_response_cache_entries", "gauge", "Entries in the response cache.", [({}, cache["entries"])]),
+        ("llm_prefix_cache_prompts_total", "counter", "Local prompts by prefix KV cache result.",
+         [({"result": "hit"}, prefix["hits"]), ({"result": "miss"}, prefix["misses"])]),
+        ("llm_models_loaded", "gauge", "Local models resident in memory.", [({}, len(models["models"]))]),
+        ("llm_model_loads_total", "counter", "Local model loads.", [({}, models["loads"])]),
+        ("classifier_routed_total", "counter", "Categorizations by tier.",
+         [({"tier": "tier1"}, tiers["tier1"]), ({"tier": "llm"}, tiers["llm"])]),
+        ("jobs_queue_depth", "gauge", "Queued processing jobs.", [({}, jobs["queue_depth"])]),
+        ("jobs_in_flight", "gauge", "Jobs running in worker processes.", [({}, jobs["in_flight"])]),
+        ("vector_index_emails", "gauge", "Emails in the semantic index.", [({}, vectors["indexed"])]),
+        ("search_index_documents", "gauge", "Emails and drafts in the full-text index.", [({}, text["documents"])]),
+    ]
+
+metrics.collector(_collect_stats)
+
 def _now_iso():
     return datetime.now(timezone.utc).isoformat()
 
 def load_json(path: Path):
-    if path.exists():
-        return json.loads(path.read_text())
+    with stage("load_json"):
+        if path.exists():
+            return json.loads(path.read_text())
     return None
 
 def write_json_file(path: Path, obj):
     path.write_text(json.dumps(obj, indent=2))
 
+def _listing(request: Request, items, key, cursor, limit, fields, pairs=False):
+    """
+    Shared tail of the list endpoints: keyset pagination, field projection and
+    ETag handling. Without cursor/limit the plain (unpaginated) shape is kept.
+    With `pairs`, items are (key, record) tuples rendered as a {key: record}
+    dict, as /processed returns.
+    """
+    field_list = parse_fields(fields)
+    paged = cursor is not None or limit is not None
+    if paged:
+        try:
+            items, next_cursor = paginate(items, key, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if pairs:
+        body = {k: project(r, field_list) for k, r in items}
+    else:
+        body = [project(i, field_list) for i in items]
+    if paged:
+        body = {"items": body, "next_cursor": next_cursor}
+    return json_response(request, dumps(body))
+
 @app.get("/inbox")
-def get_inbox():
-    inbox = load_json(INBOX_PATH)
-    return inbox or []
+def get_inbox(
+    request: Request,
+    cursor: str = None,
+    limit: int = None,
+    fields: str = None,
+    sender: str = None,
+    since: str = None,
+    until: str = None
+):
+    """
+    All emails by default. Optional: keyset pagination (cursor/limit), field
+    projection (fields=id,sender,subject), sender and timestamp-range filters.
+    Responses carry an ETag and honour If-None-Match.
+    """
+    snapshot = inbox_service.snapshot()
+    if not any(v is not None for v in (cursor, limit, fields, sender, since, until)):
+        return json_response(request, snapshot.payload, snapshot.etag)
 
-@app.post("/process/{email_id}")
-def process_email(email_id: int):
-    inbox = load_json(INBOX_PATH) or []
-    email = next((e for e in inbox if e["id"] == email_id), None)
+    if sender:
+        emails = [e for e in snapshot.by_sender.get(sender.lower(), []) if in_range(e.get("timestamp"), since, until)]
+    elif since or until:
+        # bisect on the time-ordered index: only the emails in range are touched
+        emails = [e for e in snapshot.between(since, until_bound(until)) if e.get("timestamp")]
+    else:
+        emails = list(snapshot.emails)
+    emails.sort(key=lambda e: sort_key(e.get("id")))
+    return _listing(request, emails, lambda e: e.get("id"), cursor, limit, fields)
+
+@app.get("/inbox/{email_id}")
+def get_email(request: Request, email_id: int, fields: str = None):
+    """
+    One email, with the same projection and ETag handling as /inbox.
+    """
+    email = inbox_service.get(email_id)
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
+    return json_response(request, dumps(project(email, parse_fields(fields))))
 
-    prompts = load_json(PROMPT_PATH) or {}
-    cat_prompt = prompts["categorization_prompt"].replace("{email_text}", email["body"])
-    act_prompt = prompts["action_prompt"].replace("{email_text}", email["body"])
-
-    cat_out = call_llm(cat_prompt)
-    act_out = call_llm(act_prompt)
-
-    processed = load_json(PROCESSED_PATH) or {}
-    processed[str(email_id)] = {
+def _processed_record(email, cat_out, act_out, category_source="llm"):
+    return {
         "email": email,
         "category_output": cat_out,
-        "action_output": act_out
+        "action_output": act_out,
+        "category_source": category_source
     }
-    PROCESSED_PATH.write_text(json.dumps(processed, indent=2))
 
-    return {"status": "processed", "email_id": email_id}
+# ---- Background jobs ----
+job_queue = JobQueue(store)
+job_runner = JobRunner(
+    job_queue,
+    get_email=lambda email_id: inbox_service.get(email_id),
+    get_prompts=lambda: prompt_service.current(),
+    # stamped with the email and prompts the job ran on, so /process/sync redoes it if either changed meanwhile
+    save_result=lambda email, r, prompts: processed_repo.put(
+        email["id"],
+        stamp(
+            _processed_record(email, r["category_output"], r["action_output"], r.get("category_source", "llm")),
+            email,
+            template_version(prompts, "separate"),
+            prompts.version,
+        ),
+    ),
+    # the same tier-1 routing as /process: confident categorizations skip the LLM
+    classify=lambda email: category_router.classify([email])[0],
+)
+
+@app.post("/jobs")
+def submit_jobs(
+    email_ids: List[int] = Body(None),
+    unprocessed_only: bool = Body(False),
+    priority: int = Body(0),
+    max_attempts: int = Body(3)
+):
+    """
+    Queue one processing job per email (default: the whole inbox) for the
+    worker pool. Poll GET /jobs/{id}; higher priority runs first.
+    """
+    if email_ids is None:
+        email_ids = [e["id"] for e in inbox_service.all()]
+    if unprocessed_only:
+        done_ids = processed_repo.ids()
+        email_ids = [eid for eid in email_ids if str(eid) not in done_ids]
+    job_ids = job_queue.submit(email_ids, priority=priority, max_attempts=max_attempts)
+    job_runner.notify()
+    return {"status": "queued", "job_ids": job_ids, "queued": len(job_ids)}
+
+@app.get("/jobs")
+def get_job_metrics():
+    return job_runner.metrics()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": status, "id": job_id}
+
+PROCESS_MODES = tuple(MODE_TEMPLATES)
+
+def _process_mode(mode: str = None) -> str:
+    """
+    "separate" runs one generation per task; "triage" asks for category,
+    actions and reply in a single generation. Default from PROCESS_MODE.
+    """
+    mode = (mode or os.environ.get("PROCESS_MODE", "separate")).lower()
+    if mode not in PROCESS_MODES:
+        raise HTTPException(status_code=400, detail="Unknown mode")
+    return mode
+
+def _process_emails(emails, prompts, mode="separate", batch_size=8):
+    """
+    Categorize and extract actions for `emails` with batched LLM calls.
+    Returns (processed records, LLM prompts sent, emails categorized by tier 1).
+    Records are stamped with the email's content hash, the template version
+    and the Prompt Brain version.
+    """
+    version = template_version(prompts, mode)
+    if mode == "triage":
+        outs = triage_batch(emails, prompts, batch_size=batch_size)
+        records = [
+            stamp(dict(_processed_record(e, o["category_output"], o["action_output"]), reply_output=o["reply_output"]), e, version, prompts.version)
+            for e, o in zip(emails, outs)
+        ]
+        return records, len(emails) + sum(len(o["fallbacks"]) for o in outs), 0
+
+    # tier 1 answers confident categorizations; only the rest need an LLM prompt
+    with stage("classify"):
+        tier1 = category_router.classify(emails)
+    ambiguous = [e for e, a in zip(emails, tier1) if a is None]
+    with stage("render"):
+        cat_prompts = [prompts.render("categorization_prompt", email_text=e["body"]) for e in ambiguous]
+        act_prompts = [prompts.render("action_prompt", email_text=e["body"]) for e in emails]
+    templates = ["categorization_prompt"] * len(cat_prompts) + ["action_prompt"] * len(act_prompts)
+    # action deadlines ("by Friday") are resolved against each email's own date
+    references = [None] * len(cat_prompts) + [reference_date(e.get("timestamp")) for e in emails]
+    outs = call_llm_batch(cat_prompts + act_prompts, batch_size=batch_size, templates=templates, references=references)
+
+    cat_outs = iter(outs[:len(cat_prompts)])
+    act_outs = outs[len(cat_prompts):]
+    records = [
+        stamp(
+            _processed_record(
+                email,
+                answer if answer is not None else next(cat_outs),
+                act_outs[i],
+                "tier1" if answer is not None else "llm",
+            ),
+            email,
+            version,
+            prompts.version,
+        )
+        for i, (email, answer) in enumerate(zip(emails, tier1))
+    ]
+    return records, len(outs), len(emails) - len(ambiguous)
+
+# /process/batch and /process/sync must be registered before /process/{email_id}
+@app.post("/process/batch")
+def process_batch(
+    email_ids: List[int] = Body(None),
+    unprocessed_only: bool = Body(False),
+    batch_size: int = Body(8),
+    mode: str = Body(None)
+):
+    """
+    Process many emails in one pass. With no email_ids, the whole inbox is used;
+    unprocessed_only skips emails that already have a processed entry.
+    All prompts go to the LLM together and results are stored in one transaction.
+    """
+    t0 = time.perf_counter()
+    mode = _process_mode(mode)
+    snapshot = inbox_service.snapshot()
+    prompts = prompt_service.current()
+    done_ids = processed_repo.ids() if unprocessed_only else set()
+
+    ids = email_ids if email_ids is not None else [e["id"] for e in snapshot.emails]
+    results = []
+    todo = []
+    for eid in ids:
+        email = snapshot.by_id.get(eid)
+        if not email:
+            results.append({"email_id": eid, "status": "not_found"})
+        elif str(eid) in done_ids:
+            results.append({"email_id": eid, "status": "skipped"})
+        else:
+            results.append({"email_id": eid, "status": "processed"})
+            todo.append(email)
+
+    t_gen = time.perf_counter()
+    records, llm_calls, tier1_count = _process_emails(todo, prompts, mode, batch_size=max(1, batch_size))
+    gen_seconds = time.perf_counter() - t_gen
+
+    processed_repo.put_many((email["id"], record) for email, record in zip(todo, records))
+
+    elapsed = time.perf_counter() - t0
+    return {
+        "status": "ok",
+        "mode": mode,
+        "prompts_version": prompts.version,
+        "results": results,
+        "processed": len(todo),
+        "llm_calls": llm_calls,
+        "tier1_categorized": tier1_count,
+        "batch_size": batch_size,
+        "elapsed_seconds": round(elapsed, 4),
+        "generation_seconds": round(gen_seconds, 4),
+        "emails_per_second": round(len(todo) / elapsed, 2) if elapsed > 0 else None,
+    }
+
+@app.post("/process/sync")
+def process_sync(
+    batch_size: int = Body(8),
+    mode: str = Body(None),
+    dry_run: bool = Body(False)
+):
+    """
+    Incremental processing: only emails that are new, were edited since they
+    were processed, or were processed under an older template version.
+    Up-to-date records are left as they are. dry_run only reports the plan.
+    """
+    t0 = time.perf_counter()
+    mode = _process_mode(mode)
+    snapshot = inbox_service.snapshot()
+    prompts = prompt_service.current()
+    version = template_version(prompts, mode)
+    plan, fresh = plan_sync(snapshot.emails, snapshot.content_hashes(), processed_repo.versions(), version)
+
+    counts = {reason: 0 for reason in SYNC_REASONS}
+    for _, reason in plan:
+        counts[reason] += 1
+    result = {
+        "status": "ok",
+        "mode": mode,
+        "template_version": version,
+        "prompts_version": prompts.version,
+        "checked": len(snapshot.emails),
+        "up_to_date": fresh,
+        **counts,
+        "results": [{"email_id": e["id"], "reason": reason} for e, reason in plan],
+    }
+    if dry_run:
+        result["processed"] = 0
+        return result
+
+    todo = [e for e, _ in plan]
+    records, llm_calls, tier1_count = _process_emails(todo, prompts, mode, batch_size=max(1, batch_size))
+    processed_repo.put_many((email["id"], record) for email, record in zip(todo, records))
+
+    result.update({
+        "processed": len(todo),
+        "llm_calls": llm_calls,
+        "tier1_categorized": tier1_count,
+        "elapsed_seconds": round(time.perf_counter() - t0, 4),
+    })
+    return result
+
+@app.post("/process/{email_id}")
+def process_email(email_id: int, mode: str = None):
+    mode = _process_mode(mode)
+    email = inbox_service.get(email_id)
+    if not email:
+        raise HTTPException(status_code=404, detail="Email not found")
+
+    prompts = prompt_service.current()
+    [record], _, _ = _process_emails([email], prompts, mode)
+    processed_repo.put(email_id, record)
+
+    return {"status": "processed", "email_id": email_id, "prompts_version": prompts.version}
+
+def processed_category(record) -> str:
+    """
+    Category label from a processed record's raw category_output, or None.
+    """
+    out = record.get("category_output") if isinstance(record, dict) else None
+    try:
+        parsed = json.loads(out)
+    except Exception:
+        return None
+    return parsed.get("category") if isinstance(parsed, dict) else None
 
 @app.get("/processed")
-def get_processed():
-    return load_json(PROCESSED_PATH) or {}
+def get_processed(
+    request: Request,
+    cursor: str = None,
+    limit: int = None,
+    fields: str = None,
+    category: str = None,
+    sender: str = None,
+    since: str = None,
+    until: str = None
+):
+    """
+    {email_id: record} for every processed email by default. Same pagination,
+    projection and ETag options as /inbox; filters apply to the source email
+    (sender, timestamp range) and to the parsed category.
+    """
+    items = []
+    for email_id, record in processed_repo.all().items():
+        email = record.get("email") or {}
+        if sender and (email.get("sender") or "").lower() != sender.lower():
+            continue
+        if not in_range(email.get("timestamp"), since, until):
+            continue
+        if category and (processed_category(record) or "").lower() != category.lower():
+            continue
+        items.append((email_id, record))
+    items.sort(key=lambda kv: sort_key(kv[0]))
+    return _listing(request, items, lambda kv: kv[0], cursor, limit, fields, pairs=True)
+
+@app.get("/processed/{email_id}")
+def get_processed_item(request: Request, email_id: str, fields: str = None):
+    """
+    One email's processed record, so clients need not fetch the whole map.
+    """
+    record = processed_repo.get(email_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="No processed output for this email")
+    return json_response(request, dumps(project(record, parse_fields(fields))))
+
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
+@app.get("/models")
+def get_models():
+    return dict(
+        registry.stats(),
+        prefix_cache=prefix_cache.stats(),
+        constrained=decode_stats.stats(),
+        vector_index=vector_index.stats(),
+        search_index=search_index.stats(),
+    )
+
+@app.get("/classifier/stats")
+def get_classifier_stats():
+    return category_router.stats()
+
+@app.post("/classifier/train")
+def train_classifier():
+    n = category_router.train_from_processed(processed_repo.all())
+    return {"status": "trained", "examples": n}
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return response_cache.stats()
+
+@app.delete("/cache")
+def clear_cache():
+    response_cache.clear()
+    return {"status": "cleared"}
+
+
+# ---- Semantic search and threads ----
+def _indexed_snapshot():
+    """
+    Current inbox snapshot with the vector index brought up to date
+    (a no-op unless the inbox changed since the last call).
+    """
+    snapshot = inbox_service.snapshot()
+    vector_index.sync(snapshot.emails, snapshot.content_hashes(), signature=snapshot.signature)
+    return snapshot
+
+def related_emails(email, k: int):
+    """
+    Up to k emails to give the model as context: the rest of the email's
+    thread (most recent first), then the semantically closest others.
+    """
+    if k <= 0:
+        return []
+    snapshot = _indexed_snapshot()
+    thread = [e for e in snapshot.threads().get(thread_key(email), []) if e.get("id") != email.get("id")]
+    related = thread[::-1][:k]
+    if len(related) < k and semantic_enabled():
+        seen = [e.get("id") for e in related]
+        for eid, _ in vector_index.similar(email, k - len(related), exclude=seen):
+            if eid in snapshot.by_id:
+                related.append(snapshot.by_id[eid])
+    return related
+
+def _text_snapshot():
+    """
+    Current inbox snapshot with the full-text index brought up to date:
+    new or edited emails, then emails processed since the last call.
+    """
+    snapshot = inbox_service.snapshot()
+    search_index.sync_emails(snapshot.emails, snapshot.content_hashes(), processed_repo.get_many, signature=snapshot.signature)
+    search_index.sync_processed(snapshot.by_id.get)
+    return snapshot
+
+def _text_search(q: str, k: int, kind: str, sender: str, category: str, since: str, until: str):
+    if not text_search_enabled():
+        raise HTTPException(status_code=503, detail="Text search is disabled (TEXT_SEARCH=0 or numpy missing)")
+    if kind is not None and kind not in ("email", "draft"):
+        raise HTTPException(status_code=400, detail="kind must be 'email' or 'draft'")
+    snapshot = _text_snapshot()
+    t0 = time.perf_counter()
+    hits = search_index.search(q, max(1, min(k, 100)), kind=kind, sender=sender, category=category, since=since, until=until)
+    elapsed = time.perf_counter() - t0
+    email_ids = [json.loads(key[len("email:"):]) for key, _ in hits if key.startswith("email:")]
+    records = processed_repo.get_many(email_ids)
+    results = []
+    for key, score in hits:
+        if key.startswith("email:"):
+            eid = json.loads(key[len("email:"):])
+            email = snapshot.by_id.get(eid)
+            if email is None:
+                continue
+            results.append({
+                "kind": "email",
+                "email_id": eid,
+                "score": score,
+                "sender": email.get("sender"),
+                "subject": email.get("subject"),
+                "timestamp": email.get("timestamp"),
+                "category": processed_fields(records.get(str(eid)))[0] or None,
+                "snippet": snippet(email.get("body"), q),
+            })
+        else:
+            draft = drafts_repo.get(key[len("draft:"):])
+            if draft is None:
+                continue
+            results.append({
+                "kind": "draft",
+                "draft_id": draft.get("id"),
+                "score": score,
+                "subject": draft.get("subject"),
+                "timestamp": draft.get("updated_at"),
+                "source_email_id": draft.get("source_email_id"),
+                "snippet": snippet(draft.get("body"), q),
+            })
+    return {"query": q, "mode": "text", "results": results, "elapsed_ms": round(elapsed * 1000, 3)}
+
+@app.get("/search")
+def search(
+    q: str,
+    k: int = 10,
+    mode: str = "semantic",
+    kind: str = None,
+    sender: str = None,
+    category: str = None,
+    since: str = None,
+    until: str = None
+):
+    """
+    mode=semantic (default): inbox emails closest in meaning to q (cosine
+    over email embeddings), with the thread each belongs to.
+    mode=text: emails and drafts ranked by BM25 over subject, body, sender
+    and processed category/tasks; kind, sender, category and since/until
+    narrow the results, and "word*" matches a prefix.
+    """
+    if mode == "text":
+        return _text_search(q, k, kind, sender, category, since, until)
+    if mode != "semantic":
+        raise HTTPException(status_code=400, detail="mode must be 'text' or 'semantic'")
+    if not semantic_enabled():
+        raise HTTPException(status_code=503, detail="Semantic search is disabled (SEMANTIC_INDEX=0 or numpy missing)")
+    snapshot = _indexed_snapshot()
+    t0 = time.perf_counter()
+    hits = vector_index.search(q, max(1, min(k, 100)))
+    elapsed = time.perf_counter() - t0
+    threads = snapshot.threads()
+    results = []
+    for eid, score in hits:
+        email = snapshot.by_id.get(eid)
+        if email is None:
+            continue
+        key = thread_key(email)
+        results.append({
+            "email_id": eid,
+            "score": score,
+            "sender": email.get("sender"),
+            "subject": email.get("subject"),
+            "timestamp": email.get("timestamp"),
+            "thread": key,
+            "thread_size": len(threads.get(key, ())),
+        })
+    return {"query": q, "mode": "semantic", "results": results, "elapsed_ms": round(elapsed * 1000, 3)}
+
+# ---- Prompt Brain ----
+@app.get("/prompts")
+def get_prompts(request: Request):
+    """
+    The current templates (name -> text). The version they were saved under
+    is in the X-Prompts-Version header; the ETag follows it.
+    """
+    prompts = prompt_service.current()
+    response = json_response(request, dumps(prompts.templates), f'"prompts-{prompts.version}"')
+    response.headers["X-Prompts-Version"] = str(prompts.version)
+    return response
+
+@app.post("/prompts")
+def save_prompts(payload: dict = Body(...)):
+    """
+    Update some or all templates; names left out keep their text. Saving a
+    change bumps the version and swaps the new templates in for every request.
+    """
+    before = prompt_service.current()
+    try:
+        prompts = prompt_service.save(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    changed = sorted(k for k in prompts if before.get(k) != prompts[k])
+    return {"status": "ok", "version": prompts.version, "changed": changed}
+
+@app.get("/prompts/version")
+def get_prompts_version():
+    return prompt_service.stats()
+
+AGENT_PROMPT_KEYS = {
+    "categorization": "categorization_prompt",
+    "action": "action_prompt",
+    "auto_reply": "auto_reply_prompt",
+    "reply": "auto_reply_prompt",
+    "triage": "triage_prompt",
+}
+
+def _agent_request(email_id: int, prompt_type: str):
+    email = inbox_service.get(email_id)
+    if not email:
+        raise HTTPException(status_code=404, detail="Email not found")
+
+    prompts = prompt_service.current()
+
+    key = AGENT_PROMPT_KEYS.get(prompt_type)
+    if not key:
+        raise HTTPException(status_code=400, detail="Unknown prompt_type")
+
+    return email, prompts.get(key), key
+
+def _parse_output(out: str):
+    with stage("parse"):
+        try:
+            return json.loads(out)
+        except Exception:
+            return None
 
 @app.post("/agent/query")
 def agent_query_endpoint(
@@ -75,33 +707,58 @@ def agent_query_endpoint(
     prompt_type: str = Body(...),
     user_instruction: str = Body(None)
 ):
-    inbox = load_json(INBOX_PATH) or []
-    email = next((e for e in inbox if e.get("id") == email_id), None)
-    if not email:
-        raise HTTPException(status_code=404, detail="Email not found")
+    email, template, key = _agent_request(email_id, prompt_type)
+    prompt, context = agent_prompt(email, template, user_instruction, related_emails(email, related_context_k()), template=key)
+    out = call_llm(prompt, template=key, reference=reference_date(email.get("timestamp")))
+    return {"raw": out, "parsed": _parse_output(out), "context": context}
 
-    prompts = load_json(PROMPT_PATH) or {}
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    key_map = {
-        "categorization": "categorization_prompt",
-        "action": "action_prompt",
-        "auto_reply": "auto_reply_prompt",
-        "reply": "auto_reply_prompt",
-    }
+class _GenerationStream(StreamingResponse):
+    """
+    Streams a sync generator and, however the response ends (done, or the
+    client went away mid-stream), sets `stop` and closes the generator, so
+    local generation stops at its next token and the model is released.
+    Starlette only stops iterating on a disconnect; it does not close it.
+    """
 
-    key = key_map.get(prompt_type)
-    if not key:
-        raise HTTPException(status_code=400, detail="Unknown prompt_type")
+    def __init__(self, content, stop: threading.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self._content = content
+        self._stop = stop
 
-    template = prompts.get(key)
-    out = llm_agent_query(email, template, user_instruction)
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._stop.set()
+            await run_in_threadpool(self._content.close)
 
-    try:
-        parsed = json.loads(out)
-    except:
-        parsed = None
+@app.post("/agent/query/stream")
+def agent_query_stream_endpoint(
+    email_id: int = Body(...),
+    prompt_type: str = Body(...),
+    user_instruction: str = Body(None)
+):
+    """
+    Server-Sent Events variant of /agent/query: "token" events carry text as it
+    is generated, then one "done" event carries {"raw", "parsed", "context"}.
+    If the client goes away, generation stops and the model is released.
+    """
+    email, template, key = _agent_request(email_id, prompt_type)
+    prompt, context = agent_prompt(email, template, user_instruction, related_emails(email, related_context_k()), template=key)
+    stop = threading.Event()
 
-    return {"raw": out, "parsed": parsed}
+    def events():
+        pieces = []
+        for piece in stream_llm(prompt, template=key, reference=reference_date(email.get("timestamp")), stop=stop):
+            pieces.append(piece)
+            yield _sse("token", {"text": piece})
+        out = "".join(pieces)
+        yield _sse("done", {"raw": out, "parsed": _parse_output(out), "context": context})
+
+    return _GenerationStream(events(), stop, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # Create a new draft
 @app.post("/drafts")
@@ -116,7 +773,6 @@ def create_draft(payload: dict = Body(...)):
       "metadata": { ... }          # optional
     }
     """
-    drafts = load_json(DRAFTS_PATH) or []
     # create id
     new_id = str(uuid.uuid4())
     now = _now_iso()
@@ -130,21 +786,41 @@ def create_draft(payload: dict = Body(...)):
         "type": payload.get("type", "custom"),
         "metadata": payload.get("metadata", {})
     }
-    drafts.append(draft)
-    write_json_file(DRAFTS_PATH, drafts)
+    drafts_repo.create(draft)
+    search_index.put_draft(draft)
     return {"status": "ok", "draft": draft}
 
 # List drafts
 @app.get("/drafts")
-def list_drafts():
-    drafts = load_json(DRAFTS_PATH) or []
-    return drafts
+def list_drafts(
+    request: Request,
+    cursor: str = None,
+    limit: int = None,
+    fields: str = None,
+    type: str = None,
+    source_email_id: int = None,
+    since: str = None,
+    until: str = None
+):
+    """
+    All drafts (oldest first) by default; since/until filter on updated_at.
+    Same pagination, projection and ETag options as /inbox.
+    """
+    drafts = [
+        d for d in drafts_repo.list()
+        if (type is None or d.get("type") == type)
+        and (source_email_id is None or d.get("source_email_id") == source_email_id)
+        and in_range(d.get("updated_at"), since, until)
+    ]
+    key = lambda d: [d.get("created_at") or "", d.get("id")]
+    # the store returns insertion order, which imported drafts need not follow
+    drafts.sort(key=lambda d: sort_key(key(d)))
+    return _listing(request, drafts, key, cursor, limit, fields)
 
 # Get a single draft by id
 @app.get("/drafts/{draft_id}")
 def get_draft(draft_id: str):
-    drafts = load_json(DRAFTS_PATH) or []
-    draft = next((d for d in drafts if d.get("id") == draft_id), None)
+    draft = drafts_repo.get(draft_id)
     if not draft:
         raise HTTPException(status_code=404, detail="Draft not found")
     return draft
@@ -152,33 +828,17 @@ def get_draft(draft_id: str):
 # Update a draft (partial updates supported)
 @app.put("/drafts/{draft_id}")
 def update_draft(draft_id: str, payload: dict = Body(...)):
-    drafts = load_json(DRAFTS_PATH) or []
-    idx = next((i for i,d in enumerate(drafts) if d.get("id") == draft_id), None)
-    if idx is None:
+    # read-modify-write happens inside one store transaction
+    draft = drafts_repo.update(draft_id, payload, _now_iso())
+    if draft is None:
         raise HTTPException(status_code=404, detail="Draft not found")
-    draft = drafts[idx]
-    # update fields if provided
-    if "subject" in payload:
-        draft["subject"] = payload["subject"]
-    if "body" in payload:
-        draft["body"] = payload["body"]
-    if "source_email_id" in payload:
-        draft["source_email_id"] = payload.get("source_email_id")
-    if "type" in payload:
-        draft["type"] = payload.get("type")
-    if "metadata" in payload:
-        draft["metadata"] = payload.get("metadata")
-    draft["updated_at"] = _now_iso()
-    drafts[idx] = draft
-    write_json_file(DRAFTS_PATH, drafts)
+    search_index.put_draft(draft)
     return {"status": "ok", "draft": draft}
 
 # (Optional) Delete a draft
 @app.delete("/drafts/{draft_id}")
 def delete_draft(draft_id: str):
-    drafts = load_json(DRAFTS_PATH) or []
-    new_list = [d for d in drafts if d.get("id") != draft_id]
-    if len(new_list) == len(drafts):
+    if not drafts_repo.delete(draft_id):
         raise HTTPException(status_code=404, detail="Draft not found")
-    write_json_file(DRAFTS_PATH, new_list)
+    search_index.remove_draft(draft_id)
     return {"status": "deleted", "id": draft_id}
@@ -0,0 +1,272 @@
+# backend/classifier.py
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:  # numpy is optional; without it every email goes to the LLM
+    np = None
+
+CATEGORIES = ["Important", "Newsletter", "Spam", "To-Do", "Meeting", "Personal"]
+
+# seed lexicon, the same cues the mock categorizer looks for
+SEED_KEYWORDS = {
+    "Important": ["invoice", "payment", "due", "bill", "urgent", "deadline", "overdue"],
+    "Spam": ["prize", "winner", "click here", "claim", "free", "won", "lottery"],
+    "Newsletter": ["newsletter", "digest", "weekly", "unsubscribe", "highlights", "articles"],
+    "Meeting": ["meet", "meeting", "schedule", "agenda", "availability", "sync", "call"],
+    "To-Do": ["please", "can you", "could you", "action", "required", "submit", "review"],
+    "Personal": ["dinner", "lunch", "weekend", "birthday", "hey", "family"],
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+N_FEATURES = 1 << 16
+SEED_WEIGHT = 3.0
+# a class is learned from history only once it has this many examples
+MIN_EXAMPLES_PER_CLASS = 5
+# every HOLDOUT_EVERY-th example is held out to calibrate the threshold,
+# which needs at least MIN_HOLDOUT of them
+HOLDOUT_EVERY = 5
+MIN_HOLDOUT = 20
+# the calibrated threshold is the lowest one whose held-out precision reaches this
+TARGET_PRECISION = 0.95
+
+
+def tier1_enabled() -> bool:
+    """
+    The tier-1 classifier is on unless TIER1_CLASSIFIER=0 (and needs numpy).
+    """
+    return np is not None and os.environ.get("TIER1_CLASSIFIER", "1") != "0"
+
+
+def tier1_threshold() -> float:
+    """
+    Lowest confidence tier 1 may answer with (TIER1_THRESHOLD, default 0.9).
+    With only the seed lexicon, a single keyword cue scores 0.80 and two
+    cues of the same category 0.99, so one word alone never passes.
+    """
+    try:
+        return float(os.environ.get("TIER1_THRESHOLD", "0.9"))
+    except ValueError:
+        return 0.9
+
+
+def email_text(email: Dict[str, Any]) -> str:
+    return (email.get("subject") or "") + "\n" + (email.get("body") or "")
+
+
+def features(text: str) -> List[int]:
+    """
+    Hashed unigram + bigram feature ids (crc32, stable across processes).
+    """
+    toks = _TOKEN_RE.findall(text.lower())
+    grams = toks + [a + " " + b for a, b in zip(toks, toks[1:])]
+    return [zlib.crc32(g.encode("utf-8")) & (N_FEATURES - 1) for g in grams]
+
+
+class HashedLinearClassifier:
+    """
+    Multinomial logistic regression over hashed bag-of-words features.
+
+    Weights start from the seed lexicon, so the model is usable with no
+    history; fit() then learns from labelled examples with an L2 pull back
+    towards the seed weights. There is no bias term: a skewed history would
+    otherwise push every email towards its most common label.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("numpy not installed")
+        self.prior = np.zeros((N_FEATURES, len(CATEGORIES)), dtype=np.float32)
+        for ci, cat in enumerate(CATEGORIES):
+            for kw in SEED_KEYWORDS[cat]:
+                for f in set(features(kw)[-1:]):  # the full phrase: last gram
+                    self.prior[f, ci] += SEED_WEIGHT
+        self.W = self.prior.copy()
+        self.trained_on = 0
+
+    def _batch(self, texts: List[str]):
+        doc_ids, feat_ids = [], []
+        for i, t in enumerate(texts):
+            f = features(t)
+            doc_ids.extend([i] * len(f))
+            feat_ids.extend(f)
+        return np.asarray(doc_ids, dtype=np.int64), np.asarray(feat_ids, dtype=np.int64)
+
+    def _scores(self, W, n: int, doc_ids, feat_ids):
+        scores = np.zeros((n, len(CATEGORIES)), dtype=np.float32)
+        if len(feat_ids):
+            np.add.at(scores, doc_ids, W[feat_ids])
+        return scores
+
+    @staticmethod
+    def _softmax(scores):
+        scores = scores - scores.max(axis=1, keepdims=True)
+        e = np.exp(scores)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict_proba(self, texts: List[str]):
+        doc_ids, feat_ids = self._batch(texts)
+        return self._softmax(self._scores(self.W, len(texts), doc_ids, feat_ids))
+
+    def predict(self, texts: List[str]) -> Tuple[List[str], List[float]]:
+        if not texts:
+            return [], []
+        probs = self.predict_proba(texts)
+        best = probs.argmax(axis=1)
+        return [CATEGORIES[i] for i in best], [float(p) for p in probs[np.arange(len(texts)), best]]
+
+    def fit(self, texts: List[str], labels: List[str], epochs: int = 30, lr: float = 0.5, l2: float = 0.01):
+        """
+        Learn from (text, label) pairs. Classes with fewer than
+        MIN_EXAMPLES_PER_CLASS examples are left out, and nothing is learned
+        unless at least two classes remain; the seed weights stay as they are.
+        """
+        counts = Counter(l for l in labels if l in CATEGORIES)
+        rows = [(t, CATEGORIES.index(l)) for t, l in zip(texts, labels) if counts.get(l, 0) >= MIN_EXAMPLES_PER_CLASS]
+        if len({c for _, c in rows}) < 2:
+            return
+        texts = [t for t, _ in rows]
+        y = np.asarray([c for _, c in rows], dtype=np.int64)
+        n = len(texts)
+        doc_ids, feat_ids = self._batch(texts)
+        onehot = np.zeros((n, len(CATEGORIES)), dtype=np.float32)
+        onehot[np.arange(n), y] = 1.0
+        W = self.prior.copy()
+        for _ in range(epochs):
+            grad_scores = (self._softmax(self._scores(W, n, doc_ids, feat_ids)) - onehot) / n
+            grad = np.zeros_like(W)
+            np.add.at(grad, feat_ids, grad_scores[doc_ids])
+            W -= lr * (grad + l2 * (W - self.prior))
+        self.W = W
+        self.trained_on = n
+
+
+def label_from_output(output: Optional[str]) -> Optional[str]:
+    try:
+        parsed = json.loads(output)
+    except Exception:
+        return None
+    cat = parsed.get("category") if isinstance(parsed, dict) else None
+    return cat if cat in CATEGORIES else None
+
+
+def calibrate(texts: List[str], labels: List[str]) -> Tuple[Optional[float], bool]:
+    """
+    (threshold, abstain) from held-out history: a model fit on the rest
+    scores every HOLDOUT_EVERY-th example, and the threshold is the lowest
+    confidence at which the answers above it reach TARGET_PRECISION.
+    (None, False) when there are fewer than MIN_HOLDOUT held-out examples;
+    abstain is True when no threshold reaches the target.
+    """
+    held = [i for i in range(len(texts)) if i % HOLDOUT_EVERY == 0]
+    if len(held) < MIN_HOLDOUT:
+        return None, False
+    held_set = set(held)
+    model = HashedLinearClassifier()
+    model.fit([t for i, t in enumerate(texts) if i not in held_set], [l for i, l in enumerate(labels) if i not in held_set])
+    predicted, confs = model.predict([texts[i] for i in held])
+    ranked = sorted(zip(confs, (p == labels[i] for p, i in zip(predicted, held))), key=lambda x: -x[0])
+    threshold, correct = None, 0
+    for n, (conf, ok) in enumerate(ranked, 1):
+        correct += ok
+        # ties share a threshold, so only judge after the last of them
+        if n < len(ranked) and ranked[n][0] == conf:
+            continue
+        if correct / n >= TARGET_PRECISION:
+            threshold = conf
+    return (threshold, False) if threshold is not None else (None, True)
+
+
+class CategoryRouter:
+    """
+    Two-tier categorization: the hashed linear classifier answers when its
+    top probability clears the threshold, everything else goes to the LLM.
+    Training calibrates the threshold on held-out history; when no threshold
+    reaches TARGET_PRECISION there, tier 1 abstains until the next training.
+    """
+
+    def __init__(self, threshold: float = None):
+        self._threshold = threshold
+        self._model: Optional[HashedLinearClassifier] = None
+        self._lock = threading.Lock()
+        self.calibrated: Optional[float] = None
+        self.abstaining = False
+        self.tier1 = 0
+        self.llm = 0
+
+    @property
+    def threshold(self) -> float:
+        floor = tier1_threshold() if self._threshold is None else self._threshold
+        return max(floor, self.calibrated or 0.0)
+
+    def model(self) -> Optional[HashedLinearClassifier]:
+        if not tier1_enabled():
+            return None
+        with self._lock:
+            if self._model is None:
+                self._model = HashedLinearClassifier()
+            return self._model
+
+    def train_from_processed(self, processed: Dict[str, Any]) -> int:
+        """
+        Fit on LLM-labelled processed records (tier-1 answers are skipped so
+        the model does not learn from itself). Returns the number of examples.
+        """
+        if not tier1_enabled():
+            return 0
+        texts, labels = [], []
+        for record in processed.values():
+            if not isinstance(record, dict) or record.get("category_source") == "tier1":
+                continue
+            label = label_from_output(record.get("category_output"))
+            if label and record.get("email"):
+                texts.append(email_text(record["email"]))
+                labels.append(label)
+        calibrated, abstaining = calibrate(texts, labels)
+        model = HashedLinearClassifier()
+        model.fit(texts, labels)
+        with self._lock:
+            self._model = model
+            self.calibrated, self.abstaining = calibrated, abstaining
+        return len(texts)
+
+    def classify(self, emails: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """
+        Route a batch: tier-1 category_output JSON where confident, None where
+        the email has to go to the LLM. Counts towards the tier shares.
+        """
+        model = self.model()
+        if model is None or self.abstaining or not emails:
+            answers = [None] * len(emails)
+        else:
+            labels, confs = model.predict([email_text(e) for e in emails])
+            threshold = self.threshold
+            answers = [
+                json.dumps({"category": label, "reason": f"Tier-1 classifier (confidence {conf:.2f})."}) if conf >= threshold else None
+                for label, conf in zip(labels, confs)
+            ]
+        passed = sum(1 for a in answers if a is None)
+        with self._lock:
+            self.tier1 += len(answers) - passed
+            self.llm += passed
+        return answers
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.tier1 + self.llm
+        return {
+            "enabled": tier1_enabled(),
+            "threshold": self.threshold,
+            "calibrated_threshold": self.calibrated,
+            "abstaining": self.abstaining,
+            "trained_on": self._model.trained_on if self._model is not None else 0,
+            "tier1": self.tier1,
+            "llm": self.llm,
+            "tier1_share": round(self.tier1 / total, 4) if total else None,
+            "llm_share": round(self.llm / total, 4) if total else None,
+        }
@@ -0,0 +1,18 @@
+# backend/config.py
+"""
+File locations shared by the app and the command-line tools
+(python -m backend.ingest, python -m backend.store), so the tools do not
+have to import the app to find them.
+"""
+import os
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent.parent
+
+INBOX_PATH = Path(os.environ.get("INBOX_PATH", BASE / "data" / "mock_inbox.json"))
+PROMPT_PATH = BASE / "prompts" / "default_p.json"
+PROCESSED_PATH = BASE / "data" / "processed.json"
+DRAFTS_PATH = BASE / "data" / "drafts.json"
+STORE_PATH = Path(os.environ.get("STORE_PATH", BASE / "data" / "agent.sqlite3"))
+# LLM response cache, next to the store
+LLM_CACHE_PATH = Path(os.environ.get("LLM_CACHE_PATH", STORE_PATH.with_name(STORE_PATH.stem + ".llm_cache.sqlite3")))
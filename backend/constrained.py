@@ -0,0 +1,279 @@
+# backend/constrained.py
+import json
+import os
+import threading
+import weakref
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend.classifier import CATEGORIES
+
+# Output shape each Prompt Brain template asks for. A small JSON-schema subset:
+# object (ordered properties), array of objects, string, ["string", "null"]
+# and enum. maxTokens caps a free string so a rambling model still closes it.
+_CATEGORY = {
+    "type": "object",
+    "properties": {
+        "category": {"enum": CATEGORIES},
+        "reason": {"type": "string", "maxTokens": 48},
+    },
+}
+_ACTIONS = {
+    "type": "array",
+    "maxItems": 5,
+    "items": {
+        "type": "object",
+        "properties": {
+            "task": {"type": "string", "maxTokens": 32},
+            "deadline": {"type": ["string", "null"], "maxTokens": 8},
+            "assignee": {"type": ["string", "null"], "maxTokens": 12},
+            "context": {"type": "string", "maxTokens": 64},
+        },
+    },
+}
+_REPLY = {
+    "type": "object",
+    "properties": {
+        "subject": {"type": "string", "maxTokens": 24},
+        "body": {"type": "string", "maxTokens": 160},
+    },
+}
+SCHEMAS = {
+    "categorization_prompt": _CATEGORY,
+    "action_prompt": _ACTIONS,
+    "auto_reply_prompt": _REPLY,
+    "triage_prompt": {
+        "type": "object",
+        "properties": {"category": _CATEGORY, "actions": _ACTIONS, "reply": _REPLY},
+    },
+}
+
+
+def constrained_enabled() -> bool:
+    """
+    Schema-guided decoding for templates with a known output shape,
+    on unless CONSTRAINED_DECODING=0.
+    """
+    return os.environ.get("CONSTRAINED_DECODING", "1") != "0"
+
+
+def schema_for(template: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not template or not constrained_enabled():
+        return None
+    return SCHEMAS.get(template)
+
+
+def _string_safe(text: str) -> bool:
+    # may appear inside a JSON string literal as-is
+    return bool(text) and all(c >= " " and c not in '"\\' for c in text) and "�" not in text
+
+
+class _Vocab:
+    """
+    Per-tokenizer token tables: which tokens can continue a JSON string and
+    which close one (safe text followed by a single final quote).
+    """
+
+    def __init__(self, tok):
+        import torch
+
+        size = len(tok)
+        self.text = tok.batch_decode([[i] for i in range(size)])
+        special = set(tok.all_special_ids)
+        inner, closing = [], []
+        for i, t in enumerate(self.text):
+            if i in special:
+                continue
+            if _string_safe(t):
+                inner.append(i)
+            elif t.endswith('"') and (len(t) == 1 or _string_safe(t[:-1])):
+                closing.append(i)
+        self.inner = torch.tensor(inner, dtype=torch.long)
+        self.with_closing = torch.tensor(inner + closing, dtype=torch.long)
+        self.closing = set(closing)
+        self._encoded: Dict[str, List[int]] = {}
+        self._tok = tok
+
+    def encode(self, text: str) -> List[int]:
+        ids = self._encoded.get(text)
+        if ids is None:
+            ids = self._encoded[text] = self._tok(text, add_special_tokens=False).input_ids
+        return ids
+
+
+_vocabs: "weakref.WeakKeyDictionary[Any, _Vocab]" = weakref.WeakKeyDictionary()
+_vocabs_lock = threading.Lock()
+
+
+def _vocab(tok) -> _Vocab:
+    with _vocabs_lock:
+        v = _vocabs.get(tok)
+        if v is None:
+            v = _vocabs[tok] = _Vocab(tok)
+        return v
+
+
+class DecodeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.new_tokens = 0
+        self.sampled_tokens = 0
+
+    def add(self, new_tokens: int, sampled_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.new_tokens += new_tokens
+            self.sampled_tokens += sampled_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": constrained_enabled(),
+            "calls": self.calls,
+            "new_tokens": self.new_tokens,
+            "sampled_tokens": self.sampled_tokens,
+            "avg_new_tokens": round(self.new_tokens / self.calls, 1) if self.calls else None,
+        }
+
+
+decode_stats = DecodeStats()
+
+
+class JsonDecoder:
+    """
+    Token-by-token decoding that can only produce JSON of a given schema.
+
+    Structure (braces, keys, separators) is forced, enums and null-or-string
+    are restricted to their allowed token sequences, and free strings sample
+    only tokens that keep the literal valid. Decoding stops as soon as the
+    top-level value is closed; only the new text is produced. Once
+    `max_tokens` new tokens are spent, open strings and arrays are closed and
+    optional values become null, so the result stays valid.
+    Caller holds the model's generation lock.
+    """
+
+    def __init__(self, gen, enc: Dict[str, Any], max_tokens: int = 256, temperature: float = 0.7, do_sample: bool = True):
+        self.model = gen.model
+        self.vocab = _vocab(gen.tokenizer)
+        self.budget = max_tokens
+        self.temperature = temperature
+        self.do_sample = do_sample
+        self.new_tokens = 0
+        self.sampled = 0
+        self.past = enc.get("past_key_values")
+        ids = enc["input_ids"][0]
+        if self.past is not None:
+            ids = ids[self.past.get_seq_length():]
+        self._forward(ids.tolist())
+
+    def _forward(self, ids: List[int]):
+        import torch
+
+        with torch.no_grad():
+            out = self.model(
+                input_ids=torch.tensor([ids], device=self.model.device),
+                past_key_values=self.past,
+                use_cache=True,
+            )
+        self.past = out.past_key_values
+        self.logits = out.logits[0, -1]
+
+    def _pick(self, allowed) -> int:
+        import torch
+
+        allowed = torch.as_tensor(allowed, dtype=torch.long, device=self.logits.device)
+        scores = self.logits[allowed].float()
+        if self.do_sample:
+            probs = torch.softmax(scores / max(self.temperature, 1e-5), dim=-1)
+            i = int(torch.multinomial(probs, 1))
+        else:
+            i = int(scores.argmax())
+        return int(allowed[i])
+
+    def _emit(self, ids: List[int]) -> str:
+        self._forward(ids)
+        self.new_tokens += len(ids)
+        self.budget -= len(ids)
+        return "".join(self.vocab.text[i] for i in ids)
+
+    def literal(self, text: str) -> Iterator[str]:
+        yield self._emit(self.vocab.encode(text))
+
+    def choice(self, options: List[str]) -> Iterator[str]:
+        """
+        One of `options`, chosen by the model token by token. Returns it.
+        """
+        seqs = {o: self.vocab.encode(o) for o in options}
+        picked: List[int] = []
+        while True:
+            live = {o: s for o, s in seqs.items() if s[:len(picked)] == picked}
+            done = [o for o, s in live.items() if len(s) == len(picked)]
+            if done:
+                return done[0]
+            if len(live) == 1:
+                # no decision left: force the rest
+                (o, s), = live.items()
+                yield self._emit(s[len(picked):])
+                return o
+            t = self._pick(sorted({s[len(picked)] for s in live.values()}))
+            picked.append(t)
+            yield self._emit([t])
+
+    def string(self, max_tokens: int, opened: bool = False) -> Iterator[str]:
+        if not opened:
+            yield from self.literal('"')
+        n = 0
+        while n < max_tokens and self.budget > 0:
+            t = self._pick(self.vocab.with_closing if n else self.vocab.inner)
+            n += 1
+            self.sampled += 1
+            yield self._emit([t])
+            if t in self.vocab.closing:
+                return
+        yield from self.literal('"')
+
+    def value(self, schema: Dict[str, Any], opened: bool = False) -> Iterator[str]:
+        if "enum" in schema:
+            yield from self.choice([json.dumps(v) for v in schema["enum"]])
+            return
+        kind = schema.get("type")
+        if isinstance(kind, list):  # ["string", "null"]
+            if self.budget <= 0:
+                yield from self.literal("null")
+            elif (yield from self.choice(['"', "null"])) == '"':
+                yield from self.string(schema.get("maxTokens", 32), opened=True)
+        elif kind == "string":
+            yield from self.string(schema.get("maxTokens", 32), opened=opened)
+        elif kind == "object":
+            if not opened:
+                yield from self.literal("{")
+            for i, (key, sub) in enumerate(schema["properties"].items()):
+                yield from self.literal((", " if i else "") + json.dumps(key) + ": ")
+                yield from self.value(sub)
+            yield from self.literal("}")
+        elif kind == "array":
+            opener = "{" if schema["items"].get("type") == "object" else '"'
+            if self.budget <= 0 or (yield from self.choice(["[]", "[" + opener])) == "[]":
+                if self.budget <= 0:
+                    yield from self.literal("[]")
+                return
+            for i in range(schema.get("maxItems", 5)):
+                if i and (self.budget <= 0 or (yield from self.choice(["]", ", " + opener])) == "]"):
+                    if self.budget <= 0:
+                        yield from self.literal("]")
+                    return
+                yield from self.value(schema["items"], opened=True)
+            yield from self.literal("]")
+        else:
+            raise ValueError(f"unsupported schema: {schema!r}")
+
+
+def decode_json(gen, enc: Dict[str, Any], schema: Dict[str, Any], max_tokens: int = 256, temperature: float = 0.7) -> Iterator[str]:
+    """
+    Yield the pieces of one schema-conforming JSON value generated for the
+    encoded prompt `enc` (as built by PrefixCache.encode, batch of one).
+    """
+    dec = JsonDecoder(gen, enc, max_tokens=max_tokens, temperature=temperature)
+    try:
+        yield from dec.value(schema)
+    finally:
+        decode_stats.add(dec.new_tokens, dec.sampled)
@@ -0,0 +1,272 @@
+# backend/context.py
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# tokens of email context ({email_text}) each Prompt Brain template gets
+TEMPLATE_BUDGETS = {
+    "categorization_prompt": 256,
+    "action_prompt": 512,
+    "auto_reply_prompt": 512,
+    "triage_prompt": 512,
+}
+DEFAULT_BUDGET = 512
+# share of the budget held back for related emails when there are any
+RELATED_SHARE = 0.25
+# most of the budget the metadata line may take; longer fields are cut
+META_SHARE = 0.25
+_META_HEADER = "\n\nFull email metadata:\n"
+
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|$)", re.M)
+_QUOTE_HEADER_RE = re.compile(
+    r"^(on\b.{0,200}\bwrote:|-{2,}\s*original message\s*-{2,}|-{2,}\s*forwarded message\s*-{2,}|_{8,})$",
+    re.I,
+)
+_SIGNATURE_RE = re.compile(r"^(--\s*|sent from my \w+.*|get outlook for \w+.*)$", re.I)
+_SIGN_OFF_RE = re.compile(r"^(best|kind|warm)?\s*(regards|thanks|thank you|cheers|sincerely|best)[\s,!.]*$", re.I)
+_ACTION_RE = re.compile(r"\b(please|can you|could you|need|required|deadline|due|by|asap|review|submit|confirm|schedule)\b", re.I)
+_DATE_RE = re.compile(
+    r"\b(\d{1,2}[:/.-]\d{1,2}|\d{4}-\d{2}-\d{2}|mon|tue|wed|thu|fri|sat|sun|today|tomorrow|next week|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\b",
+    re.I,
+)
+
+
+def context_budget(template: Optional[str]) -> int:
+    """
+    Token budget for a template's email context. AGENT_CONTEXT_TOKENS
+    overrides every template's; 0 turns budgeting (and trimming) off.
+    """
+    override = os.environ.get("AGENT_CONTEXT_TOKENS")
+    if override is not None:
+        try:
+            return max(0, int(override))
+        except ValueError:
+            pass
+    return TEMPLATE_BUDGETS.get(template, DEFAULT_BUDGET)
+
+
+class TokenCounter:
+    """
+    Token counts with the active model's tokenizer, or an estimate (words and
+    punctuation marks) when no tokenizer is loaded, as with the mock LLM.
+    """
+
+    def __init__(self, tokenizer=None, name: str = "estimate"):
+        self.tokenizer = tokenizer
+        self.name = name
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+        return len(_APPROX_TOKEN_RE.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is not None:
+            ids = self.tokenizer(text, add_special_tokens=False).input_ids
+            return self.tokenizer.decode(ids[:max_tokens]) if len(ids) > max_tokens else text
+        m = list(_APPROX_TOKEN_RE.finditer(text))
+        return text[:m[max_tokens - 1].end()] if len(m) > max_tokens else text
+
+
+# ---- Cleanup ----
+def strip_quoted(text: str) -> str:
+    """
+    Drop the quoted history of a reply: "> " lines, and everything from an
+    "On ... wrote:" / "Original Message" / Outlook "From:" header onwards.
+    """
+    lines = text.splitlines()
+    out: List[str] = []
+    for i, line in enumerate(lines):
+        s = line.strip()
+        if s.startswith(">"):
+            continue
+        # "On Mon, Jan 6, Ann <ann@x.com>" + "wrote:" split over two lines
+        joined = s + " " + lines[i + 1].strip() if i + 1 < len(lines) and s.lower().startswith("on ") else s
+        outlook = s.lower().startswith("from:") and i + 1 < len(lines) and lines[i + 1].strip().lower().startswith(("sent:", "date:", "to:"))
+        if out and (outlook or _QUOTE_HEADER_RE.match(s) or _QUOTE_HEADER_RE.match(joined)):
+            break
+        out.append(line)
+    return "\n".join(out).strip()
+
+
+def strip_signature(text: str) -> str:
+    """
+    Cut a trailing signature: from a "-- " delimiter or "Sent from my ..."
+    line, or a sign-off ("Best regards,") in the last few lines.
+    """
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if i and _SIGNATURE_RE.match(line.strip()):
+            lines = lines[:i]
+            break
+    for i in range(max(1, len(lines) - 6), len(lines)):
+        if _SIGN_OFF_RE.match(lines[i].strip()):
+            lines = lines[:i]
+            break
+    return "\n".join(lines).strip()
+
+
+def clean_body(text: str) -> str:
+    text = strip_signature(strip_quoted(text or ""))
+    return re.sub(r"\n\s*\n\s*\n+", "\n\n", text)
+
+
+# ---- Extractive truncation ----
+def _sentence_score(i: int, n: int, sentence: str) -> float:
+    score = 3.0 if i == 0 else 1.5 if i == 1 else 0.0
+    if i == n - 1:
+        score += 0.5
+    if "?" in sentence:
+        score += 2.0
+    if _ACTION_RE.search(sentence):
+        score += 1.5
+    if _DATE_RE.search(sentence):
+        score += 1.5
+    return score
+
+
+def fit_to_budget(text: str, budget: int, counter: TokenCounter) -> Tuple[str, bool]:
+    """
+    `text` within `budget` tokens: whole if it fits, else its most informative
+    sentences (opening, questions, requests, dates) in their original order,
+    with " ... " where sentences were left out. Returns (text, truncated).
+    """
+    if counter.count(text) <= budget:
+        return text, False
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+    costs = [counter.count(s) + 1 for s in sentences]
+    order = sorted(range(len(sentences)), key=lambda i: (-_sentence_score(i, len(sentences), sentences[i]), i))
+    keep, used = set(), 0
+    for i in order:
+        if used + costs[i] + 1 <= budget:  # +1 for a possible " ... "
+            keep.add(i)
+            used += costs[i] + 1
+    if not keep:
+        return counter.truncate(sentences[0] if sentences else text, budget - 1) + " ...", True
+    parts: List[str] = []
+    for i in sorted(keep):
+        if parts and i - 1 not in keep:
+            parts.append("...")
+        parts.append(sentences[i])
+    if max(keep) < len(sentences) - 1:
+        parts.append("...")
+    return " ".join(parts), True
+
+
+# ---- Context assembly ----
+def fit_metadata(email: Dict[str, Any], limit: int, counter: TokenCounter) -> Tuple[str, bool]:
+    """
+    The metadata line (every field but the body) within `limit` tokens:
+    long values (a pasted-in subject, a huge recipient list) are cut to
+    fewer and fewer tokens until it fits, and it is left out when even the
+    shortest form does not. Returns (text, truncated).
+    """
+    fields = {k: v for k, v in email.items() if k != "body"}
+    meta = _META_HEADER + json.dumps(fields)
+    if counter.count(meta) <= limit:
+        return meta, False
+    values = {k: v if isinstance(v, str) else json.dumps(v) for k, v in fields.items() if not isinstance(v, (int, float, bool, type(None)))}
+    cap = max((counter.count(v) for v in values.values()), default=0)
+    while cap > 1:
+        cap //= 2
+        short = dict(fields)
+        for k, v in values.items():
+            if counter.count(v) > cap:
+                short[k] = counter.truncate(v, cap) + "..."
+        meta = _META_HEADER + json.dumps(short)
+        if counter.count(meta) <= limit:
+            return meta, True
+    return "", True
+
+
+def _related_line(email: Dict[str, Any], body: str) -> str:
+    return f"- From {email.get('sender', '')} ({email.get('timestamp', '')}), subject \"{email.get('subject', '')}\": {body}"
+
+
+def _assemble(body: str, meta: str, header: str, lines: List[str]) -> str:
+    return body + meta + (header + "\n".join(lines) if lines else "")
+
+
+def build_context(
+    email: Dict[str, Any],
+    counter: TokenCounter,
+    budget: int,
+    related: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    The {email_text} for an agent prompt: the cleaned body, the metadata once
+    (without repeating the body) and related emails, fitted into `budget`
+    tokens (0 = no limit, nothing trimmed). Returns (text, stats) where stats
+    compares against the untrimmed body + full metadata JSON + related bodies.
+    """
+    related = related or []
+    header = "\n\nRelated emails (same thread or similar):\n" if related else ""
+    original = (email.get("body") or "") + "\n\nFull email metadata:\n" + json.dumps(email)
+    if related:
+        original += header + "\n".join(_related_line(e, " ".join((e.get("body") or "").split())) for e in related)
+
+    truncated = False
+    if budget <= 0:
+        body = email.get("body") or ""
+        meta = _META_HEADER + json.dumps({k: v for k, v in email.items() if k != "body"})
+        lines = [_related_line(e, " ".join((e.get("body") or "").split())) for e in related]
+    else:
+        body = clean_body(email.get("body"))
+        meta, truncated = fit_metadata(email, int(budget * META_SHARE), counter)
+        fixed = counter.count(meta) + counter.count(header)
+        reserve = int(budget * RELATED_SHARE) if related else 0
+        body, cut = fit_to_budget(body, max(0, budget - fixed - reserve), counter)
+        truncated = truncated or cut
+        left = budget - fixed - counter.count(body)
+        lines = []
+        for n, e in enumerate(related):
+            prefix = _related_line(e, "")
+            share = left // (len(related) - n) - counter.count(prefix) - 1
+            if share <= 0:
+                continue
+            snippet, cut = fit_to_budget(" ".join(clean_body(e.get("body")).split()), share, counter)
+            truncated = truncated or cut
+            line = prefix + snippet
+            left -= counter.count(line) + 1
+            lines.append(line)
+
+    text = _assemble(body, meta, header, lines)
+    if budget > 0 and counter.count(text) > budget:
+        # token counts of the pieces need not add up to the joined text's:
+        # drop related emails, then cut the body until the whole fits
+        truncated = True
+        while lines and counter.count(text) > budget:
+            lines.pop()
+            text = _assemble(body, meta, header, lines)
+        room = budget - counter.count(_assemble("", meta, header, lines))
+        while room > 0 and counter.count(text) > budget:
+            body = counter.truncate(body, room)
+            text = _assemble(body, meta, header, lines)
+            room -= 1
+        if counter.count(text) > budget:
+            body = ""
+            text = _assemble(body, meta, header, lines)
+        # last resort: the metadata and header alone are over, cut the whole text
+        whole, room = text, budget
+        while room > 0 and counter.count(text) > budget:
+            text = counter.truncate(whole, room)
+            room -= 1
+        if counter.count(text) > budget:
+            text = ""
+    tokens = counter.count(text)
+    original_tokens = counter.count(original)
+    return text, {
+        "tokens": tokens,
+        "original_tokens": original_tokens,
+        "saved_tokens": max(0, original_tokens - tokens),
+        "budget": budget,
+        "truncated": truncated,
+        "related": len(lines),
+        "tokenizer": counter.name,
+    }
@@ -0,0 +1,101 @@
+# backend/cpu_backend.py
+import os
+import warnings
+from typing import Any
+
+LOCAL_BACKENDS = ("torch", "int8", "onnx")
+
+
+def local_model_backend() -> str:
+    """
+    CPU inference backend for the local model (LOCAL_MODEL_BACKEND):
+    "torch" (float32, the default), "int8" (dynamic int8 quantization of the
+    linear layers) or "onnx" (ONNX Runtime session via optimum[onnxruntime]).
+    """
+    backend = os.environ.get("LOCAL_MODEL_BACKEND", "torch").strip().lower()
+    return backend if backend in LOCAL_BACKENDS else "torch"
+
+
+def local_model_threads() -> int:
+    """
+    Intra-op threads for CPU inference (LOCAL_MODEL_THREADS); 0 keeps the
+    library default (one per core).
+    """
+    try:
+        return max(0, int(os.environ.get("LOCAL_MODEL_THREADS", "0")))
+    except ValueError:
+        return 0
+
+
+def _quantized_linear(weight, bias) -> Any:
+    """
+    A dynamic int8 Linear for an (out x in) float weight, quantized the way
+    quantize_dynamic does it (per tensor, symmetric min/max).
+    """
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear
+
+    observer = torch.ao.quantization.default_dynamic_qconfig.weight()
+    observer(weight)
+    scale, zero_point = observer.calculate_qparams()
+    qweight = torch.quantize_per_tensor(weight.float(), float(scale), int(zero_point), torch.qint8)
+    qlinear = Linear(weight.shape[1], weight.shape[0], bias_=bias is not None, dtype=torch.qint8)
+    qlinear.set_weight_bias(qweight, None if bias is None else bias.detach().float().clone())
+    return qlinear
+
+
+def quantize_conv1d(module) -> int:
+    """
+    Replace GPT-2 style Conv1D layers (weight stored as in x out) with dynamic
+    int8 Linear layers, in place. Each layer goes straight from its float
+    weight to int8, so no float32 copy of the model is ever made. Returns the
+    number replaced.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    replaced = 0
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            setattr(module, name, _quantized_linear(child.weight.detach().t(), child.bias))
+            replaced += 1
+        else:
+            replaced += quantize_conv1d(child)
+    return replaced
+
+
+def quantize_int8(model) -> Any:
+    """
+    Dynamic int8 quantization of every linear layer (weights int8, activations
+    quantized per batch at run time), in place so the float32 weights are
+    freed layer by layer. Embeddings and layer norms stay float32.
+    """
+    import torch
+
+    model.eval()
+    with torch.no_grad(), warnings.catch_warnings():
+        # the eager quantization API is deprecated upstream but still the only CPU int8 path without extra deps
+        warnings.simplefilter("ignore")
+        quantize_conv1d(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        # what stays float (embeddings, layer norms) may be views of the memory-mapped
+        # checkpoint, which would keep the whole file resident; own copies release it
+        for p in model.parameters():
+            p.data = p.data.clone()
+    return model
+
+
+def load_onnx_model(model_name: str, threads: int = 0) -> Any:
+    """
+    The causal LM exported to ONNX and run by an ONNX Runtime CPU session.
+    Raises ImportError when optimum[onnxruntime] is not installed.
+    """
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ORTModelForCausalLM.from_pretrained(
+        model_name, export=True, use_cache=True, provider="CPUExecutionProvider", session_options=options
+    )
@@ -0,0 +1,184 @@
+# backend/extract.py
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+# ---- Rules, compiled once at import ----
+_SENTENCE_RE = re.compile(r"[^.!?\n]+[.!?]*")
+
+_REQUEST_RE = re.compile(
+    r"\b(?:please|kindly|could you|can you|would you|need you to|we need to|we need|you need to|make sure to)\s+(?P<task>[^.!?\n]+)",
+    re.I,
+)
+_MEETING_RE = re.compile(r"\b(?:meet|meeting|schedule|sync|proposed agenda|proposed time|availability|call)\b", re.I)
+_PAYMENT_RE = re.compile(r"\b(?:invoice|payment|due|bill(?:ing)?)\b", re.I)
+
+_ASSIGNEE_RES = [
+    re.compile(r"\bassign(?:ed)? to\s+(?P<who>@?[A-Z][\w.-]*(?:\s[A-Z][\w-]*)?)"),
+    re.compile(r"@(?P<who>[A-Za-z][\w.-]*)"),
+    re.compile(r"^\s*(?P<who>[A-Z][a-z]+(?:\s[A-Z][a-z]+)?),\s+(?:please|can you|could you|kindly)\b"),
+    re.compile(r"\b(?P<who>[A-Z][a-z]+(?:\s[A-Z][a-z]+)?)\s+(?:will|should|needs to)\b"),
+]
+# capitalised words that start sentences but are not people
+_NOT_NAMES = {"Please", "We", "I", "You", "It", "This", "That", "Also", "Can", "Could", "The", "Open", "Attached", "Hey", "Hi"}
+
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+# full month names or their abbreviations only, so "separate" or "decide" are not months
+_MONTH = (r"(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b")
+_MONTH_DAY_RE = re.compile(r"\b" + _MONTH + r"\.?\s+(\d{1,2})(?:st|nd|rd|th)?\b", re.I)
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+" + _MONTH, re.I)
+_WEEKDAY_RE = re.compile(r"\b(?:by|on|before|until|this|next)?\s*(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b", re.I)
+_IN_DAYS_RE = re.compile(r"\b(?:in|within)\s+(\d{1,3})\s+(day|week)s?\b", re.I)
+_RELATIVE_RE = re.compile(r"\b(today|tonight|eod|end of day|tomorrow|next week|end of (?:the )?week|eow|end of (?:the )?month)\b", re.I)
+
+
+def reference_date(timestamp: Optional[str] = None) -> date:
+    """
+    The date relative deadlines are resolved against: the email's timestamp
+    when given and parseable, otherwise today.
+    """
+    if timestamp:
+        try:
+            return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).date()
+        except ValueError:
+            pass
+    return date.today()
+
+
+def parse_deadline(text: str, ref: date) -> Optional[str]:
+    """
+    First deadline expression in `text` as an ISO date, or None.
+    Handles ISO dates, "Nov 30" / "30 Nov", weekdays ("by Friday"),
+    "in 30 days" and relative phrases like "tomorrow" or "next week".
+    """
+    m = _ISO_DATE_RE.search(text)
+    if m:
+        try:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+        except ValueError:
+            pass
+    m = _MONTH_DAY_RE.search(text)
+    if m:
+        return _month_day(ref, _MONTHS.index(m.group(1).lower()[:3]) + 1, int(m.group(2)))
+    m = _DAY_MONTH_RE.search(text)
+    if m:
+        return _month_day(ref, _MONTHS.index(m.group(2).lower()[:3]) + 1, int(m.group(1)))
+    m = _IN_DAYS_RE.search(text)
+    if m:
+        n = int(m.group(1)) * (7 if m.group(2).lower() == "week" else 1)
+        return (ref + timedelta(days=n)).isoformat()
+    m = _RELATIVE_RE.search(text)
+    if m:
+        phrase = m.group(1).lower()
+        if phrase in ("today", "tonight", "eod", "end of day"):
+            return ref.isoformat()
+        if phrase == "tomorrow":
+            return (ref + timedelta(days=1)).isoformat()
+        if phrase == "next week":
+            return (ref + timedelta(days=7 - ref.weekday())).isoformat()
+        if "month" in phrase:
+            nxt = date(ref.year + (ref.month == 12), ref.month % 12 + 1, 1)
+            return (nxt - timedelta(days=1)).isoformat()
+        return (ref + timedelta(days=(4 - ref.weekday()) % 7)).isoformat()
+    m = _WEEKDAY_RE.search(text)
+    if m:
+        target = _WEEKDAYS.index(m.group(1).lower())
+        ahead = (target - ref.weekday()) % 7 or 7
+        if m.group(0).lower().lstrip().startswith("next") and ahead < 7:
+            ahead += 7
+        return (ref + timedelta(days=ahead)).isoformat()
+    return None
+
+
+def _month_day(ref: date, month: int, day: int) -> Optional[str]:
+    # no year given: the next occurrence on or after the reference date
+    for year in (ref.year, ref.year + 1):
+        try:
+            d = date(year, month, day)
+        except ValueError:
+            return None
+        if d >= ref:
+            return d.isoformat()
+    return None
+
+
+def detect_assignee(sentence: str) -> Optional[str]:
+    for rx in _ASSIGNEE_RES:
+        m = rx.search(sentence)
+        if m:
+            who = m.group("who").strip()
+            if who.split()[0] not in _NOT_NAMES:
+                return who
+    return None
+
+
+def _clean(s: str) -> str:
+    return " ".join(s.split()).strip(" ,;:-")
+
+
+def extract_actions(text: str, ref: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Action items in an email body. Each task's context is only the sentence
+    it came from; deadlines are ISO dates resolved against `ref`, taken from
+    that sentence or, failing that, from a neighbouring one.
+    """
+    ref = ref or date.today()
+    sentences = [c for c in (_clean(m.group(0)) for m in _SENTENCE_RE.finditer(text or "")) if c]
+    deadlines = [parse_deadline(s, ref) for s in sentences]
+
+    def deadline_near(i: int) -> Optional[str]:
+        for j in (i, i - 1, i + 1):
+            if 0 <= j < len(sentences) and deadlines[j]:
+                return deadlines[j]
+        return None
+
+    def pick(rx) -> Optional[int]:
+        # first matching sentence, preferring one that carries a deadline
+        hits = [i for i, s in enumerate(sentences) if rx.search(s)]
+        return next((i for i in hits if deadlines[i]), hits[0] if hits else None)
+
+    tasks: List[Dict[str, Any]] = []
+    seen = set()
+    for i, sentence in enumerate(sentences):
+        req = _REQUEST_RE.search(sentence)
+        if not req:
+            continue
+        task = _clean(req.group("task"))
+        if task and task.lower() not in seen:
+            seen.add(task.lower())
+            tasks.append({
+                "task": task,
+                "deadline": deadline_near(i),
+                "assignee": detect_assignee(sentence),
+                "context": sentence,
+            })
+
+    i = pick(_MEETING_RE)
+    if i is not None:
+        tasks.append({
+            "task": "Schedule meeting / confirm time",
+            "deadline": deadlines[i],
+            "assignee": detect_assignee(sentences[i]),
+            "context": sentences[i],
+        })
+    i = pick(_PAYMENT_RE)
+    if i is not None:
+        tasks.append({
+            "task": "Review invoice / arrange payment",
+            "deadline": deadline_near(i),
+            "assignee": None,
+            "context": sentences[i],
+        })
+    return tasks
+
+
+def extract_actions_batch(emails: Iterable[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    extract_actions over many emails ({"body", "timestamp"} dicts); each
+    email's own timestamp anchors its relative deadlines.
+    """
+    return [extract_actions(e.get("body") or "", reference_date(e.get("timestamp"))) for e in emails]
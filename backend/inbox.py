@@ -0,0 +1,251 @@
+# backend/inbox.py
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.metrics import stage
+from backend.sync import email_hash
+
+_REPLY_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv)(\[\d+\])?\s*:\s*)+", re.I)
+
+
+def thread_key(email: Dict[str, Any]) -> str:
+    """
+    Emails with the same subject once Re:/Fwd: prefixes, case and spacing
+    are dropped belong to one thread.
+    """
+    subject = _REPLY_PREFIX_RE.sub("", email.get("subject") or "")
+    return " ".join(subject.lower().split())
+
+
+# rows per query when paging ingested emails out of SQLite
+INGEST_PAGE = 5000
+
+
+class _Snapshot:
+    """
+    Immutable parsed view of the inbox file, with its lookup indexes.
+    `ingested_to` is the highest ingested email id it holds.
+    """
+
+    def __init__(self, emails: List[Dict[str, Any]], signature: Optional[Tuple], ingested_to: int = 0):
+        self.signature = signature
+        self.ingested_to = ingested_to
+        self.emails = emails
+        self.by_id: Dict[Any, Dict[str, Any]] = {}
+        self.by_sender: Dict[str, List[Dict[str, Any]]] = {}
+        for e in emails:
+            self.by_id[e.get("id")] = e
+            self.by_sender.setdefault((e.get("sender") or "").lower(), []).append(e)
+        # (timestamp, position) pairs sorted by timestamp; ISO-8601 strings sort correctly
+        self.by_time = sorted(((e.get("timestamp") or "", i) for i, e in enumerate(emails)))
+        self._times = [t for t, _ in self.by_time]
+        self._payload: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._hashes: Optional[Dict[Any, str]] = None
+        self._threads: Optional[Dict[str, List[Dict[str, Any]]]] = None
+
+    def extend(self, new: List[Dict[str, Any]], signature: Optional[Tuple], ingested_to: int) -> "_Snapshot":
+        """
+        A new snapshot with `new` (freshly ingested) emails after these: the
+        indexes, payload, hashes and threads are extended, not rebuilt.
+        """
+        snap = _Snapshot.__new__(_Snapshot)
+        snap.signature = signature
+        snap.ingested_to = ingested_to
+        snap.emails = self.emails + new
+        snap.by_id = dict(self.by_id)
+        snap.by_id.update((e.get("id"), e) for e in new)
+        senders: Dict[str, List[Dict[str, Any]]] = {}
+        for e in new:
+            senders.setdefault((e.get("sender") or "").lower(), []).append(e)
+        snap.by_sender = dict(self.by_sender)
+        for sender, emails in senders.items():
+            snap.by_sender[sender] = snap.by_sender.get(sender, []) + emails
+        # both runs are already sorted, so this is a linear merge
+        base = len(self.emails)
+        snap.by_time = sorted(self.by_time + [(e.get("timestamp") or "", base + i) for i, e in enumerate(new)])
+        snap._times = [t for t, _ in snap.by_time]
+        snap._payload = None
+        if self._payload is not None and new:
+            tail = json.dumps(new).encode("utf-8")
+            snap._payload = tail if not self.emails else self._payload[:-1] + b", " + tail[1:]
+        elif self._payload is not None:
+            snap._payload = self._payload
+        snap._etag = None
+        snap._hashes = None
+        if self._hashes is not None:
+            snap._hashes = dict(self._hashes)
+            snap._hashes.update((e.get("id"), email_hash(e)) for e in new)
+        snap._threads = None
+        if self._threads is not None:
+            snap._threads = dict(self._threads)
+            grouped: Dict[str, List[Dict[str, Any]]] = {}
+            for e in new:
+                grouped.setdefault(thread_key(e), []).append(e)
+            for key, emails in grouped.items():
+                # stable: ties keep inbox order, as in threads()
+                snap._threads[key] = sorted(snap._threads.get(key, []) + emails, key=lambda e: e.get("timestamp") or "")
+        return snap
+
+    @property
+    def payload(self) -> bytes:
+        """
+        The emails as JSON, serialized on first use.
+        """
+        if self._payload is None:
+            self._payload = json.dumps(self.emails).encode("utf-8")
+        return self._payload
+
+    @property
+    def etag(self) -> str:
+        if self._etag is None:
+            self._etag = '"' + hashlib.sha1(self.payload).hexdigest() + '"'
+        return self._etag
+
+    def between(self, start: Optional[str], end: Optional[str]) -> List[Dict[str, Any]]:
+        lo = bisect.bisect_left(self._times, start) if start else 0
+        hi = bisect.bisect_right(self._times, end) if end else len(self._times)
+        return [self.emails[i] for _, i in self.by_time[lo:hi]]
+
+    def content_hashes(self) -> Dict[Any, str]:
+        """
+        email id -> content hash, computed on first use and kept with the snapshot.
+        """
+        if self._hashes is None:
+            self._hashes = {e.get("id"): email_hash(e) for e in self.emails}
+        return self._hashes
+
+    def threads(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        thread key -> its emails, oldest first; built on first use.
+        """
+        if self._threads is None:
+            threads: Dict[str, List[Dict[str, Any]]] = {}
+            for _, i in self.by_time:
+                e = self.emails[i]
+                threads.setdefault(thread_key(e), []).append(e)
+            self._threads = threads
+        return self._threads
+
+
+class InboxService:
+    """
+    In-memory inbox, indexed by id, sender and timestamp.
+
+    The file is parsed once and re-read only when its mtime or size changes;
+    each reload builds a new snapshot and swaps it in, so readers never see
+    a half-built index. With an EmailRepository, ingested emails follow the
+    file's. A new ingest (its version bump) only pages in the emails added
+    since the current snapshot and extends it, so a running ingest costs
+    each reader one chunk of work rather than a rebuild of the whole inbox.
+    """
+
+    def __init__(self, path: Path, ingested=None):
+        self.path = Path(path)
+        self.ingested = ingested
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot([], None)
+        self.reloads = 0
+        self.extends = 0
+
+    def _signature(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.path)
+            sig = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            sig = None
+        if self.ingested is None:
+            return sig
+        return (sig, self.ingested.version())
+
+    def _ingested_after(self, after_id: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Ingested emails with ids above `after_id`, read a page at a time,
+        and the highest id among them (`after_id` when there are none).
+        """
+        emails: List[Dict[str, Any]] = []
+        while True:
+            page = self.ingested.after(after_id, INGEST_PAGE)
+            emails.extend(page)
+            if page:
+                after_id = page[-1]["id"]
+            if len(page) < INGEST_PAGE:
+                return emails, after_id
+
+    def _load(self, sig: Optional[Tuple]) -> _Snapshot:
+        emails = json.loads(self.path.read_text()) if self.path.exists() else []
+        emails = emails or []
+        if self.ingested is None:
+            return _Snapshot(emails, sig)
+        ingested, last = self._ingested_after(0)
+        file_ids = {e.get("id") for e in emails}
+        clashes = [e["id"] for e in ingested if e["id"] in file_ids]
+        if clashes:
+            # ingested before stored emails had their own id range: the
+            # inbox file keeps its ids, the stored emails move
+            moved = self.ingested.renumber(clashes)
+            print(f"Inbox: renumbered {len(moved)} ingested email(s) whose ids the inbox file also uses: {moved}")
+            sig = self._signature()
+            ingested, last = self._ingested_after(0)
+        return _Snapshot(emails + ingested, sig, last)
+
+    def snapshot(self) -> _Snapshot:
+        sig = self._signature()
+        snap = self._snapshot
+        if sig == snap.signature and self.reloads:
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if sig == snap.signature and self.reloads:
+                return snap
+            snap = self._extend(snap, sig) if self._only_ingested(snap, sig) else None
+            if snap is not None:
+                self.extends += 1
+            else:
+                with stage("inbox_load"):
+                    snap = self._load(sig)
+                self.reloads += 1
+            self._snapshot = snap
+            return snap
+
+    def _only_ingested(self, snap: _Snapshot, sig: Optional[Tuple]) -> bool:
+        # the file is unchanged, so only new mail was ingested
+        return self.ingested is not None and bool(self.reloads) and snap.signature is not None and sig[0] == snap.signature[0]
+
+    def _extend(self, snap: _Snapshot, sig: Optional[Tuple]) -> Optional[_Snapshot]:
+        """
+        `snap` plus the emails ingested since, or None when one of them takes
+        an id the snapshot already has (a full reload sorts that out).
+        """
+        with stage("inbox_extend"):
+            new, last = self._ingested_after(snap.ingested_to)
+            if any(e["id"] in snap.by_id for e in new):
+                return None
+            return snap.extend(new, sig, last)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return self.snapshot().emails
+
+    def get(self, email_id) -> Optional[Dict[str, Any]]:
+        return self.snapshot().by_id.get(email_id)
+
+    def by_sender(self, sender: str) -> List[Dict[str, Any]]:
+        return list(self.snapshot().by_sender.get((sender or "").lower(), []))
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Emails with start <= timestamp <= end (ISO-8601 strings), oldest first.
+        """
+        return self.snapshot().between(start, end)
+
+    def payload(self) -> bytes:
+        """
+        The whole inbox as pre-serialized JSON, rebuilt only on reload.
+        """
+        return self.snapshot().payload
@@ -0,0 +1,258 @@
+# backend/ingest.py
+import argparse
+import hashlib
+import html
+import json
+import mailbox
+import re
+import sys
+import time
+from datetime import timezone
+from email.header import decode_header, make_header
+from email.parser import BytesParser
+from email.utils import getaddresses, parsedate_to_datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from backend.store import EmailRepository, Store
+
+INGEST_FORMATS = ("mbox", "maildir", "jsonl")
+
+# compat32 parser: headers stay raw strings until asked for, several times
+# faster than policy.default on large mailboxes
+_parser = BytesParser()
+_TAG_RE = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.S | re.I)
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+
+
+def detect_format(path: Path) -> str:
+    path = Path(path)
+    if path.is_dir():
+        if (path / "cur").is_dir() or (path / "new").is_dir():
+            return "maildir"
+        raise ValueError(f"{path} is a directory but not a Maildir")
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "mbox"
+
+
+# ---- Sources: one raw message at a time ----
+def iter_mbox(path: Path) -> Iterator[Tuple[Any, int]]:
+    """
+    (message, size in bytes) for each message of an mbox file. The mailbox
+    module only indexes message offsets; each message is read when reached.
+    """
+    box = mailbox.mbox(str(path), create=False)
+    try:
+        for key in box.iterkeys():
+            raw = box.get_bytes(key)
+            yield _parser.parsebytes(raw), len(raw)
+    finally:
+        box.close()
+
+
+def iter_maildir(path: Path) -> Iterator[Tuple[Any, int]]:
+    box = mailbox.Maildir(str(path), factory=None, create=False)
+    for key in box.iterkeys():
+        try:
+            raw = box.get_bytes(key)
+        except KeyError:  # delivered/moved while iterating
+            continue
+        yield _parser.parsebytes(raw), len(raw)
+
+
+def iter_jsonl(path: Path) -> Iterator[Tuple[Any, int]]:
+    """
+    One record per non-blank line; a line that is not a JSON object comes
+    out as None, so one bad line does not stop the ingest.
+    """
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:  # JSONDecodeError, or bytes that are not UTF-8
+                record = None
+            yield (record if isinstance(record, dict) else None), len(line)
+
+
+SOURCES = {"mbox": iter_mbox, "maildir": iter_maildir, "jsonl": iter_jsonl}
+
+
+# ---- Normalization to the inbox shape ----
+def _html_to_text(markup: str) -> str:
+    text = html.unescape(_TAG_RE.sub(" ", re.sub(r"(?i)<br\s*/?>|</p>", "\n", markup)))
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(" ".join(l.split()) for l in text.splitlines())).strip()
+
+
+def _header(msg, name: str) -> str:
+    value = msg.get(name)
+    if value is None:
+        return ""
+    try:
+        return str(make_header(decode_header(value))).strip()
+    except Exception:  # malformed encoded-words: keep the raw header
+        return str(value).strip()
+
+
+def message_body(msg) -> str:
+    """
+    Plain-text body of a MIME message: the first text/plain part, else the
+    first text/html part with tags stripped. Attachments are ignored.
+    """
+    plain = markup = None
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_disposition() == "attachment":
+            continue
+        ctype = part.get_content_type()
+        if ctype == "text/plain" and plain is None:
+            plain = part
+        elif ctype == "text/html" and markup is None:
+            markup = part
+    part = plain or markup
+    if part is None:
+        return ""
+    payload = part.get_payload(decode=True) or b""
+    try:
+        text = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    except LookupError:  # unknown charset name
+        text = payload.decode("utf-8", errors="replace")
+    return _html_to_text(text) if part is markup else text.strip()
+
+
+def _timestamp(value: Optional[str]) -> str:
+    try:
+        dt = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return ""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _content_key(email: Dict[str, Any]) -> str:
+    fields = [email.get(k) for k in ("sender", "subject", "timestamp", "body")]
+    return "sha256:" + hashlib.sha256(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+def normalize_message(msg) -> Tuple[str, Dict[str, Any]]:
+    """
+    (source_key, {sender, subject, timestamp, body}) for a parsed MIME message.
+    The key is the Message-ID, or a content hash when there is none.
+    """
+    addrs = getaddresses([str(msg.get("From", ""))])
+    email = {
+        "sender": addrs[0][1] if addrs else "",
+        "subject": _header(msg, "Subject"),
+        "timestamp": _timestamp(msg.get("Date")),
+        "body": message_body(msg),
+    }
+    message_id = str(msg.get("Message-ID", "")).strip()
+    return (message_id or _content_key(email)), email
+
+
+def normalize_record(record: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Same as normalize_message for one JSON Lines record in (roughly) the inbox
+    shape; "from"/"date"/"text" are accepted as aliases.
+    """
+    email = {
+        "sender": record.get("sender") or record.get("from") or "",
+        "subject": record.get("subject") or "",
+        "timestamp": record.get("timestamp") or record.get("date") or "",
+        "body": record.get("body") or record.get("text") or "",
+    }
+    key = record.get("message_id") or record.get("id")
+    return (f"jsonl:{key}" if key is not None else _content_key(email)), email
+
+
+def iter_emails(path: Path, fmt: str = None) -> Iterator[Tuple[Optional[str], Optional[Dict[str, Any]], int]]:
+    """
+    (source_key, email, raw size) for every message in `path`, lazily;
+    (None, None, size) for a record that could not be read.
+    """
+    fmt = fmt or detect_format(path)
+    if fmt not in SOURCES:
+        raise ValueError(f"unknown format {fmt!r}; expected one of {', '.join(INGEST_FORMATS)}")
+    normalize = normalize_record if fmt == "jsonl" else normalize_message
+    for item, size in SOURCES[fmt](Path(path)):
+        if item is None:
+            yield None, None, size
+            continue
+        key, email = normalize(item)
+        yield key, email, size
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def ingest(
+    store: Store,
+    path: Path,
+    fmt: str = None,
+    chunk_size: int = 500,
+    progress=None,
+) -> Dict[str, Any]:
+    """
+    Stream a mailbox into the store's emails table, `chunk_size` messages per
+    transaction, so memory stays bounded by one chunk. New emails get ids
+    from INGESTED_ID_BASE up, apart from the JSON inbox's; unreadable records
+    are skipped and counted as `invalid`. `progress`, if given, is called
+    with the running stats after each chunk. Returns ingest stats.
+    """
+    repo = EmailRepository(store)
+    fmt = fmt or detect_format(path)
+    stats = {"format": fmt, "read": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "bytes": 0}
+    t0 = time.perf_counter()
+    for chunk in _chunks(iter_emails(path, fmt), max(1, chunk_size)):
+        valid = [(key, email) for key, email, _ in chunk if email is not None]
+        inserted = repo.insert_many(valid)
+        stats["read"] += len(chunk)
+        stats["inserted"] += inserted
+        stats["duplicates"] += len(valid) - inserted
+        stats["invalid"] += len(chunk) - len(valid)
+        stats["bytes"] += sum(size for _, _, size in chunk)
+        if progress:
+            progress(_rates(stats, time.perf_counter() - t0))
+    return _rates(stats, time.perf_counter() - t0)
+
+
+def _rates(stats: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    return dict(
+        stats,
+        elapsed_seconds=round(elapsed, 4),
+        messages_per_second=round(stats["read"] / elapsed, 1) if elapsed > 0 else None,
+        mb_per_second=round(stats["bytes"] / elapsed / 1e6, 2) if elapsed > 0 else None,
+    )
+
+
+if __name__ == "__main__":
+    # python -m backend.ingest PATH [--format mbox|maildir|jsonl] [--chunk-size N]
+    from backend.config import STORE_PATH
+
+    ap = argparse.ArgumentParser(description="Stream a mailbox into the backend store.")
+    ap.add_argument("path", type=Path)
+    ap.add_argument("--format", choices=INGEST_FORMATS)
+    ap.add_argument("--chunk-size", type=int, default=500)
+    args = ap.parse_args()
+
+    s = Store(STORE_PATH)
+    try:
+        result = ingest(
+            s, args.path, args.format, args.chunk_size,
+            progress=lambda st: print(f"{st['read']} read, {st['inserted']} new, {st['invalid']} invalid, {st['messages_per_second']} msg/s", file=sys.stderr),
+        )
+    except (ValueError, OSError, mailbox.Error) as e:
+        print("ingest failed:", e, file=sys.stderr)
+        sys.exit(2)
+    finally:
+        s.close()
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,348 @@
+# backend/jobs.py
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.store import Store
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    email_id INTEGER,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    not_before REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pick ON jobs(status, priority DESC, created_at);
+"""
+
+_COLUMNS = ("id", "kind", "email_id", "priority", "status", "attempts", "max_attempts",
+            "not_before", "error", "result", "created_at", "started_at", "finished_at")
+
+
+def job_workers() -> int:
+    """
+    Worker processes for the job queue (JOB_WORKERS, default 2; 0 disables it).
+    """
+    try:
+        return max(0, int(os.environ.get("JOB_WORKERS", "2")))
+    except ValueError:
+        return 2
+
+
+def run_process_job(email: Dict[str, Any], prompts: Dict[str, str], category_output: Optional[str] = None) -> Dict[str, str]:
+    """
+    Worker-process body of a "process" job: the same generations as
+    POST /process/{id}. A `category_output` already given by the tier-1
+    classifier (in the server process) skips the categorization prompt.
+    Each worker process keeps its own model registry.
+    """
+    from backend.extract import reference_date
+    from backend.llm import call_llm, prefix_cache
+    from backend.prompts import render
+
+    prefix_cache.sync_templates(prompts)
+
+    act_prompt = render(prompts["action_prompt"], email_text=email["body"])
+    if category_output is None:
+        cat_prompt = render(prompts["categorization_prompt"], email_text=email["body"])
+        category_output, source = call_llm(cat_prompt, template="categorization_prompt"), "llm"
+    else:
+        source = "tier1"
+    return {
+        "category_output": category_output,
+        "action_output": call_llm(act_prompt, template="action_prompt", reference=reference_date(email.get("timestamp"))),
+        "category_source": source,
+    }
+
+
+class JobQueue:
+    """
+    Persistent priority queue of processing jobs, stored in the backend SQLite store.
+
+    Higher priority runs first, then oldest first. Jobs left "running" by a
+    crashed or stopped server are re-queued on start(), so a large backfill
+    can be submitted once and survives restarts.
+    """
+
+    def __init__(self, store: Store):
+        self.store = store
+        store.add_schema(_SCHEMA)
+
+    def submit(self, email_ids: List[int], priority: int = 0, max_attempts: int = 3, kind: str = "process") -> List[str]:
+        now = time.time()
+        ids = [str(uuid.uuid4()) for _ in email_ids]
+        with self.store.transaction() as db:
+            db.executemany(
+                "INSERT INTO jobs (id, kind, email_id, priority, status, max_attempts, created_at) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                [(jid, kind, eid, priority, max(1, max_attempts), now) for jid, eid in zip(ids, email_ids)],
+            )
+        return ids
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.store.reader() as db:
+            row = db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        if job["result"]:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Atomically move the next runnable queued job to "running" and return it.
+        """
+        now = time.time()
+        with self.store.transaction() as db:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY priority DESC, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (now, row[0]),
+            )
+        return self.get(row[0])
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """
+        Mark a running job done. Returns False if it was cancelled meanwhile.
+        """
+        with self.store.transaction() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ? AND status = 'running'",
+                (json.dumps(result), time.time(), job_id),
+            )
+        return cur.rowcount > 0
+
+    def fail(self, job_id: str, error: str, retry_delay: float = 1.0, retry: bool = True) -> str:
+        """
+        Record a failed attempt: re-queue with exponential backoff while attempts
+        remain (and `retry` is set), otherwise mark the job failed.
+        Returns the new status.
+        """
+        now = time.time()
+        with self.store.transaction() as db:
+            row = db.execute("SELECT attempts, max_attempts, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[2] != "running":
+                return row[2] if row else "missing"
+            attempts, max_attempts, _ = row
+            if retry and attempts < max_attempts:
+                delay = retry_delay * (2 ** (attempts - 1))
+                db.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, not_before = ? WHERE id = ?",
+                    (error, now + delay, job_id),
+                )
+                return "queued"
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, now, job_id),
+            )
+            return "failed"
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a queued or running job (a running job's result is discarded).
+        Returns the job's status afterwards, or None if it does not exist.
+        """
+        with self.store.transaction() as db:
+            row = db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] in ("queued", "running"):
+                db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ?", (time.time(), job_id))
+                return "cancelled"
+            return row[0]
+
+    def requeue_running(self) -> int:
+        with self.store.transaction() as db:
+            cur = db.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self.store.reader() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {s: 0 for s in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobRunner:
+    """
+    Feeds queued jobs to a pool of worker processes.
+
+    A dispatcher thread keeps up to two jobs per worker in flight; results are
+    written back from the completion callbacks through `save_result`, with
+    the email and prompts the job ran on (not whatever is current by then).
+    Categorization goes through `classify` (the tier-1 router) first, as on
+    POST /process. A worker that dies breaks the whole pool: it is replaced
+    and the jobs that were in it go back to the queue.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        get_email: Callable[[int], Optional[Dict[str, Any]]],
+        get_prompts: Callable[[], Dict[str, str]],
+        save_result: Callable[[Dict[str, Any], Dict[str, str], Any], None],
+        classify: Callable[[Dict[str, Any]], Optional[str]] = None,
+        workers: int = None,
+    ):
+        self.queue = queue
+        self.get_email = get_email
+        self.get_prompts = get_prompts
+        self.save_result = save_result
+        self.classify = classify
+        self.workers = job_workers() if workers is None else workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._finished = deque(maxlen=1000)  # (finished_at, seconds) of recent jobs
+        self.retries = 0
+        self.pool_restarts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn, not fork: the server process has threads and possibly a loaded model
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        # every future of a broken pool fails at once; only the first replaces it
+        with self._pool_lock:
+            if self._pool is not broken or self._stop.is_set():
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            self.pool_restarts += 1
+        print("Job queue: a worker process died, restarted the pool")
+
+    def start(self):
+        if self.workers <= 0 or self._thread is not None:
+            return
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"Job queue: re-queued {requeued} interrupted job(s)")
+        self._pool = self._new_pool()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def notify(self):
+        self._wake.set()
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            with self._inflight_lock:
+                room = self._inflight < 2 * self.workers
+            job = self.queue.claim() if room else None
+            if job is None:
+                self._wake.wait(timeout=0.5)
+                self._wake.clear()
+                continue
+            self._start_job(job)
+
+    def _start_job(self, job: Dict[str, Any]):
+        email = self.get_email(job["email_id"])
+        if email is None:
+            self.queue.fail(job["id"], "Email not found", retry=False)
+            return
+        with self._inflight_lock:
+            self._inflight += 1
+        started = time.time()
+        pool = self._pool
+        prompts = None
+        try:
+            prompts = self.get_prompts()
+            category_output = self.classify(email) if self.classify is not None else None
+            future = pool.submit(run_process_job, email, prompts, category_output)
+        except Exception as e:
+            self._done(job, pool, email, prompts, None, e, started)
+            return
+        future.add_done_callback(lambda f: self._done(job, pool, email, prompts, f, None, started))
+
+    def _done(self, job: Dict[str, Any], pool, email, prompts, future, error: Optional[BaseException], started: float):
+        with self._inflight_lock:
+            self._inflight -= 1
+        self._wake.set()
+        if error is None and future is not None:
+            error = future.exception()
+        if isinstance(error, BrokenProcessPool):
+            # not necessarily this job's fault: retry at once in a fresh pool (it
+            # still uses up an attempt, so a job that keeps killing workers fails)
+            self._replace_pool(pool)
+            error = RuntimeError("worker process died")
+            retry_delay = 0.0
+        else:
+            retry_delay = 1.0
+        if error is not None:
+            status = self.queue.fail(job["id"], repr(error), retry_delay=retry_delay)
+            if status == "queued":
+                self.retries += 1
+            return
+        result = future.result()
+        job_now = self.queue.get(job["id"])
+        if job_now is None or job_now["status"] != "running":
+            return  # cancelled meanwhile: the result is discarded
+        try:
+            # the email as the worker saw it: if it was edited meanwhile, its
+            # content hash no longer matches and /process/sync redoes the job
+            self.save_result(email, result, prompts)
+        except Exception as e:
+            # this runs in a future's callback, where an exception would be lost
+            print(f"Job queue: saving the result of job {job['id']} failed: {e!r}")
+            self.queue.fail(job["id"], f"saving result failed: {e!r}", retry=False)
+            return
+        self.queue.complete(job["id"], result)
+        self._finished.append((time.time(), time.time() - started))
+
+    def metrics(self) -> Dict[str, Any]:
+        counts = self.queue.counts()
+        now = time.time()
+        recent = [secs for t, secs in self._finished if now - t <= 60]
+        with self._inflight_lock:
+            inflight = self._inflight
+        return {
+            "workers": self.workers,
+            "running": self._thread is not None,
+            "queue_depth": counts["queued"],
+            "in_flight": inflight,
+            "counts": counts,
+            "retries": self.retries,
+            "pool_restarts": self.pool_restarts,
+            "completed_last_minute": len(recent),
+            "avg_job_seconds": round(sum(recent) / len(recent), 4) if recent else None,
+        }
@@ -0,0 +1,127 @@
+# backend/listing.py
+import base64
+import bisect
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key: Any) -> str:
+    raw = json.dumps(key).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    """
+    Inverse of encode_cursor. Raises ValueError on a malformed cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def sort_key(value: Any) -> Tuple[int, Any]:
+    """
+    Order ids numerically when they look like ints ("2" < "10"), else as strings.
+    Lists (composite keys) compare element by element.
+    """
+    if isinstance(value, (list, tuple)):
+        return (2, tuple(sort_key(v) for v in value))
+    s = str(value)
+    if s.isdigit():
+        return (0, int(s))
+    return (1, s)
+
+
+def paginate(items: List[Any], key: Callable[[Any], Any], cursor: Optional[str], limit: Optional[int]) -> Tuple[List[Any], Optional[str]]:
+    """
+    Keyset pagination over `items`, which must already be sorted by `key`.
+    The cursor encodes the key of the last item returned, so pages stay stable
+    when records are added before it.
+    """
+    start = 0
+    if cursor:
+        after = decode_cursor(cursor)
+        keys = [sort_key(key(i)) for i in items]
+        start = bisect.bisect_right(keys, sort_key(after))
+    limit = max(1, min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE))
+    page = items[start:start + limit]
+    next_cursor = None
+    if start + limit < len(items) and page:
+        next_cursor = encode_cursor(key(page[-1]))
+    return page, next_cursor
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+def project(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """
+    Keep only `fields` of a record. Dotted names reach one level into nested
+    dicts, e.g. "email.subject" on a processed record.
+    """
+    if not fields:
+        return record
+    out: Dict[str, Any] = {}
+    for f in fields:
+        if "." in f:
+            outer, inner = f.split(".", 1)
+            value = record.get(outer)
+            if isinstance(value, dict) and inner in value:
+                out.setdefault(outer, {})[inner] = value[inner]
+        elif f in record:
+            out[f] = record[f]
+    return out
+
+
+def until_bound(until: Optional[str]) -> Optional[str]:
+    """
+    Largest timestamp string `until` admits: a bare date covers that whole day.
+    """
+    if not until:
+        return None
+    return until + "\uffff" if len(until) <= 10 else until
+
+
+def in_range(value: Optional[str], since: Optional[str], until: Optional[str]) -> bool:
+    """
+    ISO-8601 timestamp range check; since/until may be dates or full timestamps.
+    A bare-date `until` covers that whole day.
+    """
+    if not since and not until:
+        return True
+    if not value:
+        return False
+    if since and value < since:
+        return False
+    if until and value > until_bound(until):
+        return False
+    return True
+
+
+def etag_for(payload: bytes) -> str:
+    return '"' + hashlib.sha1(payload).hexdigest() + '"'
+
+
+def json_response(request: Request, payload: bytes, etag: Optional[str] = None) -> Response:
+    """
+    Serve pre-serialized JSON with an ETag; answer 304 when If-None-Match matches.
+    """
+    etag = etag or etag_for(payload)
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
+
+
+def dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode("utf-8")
@@ -2,7 +2,40 @@
 import os
 import json
 import re
-from typing import Optional, Dict, Any
+import threading
+import time
+from datetime import date
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
+from backend.model_registry import ModelRegistry
+from backend.cpu_backend import load_onnx_model, local_model_backend, local_model_threads, quantize_int8
+from backend.prefix_cache import PrefixCache
+from backend.constrained import constrained_enabled, decode_json, schema_for
+from backend.response_cache import ResponseCache, cache_enabled, cache_key
+from backend.extract import extract_actions, reference_date
+from backend.context import TokenCounter, build_context, context_budget
+from backend.prompts import render
+from backend.metrics import metrics, stage
+
+# ---- Metrics ----
+LLM_CALLS = metrics.counter(
+    "llm_calls_total", "Prompts answered, by backend (cache, local, mock, mock_fallback).", labels=("backend",)
+)
+LLM_TOKENS = metrics.counter("llm_generated_tokens_total", "New tokens generated by the local model.")
+LLM_TOKENS_PER_SECOND = metrics.histogram(
+    "llm_tokens_per_second",
+    "Local model throughput per generation call (micro-batch, constrained decode or stream).",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000),
+)
+
+AGENT_CONTEXT_TOKENS = metrics.counter(
+    "agent_context_tokens_total", "Email context tokens in agent prompts, sent vs. saved by the context builder.", labels=("kind",)
+)
+
+def _count_generated(tokens: int, seconds: float):
+    LLM_TOKENS.inc(tokens)
+    if seconds > 0:
+        LLM_TOKENS_PER_SECOND.observe(tokens / seconds)
 
 # ---- Local model loader (Hugging Face transformers) ----
 def use_local_model() -> bool:
@@ -11,44 +44,210 @@ def use_local_model() -> bool:
     """
     return os.environ.get("LOCAL_LLM", "0") == "1"
 
+def local_model_name() -> str:
+    return os.environ.get("LOCAL_MODEL_NAME", "distilgpt2")
+
 def _load_transformer_model(model_name: str = "distilgpt2"):
     """
     Load a transformers pipeline for text-generation.
     This function tries to use GPU if available and configured.
     """
-    try:
-        from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-        import torch
-    except Exception as e:
-        raise RuntimeError("transformers or torch not installed: " + str(e))
+    with stage("model_load"):
+        try:
+            from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+            import torch
+        except Exception as e:
+            raise RuntimeError("transformers or torch not installed: " + str(e))
 
-    # device
-    device = 0 if torch.cuda.is_available() else -1
+        # device
+        device = 0 if torch.cuda.is_available() else -1
+        # LOCAL_MODEL_BACKEND picks an optimized CPU path; the GPU always runs float16
+        backend = local_model_backend() if device == -1 else "torch"
+        threads = local_model_threads()
+        if threads and device == -1:
+            torch.set_num_threads(threads)
 
-    # load tokenizer and model
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    # for some tokenizers (e.g., LLaMA variants) you may need trust_remote_code=True
-    model = AutoModelForCausalLM.from_pretrained(model_name, device_map="auto" if device == 0 else None, torch_dtype=(torch.float16 if device == 0 else torch.float32), low_cpu_mem_usage=True)
-    gen = pipeline("text-generation", model=model, tokenizer=tokenizer, device=device)
+        # load tokenizer and model
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # batched generation pads on the left so every prompt ends where generation starts
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        model = None
+        if backend == "onnx":
+            try:
+                model = load_onnx_model(model_name, threads)
+            except Exception as e:
+                print("ONNX Runtime backend unavailable, using float32:", e)
+                backend = "torch"
+        if model is None:
+            # for some tokenizers (e.g., LLaMA variants) you may need trust_remote_code=True
+            model = AutoModelForCausalLM.from_pretrained(model_name, device_map="auto" if device == 0 else None, torch_dtype=(torch.float16 if device == 0 else torch.float32), low_cpu_mem_usage=True)
+        if backend == "int8":
+            model = quantize_int8(model)
+        gen = pipeline("text-generation", model=model, tokenizer=tokenizer, device=device)
+        gen.backend = backend
     return gen
 
-def call_local_model(prompt: str, max_tokens: int = 256, model_name: str = None) -> Optional[str]:
+def _reuses_kv(gen) -> bool:
+    # the prefix cache and constrained decoder drive the model's KV cache directly,
+    # which an ONNX Runtime session does not expose the same way
+    return getattr(gen, "backend", "torch") != "onnx"
+
+# one registry per process: each model name is loaded once and reused
+registry = ModelRegistry(loader=_load_transformer_model)
+# template preambles, prefilled once per model (see backend/prefix_cache.py)
+prefix_cache = PrefixCache()
+
+def warmup_local_model():
+    """
+    Load the configured local model up front (LOCAL_MODEL_WARMUP=eager).
+    With the default "lazy" the model loads on the first request instead.
+    """
+    if not use_local_model():
+        return
+    if os.environ.get("LOCAL_MODEL_WARMUP", "lazy").lower() != "eager":
+        return
+    registry.warmup([local_model_name()])
+
+def call_local_model(prompt: str, max_tokens: int = 256, model_name: str = None, template: Optional[str] = None) -> Optional[str]:
     """
     Try to generate text using a local HF model. Returns string output or None on failure.
     Set environment var LOCAL_MODEL_NAME to choose a model (default: distilgpt2).
     """
+    return call_local_model_batch([prompt], max_tokens=max_tokens, batch_size=1, model_name=model_name, templates=[template])[0]
+
+def call_local_model_batch(prompts: List[str], max_tokens: int = 256, batch_size: int = 8, model_name: str = None, templates: Optional[List[Optional[str]]] = None) -> List[Optional[str]]:
+    """
+    Generate for many prompts at once, running model.generate over micro-batches
+    of `batch_size`. Prompts rendered from the same template are batched
+    together so their cached preamble is reused. Like the pipeline, each output
+    is the prompt followed by its completion, except for templates with a known
+    output schema: those are decoded one at a time by the constrained JSON
+    decoder and return only the JSON. Returns None for prompts whose batch failed.
+    """
+    results: List[Optional[str]] = [None] * len(prompts)
+    if not prompts:
+        return results
+    templates = templates or [None] * len(prompts)
+    groups: Dict[Optional[str], List[int]] = {}
+    constrained = []
+    for i, (prompt, template) in enumerate(zip(prompts, templates)):
+        if schema_for(template):
+            constrained.append(i)
+        else:
+            groups.setdefault(prefix_cache.prefix_for(prompt, template), []).append(i)
     try:
-        model_name = model_name or os.environ.get("LOCAL_MODEL_NAME", "distilgpt2")
-        gen = _load_transformer_model(model_name)
-        out = gen(prompt, max_new_tokens=max_tokens, do_sample=True, temperature=0.7)
-        if isinstance(out, list) and len(out) > 0 and "generated_text" in out[0]:
-            return out[0]["generated_text"]
-        # fallback flatten
-        return str(out)
+        import torch
+        model_name = model_name or local_model_name()
+        with registry.acquire(model_name) as gen:
+            tok, model = gen.tokenizer, gen.model
+            if not _reuses_kv(gen):
+                groups = {None: list(range(len(prompts)))}
+                constrained = []
+            for i in constrained:
+                try:
+                    t0 = time.perf_counter()
+                    with stage("generate"):
+                        results[i] = "".join(_decode_constrained(gen, prompts[i], templates[i], max_tokens))
+                    _count_generated(len(tok(results[i]).input_ids), time.perf_counter() - t0)
+                except Exception as e:
+                    print("Local model constrained generation failed:", e)
+            for prefix, idx in groups.items():
+                for start in range(0, len(idx), batch_size):
+                    chunk = idx[start:start + batch_size]
+                    try:
+                        t0 = time.perf_counter()
+                        with stage("generate"):
+                            enc = prefix_cache.encode(gen, [prompts[i] for i in chunk], prefix)
+                            with torch.no_grad():
+                                out = model.generate(**enc, max_new_tokens=max_tokens, do_sample=True, temperature=0.7, pad_token_id=tok.pad_token_id)
+                        input_len = enc["input_ids"].shape[1]
+                        _count_generated(int((out[:, input_len:] != tok.pad_token_id).sum()), time.perf_counter() - t0)
+                        for j, i in enumerate(chunk):
+                            results[i] = prompts[i] + tok.decode(out[j, input_len:], skip_special_tokens=True)
+                    except Exception as e:
+                        print("Local model batch generation failed:", e)
     except Exception as e:
-        # do not raise — let caller fall back to mock
-        print("Local model generation failed:", e)
-        return None
+        print("Local model batch generation failed:", e)
+    return results
+
+def _decode_constrained(gen, prompt: str, template: str, max_tokens: int) -> Iterator[str]:
+    enc = prefix_cache.encode(gen, [prompt], prefix_cache.prefix_for(prompt, template))
+    return decode_json(gen, enc, schema_for(template), max_tokens=max_tokens, temperature=_GEN_PARAMS["temperature"])
+
+def _stop_on(*events: threading.Event):
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return any(e.is_set() for e in events)
+
+    return StoppingCriteriaList([_StopOnEvent()])
+
+def stream_local_model(
+    prompt: str,
+    max_tokens: int = 256,
+    model_name: str = None,
+    template: Optional[str] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[str]:
+    """
+    Yield new text from the local model as it is generated (prompt not echoed).
+    generate() runs in a helper thread feeding a TextIteratorStreamer; templates
+    with a known schema stream straight from the constrained decoder instead.
+    Setting `stop`, or closing the generator (a client that went away), ends
+    generation at the next token and releases the model.
+    Raises on failure so the caller can fall back to mock.
+    """
+    from transformers import TextIteratorStreamer
+    import torch
+
+    stop = stop or threading.Event()
+    # set once this generator is done with the output, however it ends
+    abandoned = threading.Event()
+    model_name = model_name or local_model_name()
+    with registry.acquire(model_name) as gen:
+        t0 = time.perf_counter()
+        pieces = []
+        if schema_for(template) and _reuses_kv(gen):
+            for text in _decode_constrained(gen, prompt, template, max_tokens):
+                if stop.is_set():
+                    return
+                pieces.append(text)
+                yield text
+            _count_generated(len(gen.tokenizer("".join(pieces)).input_ids), time.perf_counter() - t0)
+            return
+        tok, model = gen.tokenizer, gen.model
+        streamer = TextIteratorStreamer(tok, skip_prompt=True, skip_special_tokens=True)
+        enc = prefix_cache.encode(gen, [prompt], prefix_cache.prefix_for(prompt, template) if _reuses_kv(gen) else None)
+        errors = []
+
+        def _run():
+            try:
+                with torch.no_grad():
+                    model.generate(**enc, streamer=streamer, max_new_tokens=max_tokens, do_sample=True, temperature=0.7,
+                                   pad_token_id=tok.pad_token_id, stopping_criteria=_stop_on(stop, abandoned))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=_run, daemon=True)
+        worker.start()
+        try:
+            for text in streamer:
+                if stop.is_set():
+                    return
+                if text:
+                    pieces.append(text)
+                    yield text
+        finally:
+            # also on GeneratorExit: the model is not released while generate() still runs
+            abandoned.set()
+            worker.join()
+        if errors:
+            raise errors[0]
+        _count_generated(len(tok("".join(pieces)).input_ids), time.perf_counter() - t0)
 
 # ---- Mock helpers (will run when local model not available) ----
 def _simple_json_safe(s: str) -> str:
@@ -68,20 +267,9 @@ def _mock_categorize(email_text: str) -> Dict[str, str]:
         return {"category": "To-Do", "reason": "Contains a direct request for action."}
     return {"category": "Personal", "reason": "No clear request detected; treat as personal/info."}
 
-def _mock_extract_actions(email_text: str) -> list:
-    import re
-    t = email_text
-    tasks = []
-    if re.search(r'(please|kindly|could you|can you|need you to|we need)', t, re.I):
-        m = re.search(r'(?:please|kindly|could you|can you|we need to|we need)\s+([^\\.|\\n]+)', t, re.I)
-        if m:
-            task_text = m.group(1).strip()
-            tasks.append({"task": _simple_json_safe(task_text), "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
-    if re.search(r'(meet|meeting|schedule|proposed agenda|proposed time|availability)', t, re.I):
-        tasks.append({"task": "Schedule meeting / confirm time", "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
-    if re.search(r'(invoice|payment|due)', t, re.I):
-        tasks.append({"task": "Review invoice / arrange payment", "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
-    return tasks
+def _mock_extract_actions(email_text: str, reference: Optional[date] = None) -> list:
+    # relative deadlines ("by Friday") count from the email's date, not today
+    return extract_actions(email_text, reference)
 
 def _mock_draft_reply(email_text: str, user_instruction: Optional[str] = None) -> Dict[str, str]:
     t = email_text.lower()
@@ -100,33 +288,356 @@ def _mock_draft_reply(email_text: str, user_instruction: Optional[str] = None) -
         body_lines.append("Tone requested: " + user_instruction)
     return {"subject": subject, "body": " ".join(body_lines)}
 
+# ---- Response cache ----
+response_cache = ResponseCache()
+
+# sampling settings used by the local model; part of every cache key
+_GEN_PARAMS = {"do_sample": True, "temperature": 0.7}
+
+def _response_key(prompt: str, max_tokens: int, reference: Optional[date] = None) -> str:
+    model = local_model_name() if use_local_model() else "mock"
+    if use_local_model() and local_model_backend() != "torch":
+        # quantized / ONNX outputs differ from float32 ones
+        model += "@" + local_model_backend()
+    params = dict(_GEN_PARAMS, max_tokens=max_tokens, constrained=constrained_enabled())
+    if reference is not None:
+        # resolved deadlines depend on it
+        params["reference_date"] = reference.isoformat()
+    return cache_key(model, prompt, params)
+
 # ---- Public API ----
-def call_llm(prompt: str, max_tokens: int = 256) -> str:
+def call_llm(prompt: str, max_tokens: int = 256, template: Optional[str] = None, reference: Optional[date] = None) -> str:
     """
     Try local HF model if enabled. Otherwise use mock heuristics.
+    Outputs are cached by (model, prompt, params); `template` names the
+    Prompt Brain template the prompt was rendered from, for invalidation.
+    `reference` is the date relative deadlines are resolved against (the
+    email's, see extract.reference_date); it is part of the cache key.
     """
+    key = _response_key(prompt, max_tokens, reference) if cache_enabled() else None
+    if key:
+        hit = response_cache.get(key)
+        if hit is not None:
+            LLM_CALLS.inc(backend="cache")
+            return hit
+
     if use_local_model():
-        out = call_local_model(prompt, max_tokens=max_tokens)
+        out = call_local_model(prompt, max_tokens=max_tokens, template=template)
         if out:
+            LLM_CALLS.inc(backend="local")
+            if key:
+                response_cache.put(key, out, template)
             return out
+        # mock fallback output is not stored under the local model's key
+        LLM_CALLS.inc(backend="mock_fallback")
+        return _timed_mock(prompt, template, reference)
+
+    LLM_CALLS.inc(backend="mock")
+    out = _timed_mock(prompt, template, reference)
+    if key:
+        response_cache.put(key, out, template)
+    return out
+
+def call_llm_batch(
+    prompts: List[str],
+    max_tokens: int = 256,
+    batch_size: int = 8,
+    templates: Optional[List[Optional[str]]] = None,
+    references: Optional[List[Optional[date]]] = None,
+) -> List[str]:
+    """
+    Batched call_llm: cached prompts are answered directly, the rest go through
+    one local batched pass, with mock fallback per prompt.
+    """
+    templates = templates or [None] * len(prompts)
+    references = references or [None] * len(prompts)
+    outs: List[Optional[str]] = [None] * len(prompts)
+    keys: List[Optional[str]] = [None] * len(prompts)
+    if cache_enabled():
+        for i, p in enumerate(prompts):
+            keys[i] = _response_key(p, max_tokens, references[i])
+            outs[i] = response_cache.get(keys[i])
+
+    todo = [i for i, out in enumerate(outs) if out is None]
+    LLM_CALLS.inc(len(prompts) - len(todo), backend="cache")
+    local = use_local_model()
+    if local and todo:
+        gen_outs = call_local_model_batch(
+            [prompts[i] for i in todo],
+            max_tokens=max_tokens,
+            batch_size=batch_size,
+            templates=[templates[i] for i in todo],
+        )
+        for i, out in zip(todo, gen_outs):
+            if out:
+                LLM_CALLS.inc(backend="local")
+                outs[i] = out
+                if keys[i]:
+                    response_cache.put(keys[i], out, templates[i])
+    for i in todo:
+        if outs[i] is None:
+            LLM_CALLS.inc(backend="mock_fallback" if local else "mock")
+            outs[i] = _timed_mock(prompts[i], templates[i], references[i])
+            if keys[i] and not local:
+                response_cache.put(keys[i], outs[i], templates[i])
+    return outs
+
+def _timed_mock(prompt: str, template: Optional[str] = None, reference: Optional[date] = None) -> str:
+    with stage("generate"):
+        return _mock_llm(prompt, template, reference)
+
+def _chunks(text: str, size: int = 16) -> Iterator[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
 
-    pl = prompt.lower()
+def stream_llm(
+    prompt: str,
+    max_tokens: int = 256,
+    template: Optional[str] = None,
+    reference: Optional[date] = None,
+    stop: Optional[threading.Event] = None,
+) -> Iterator[str]:
+    """
+    Streaming call_llm: yields text pieces as they become available.
+    Cached and mock outputs are replayed in small chunks. The concatenated
+    pieces are the model's new text only (the prompt is not echoed).
+    Setting `stop` ends local generation early; a stopped output is not cached.
+    """
+    key = _response_key("stream\0" + prompt, max_tokens, reference) if cache_enabled() else None
+    if key:
+        hit = response_cache.get(key)
+        if hit is not None:
+            LLM_CALLS.inc(backend="cache")
+            yield from _chunks(hit)
+            return
+
+    if use_local_model():
+        pieces = []
+        try:
+            for piece in stream_local_model(prompt, max_tokens=max_tokens, template=template, stop=stop):
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            print("Local model streaming failed:", e)
+            if pieces:
+                return
+        else:
+            if stop is not None and stop.is_set():
+                return
+            if key and pieces:
+                response_cache.put(key, "".join(pieces), template)
+            if pieces:
+                LLM_CALLS.inc(backend="local")
+                return
+        # nothing was generated: fall back to mock, uncached
+        LLM_CALLS.inc(backend="mock_fallback")
+        yield from _chunks(_timed_mock(prompt, template, reference))
+        return
+
+    LLM_CALLS.inc(backend="mock")
+    out = _timed_mock(prompt, template, reference)
+    if key:
+        response_cache.put(key, out, template)
+    yield from _chunks(out)
+
+# ---- Prompt sniffing for the mock backend (compiled once) ----
+# the email inside a rendered Prompt Brain template: "Email:" / "Context:" up to the next section
+_EMAIL_SECTION_RE = re.compile(
+    r"(?:^|\n)(?:email|context):[ \t]*\n(?P<text>.*?)(?=\n[ \t]*\n(?:respond|user instruction|return)\b|\Z)",
+    re.I | re.S,
+)
+# agent prompts append the metadata JSON after the body (with literal "\n" escapes)
+_METADATA_RE = re.compile(r"(?:\\n|\n)*Full email metadata:.*\Z", re.S)
+# the instruction on the same or the next line; an unfilled {user_instruction} or an empty one is no match
+_USER_INSTRUCTION_RE = re.compile(r"user instruction[ \t]*:?[ \t]*\n?[ \t]*([^\s{:][^\n{]*)", re.I)
+
+def _email_from_prompt(prompt: str) -> str:
+    """
+    The email text a prompt was rendered with, so the mock heuristics do not
+    react to words in the template's own instructions. Whole prompt if unknown.
+    """
+    m = _EMAIL_SECTION_RE.search(prompt)
+    text = m.group("text") if m else prompt
+    return _METADATA_RE.sub("", text).strip()
+
+# Prompt Brain template -> the kind of answer the mock gives for it
+_MOCK_TASKS = {
+    "triage_prompt": "triage",
+    "categorization_prompt": "category",
+    "action_prompt": "actions",
+    "auto_reply_prompt": "reply",
+}
+
+def _mock_task(prompt: str, template: Optional[str]) -> Optional[str]:
+    """
+    What the mock should answer: decided by the template name when known,
+    otherwise by the prompt's own instructions (never the email in it, which
+    may well say "triage" or "reply").
+    """
+    if template in _MOCK_TASKS:
+        return _MOCK_TASKS[template]
+    email_text = _email_from_prompt(prompt)
+    pl = (prompt.replace(email_text, " ") if email_text != prompt else prompt).lower()
+    if "triage" in pl:
+        return "triage"
     if "categorize" in pl or "category" in pl:
-        return json.dumps(_mock_categorize(prompt))
+        return "category"
     if "extract" in pl and ("task" in pl or "action" in pl):
-        return json.dumps(_mock_extract_actions(prompt))
+        return "actions"
     if "draft" in pl or "reply" in pl or "auto-reply" in pl:
-        # try to find user instruction
-        ui = None
-        m = re.search(r'user instruction[:\\s]*([^\\n\\{]+)', prompt, re.I)
-        if m:
-            ui = m.group(1).strip()
-        return json.dumps(_mock_draft_reply(prompt, user_instruction=ui))
+        return "reply"
+    return None
+
+def _user_instruction(prompt: str) -> Optional[str]:
+    m = _USER_INSTRUCTION_RE.search(prompt)
+    return (m.group(1).strip() or None) if m else None
+
+def _mock_llm(prompt: str, template: Optional[str] = None, reference: Optional[date] = None) -> str:
+    task = _mock_task(prompt, template)
+    if task == "triage":
+        email_text = _email_from_prompt(prompt)
+        return json.dumps({
+            "category": _mock_categorize(email_text),
+            "actions": _mock_extract_actions(email_text, reference),
+            "reply": _mock_draft_reply(email_text, user_instruction=_user_instruction(prompt)),
+        })
+    if task == "category":
+        return json.dumps(_mock_categorize(_email_from_prompt(prompt)))
+    if task == "actions":
+        return json.dumps(_mock_extract_actions(_email_from_prompt(prompt), reference))
+    if task == "reply":
+        return json.dumps(_mock_draft_reply(_email_from_prompt(prompt), user_instruction=_user_instruction(prompt)))
     return '"MOCK_LLM: no match for prompt; implement local model for better output."'
 
-def agent_query(email: Dict[str, Any], prompt_template: str, user_instruction: Optional[str] = None) -> str:
-    text = email.get("body", "") + "\\n\\nFull email metadata:\\n" + json.dumps(email)
-    prompt = prompt_template.replace("{email_text}", text)
-    if user_instruction is not None:
-        prompt = prompt.replace("{user_instruction}", user_instruction)
-    return call_llm(prompt)
+def _token_counter() -> Tuple[TokenCounter, Optional[int]]:
+    """
+    Counter for the active model's tokenizer and the model's context length;
+    an estimating counter and no limit for the mock LLM.
+    """
+    if use_local_model():
+        name = local_model_name()
+        try:
+            gen = registry.get(name)
+            config = gen.model.config
+            limit = getattr(config, "max_position_embeddings", None) or getattr(config, "n_positions", None)
+            return TokenCounter(gen.tokenizer, name), limit
+        except Exception as e:
+            print("Context builder: tokenizer unavailable, estimating token counts:", e)
+    return TokenCounter(), None
+
+def agent_prompt(
+    email: Dict[str, Any],
+    prompt_template: str,
+    user_instruction: Optional[str] = None,
+    related: Optional[List[Dict[str, Any]]] = None,
+    template: Optional[str] = None,
+    max_tokens: int = 256,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Render an agent prompt with its email context fitted to the template's
+    token budget (and to what the model's context window leaves after the
+    template and `max_tokens` new tokens). Returns (prompt, context stats).
+    """
+    with stage("render"):
+        counter, limit = _token_counter()
+        budget = context_budget(template)
+        if limit:
+            room = limit - max_tokens - counter.count(render(prompt_template, email_text="", user_instruction=user_instruction or ""))
+            budget = max(1, min(budget, room)) if budget else max(1, room)
+        text, stats = build_context(email, counter, budget, related)
+        prompt = render(prompt_template, email_text=text, user_instruction=user_instruction)
+    AGENT_CONTEXT_TOKENS.inc(stats["tokens"], kind="sent")
+    AGENT_CONTEXT_TOKENS.inc(stats["saved_tokens"], kind="saved")
+    return prompt, stats
+
+def agent_query(email: Dict[str, Any], prompt_template: str, user_instruction: Optional[str] = None, template: Optional[str] = None, related: Optional[List[Dict[str, Any]]] = None) -> str:
+    prompt, _ = agent_prompt(email, prompt_template, user_instruction, related, template)
+    return call_llm(prompt, template=template, reference=reference_date(email.get("timestamp")))
+
+def agent_query_stream(email: Dict[str, Any], prompt_template: str, user_instruction: Optional[str] = None, template: Optional[str] = None, related: Optional[List[Dict[str, Any]]] = None) -> Iterator[str]:
+    prompt, _ = agent_prompt(email, prompt_template, user_instruction, related, template)
+    return stream_llm(prompt, template=template, reference=reference_date(email.get("timestamp")))
+
+# ---- Single-pass triage ----
+_JSON_START_RE = re.compile(r"[\[{]")
+_decoder = json.JSONDecoder()
+
+# section of the triage object -> (per-task template, validity check)
+TRIAGE_SECTIONS = {
+    "category": ("categorization_prompt", lambda v: isinstance(v, dict) and isinstance(v.get("category"), str)),
+    "actions": ("action_prompt", lambda v: isinstance(v, list)),
+    "reply": ("auto_reply_prompt", lambda v: isinstance(v, dict) and "subject" in v and "body" in v),
+}
+
+def parse_json_lenient(text: str, prompt: Optional[str] = None) -> Any:
+    """
+    First JSON object/array in model output. An echoed prompt (the local
+    pipeline returns prompt + completion) is skipped first, and surrounding
+    prose or trailing text is ignored. Returns None if nothing parses.
+    """
+    if not text:
+        return None
+    if prompt and text.startswith(prompt):
+        text = text[len(prompt):]
+    for m in _JSON_START_RE.finditer(text):
+        try:
+            value, _ = _decoder.raw_decode(text, m.start())
+            return value
+        except ValueError:
+            continue
+    return None
+
+def _render(template: str, email_text: str, user_instruction: Optional[str] = None) -> str:
+    return render(template, email_text=email_text, user_instruction=user_instruction or "")
+
+def triage_batch(emails: List[Dict[str, Any]], prompts: Dict[str, str], user_instruction: Optional[str] = None, batch_size: int = 8) -> List[Dict[str, Any]]:
+    """
+    Category, actions and reply for each email from one combined generation
+    (the "triage_prompt" template). Sections that are missing or fail to parse
+    are re-asked with their own per-task templates, all in one batched pass.
+
+    Returns per email {"category_output", "action_output", "reply_output",
+    "fallbacks"}: the three outputs as JSON strings, plus the sections that
+    needed a per-task prompt.
+    """
+    with stage("render"):
+        triage_prompts = [_render(prompts["triage_prompt"], e["body"], user_instruction) for e in emails]
+    references = [reference_date(e.get("timestamp")) for e in emails]
+    outs = call_llm_batch(triage_prompts, batch_size=batch_size, templates=["triage_prompt"] * len(emails), references=references)
+
+    sections: List[Dict[str, Any]] = []
+    retry = []  # (email index, section name, prompt)
+    for i, (prompt, out) in enumerate(zip(triage_prompts, outs)):
+        with stage("parse"):
+            parsed = parse_json_lenient(out, prompt)
+        parsed = parsed if isinstance(parsed, dict) else {}
+        got = {}
+        for name, (template_key, valid) in TRIAGE_SECTIONS.items():
+            if valid(parsed.get(name)):
+                got[name] = json.dumps(parsed[name])
+            else:
+                retry.append((i, name, _render(prompts[template_key], emails[i]["body"], user_instruction)))
+        sections.append(got)
+
+    if retry:
+        retry_outs = call_llm_batch(
+            [p for _, _, p in retry],
+            batch_size=batch_size,
+            templates=[TRIAGE_SECTIONS[name][0] for _, name, _ in retry],
+            references=[references[i] for i, _, _ in retry],
+        )
+        for (i, name, _), out in zip(retry, retry_outs):
+            sections[i][name] = out
+
+    return [
+        {
+            "category_output": got["category"],
+            "action_output": got["actions"],
+            "reply_output": got["reply"],
+            "fallbacks": sorted(n for j, n, _ in retry if j == i),
+        }
+        for i, got in enumerate(sections)
+    ]
+
+def triage(email: Dict[str, Any], prompts: Dict[str, str], user_instruction: Optional[str] = None) -> Dict[str, Any]:
+    return triage_batch([email], prompts, user_instruction=user_instruction)[0]
@@ -0,0 +1,188 @@
+# backend/metrics.py
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# seconds; wide enough for both a cache hit and a CPU generation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def server_timing_enabled() -> bool:
+    """
+    Per-request Server-Timing response header, on with SERVER_TIMING=1.
+    """
+    return os.environ.get("SERVER_TIMING", "0") == "1"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        # an unlabelled counter reports 0 before its first increment
+        self._values: Dict[Tuple, float] = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[Tuple, List] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, row in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, row):
+                    le = 'le="%s"' % _num(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+# a collector returns (name, type, help, [(labels dict, value), ...]) tuples
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics in the Prometheus text format (no client library).
+
+    Counters and histograms are updated on the hot path; collectors turn the
+    stats() of the caches, model registry, classifier and job queue into
+    samples at scrape time.
+    """
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Collector] = []
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn: Collector):
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print("Metrics collector failed:", e)
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    names = tuple(labels)
+                    lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "email_agent_stage_seconds",
+    "Time spent per processing stage (load_json, inbox_load, inbox_extend, render, model_load, generate, parse, store_write).",
+    labels=("stage",),
+)
+
+# ---- Per-request stage timings (Server-Timing) ----
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def begin_request() -> List[Tuple[str, float]]:
+    """
+    Start collecting stage timings for the current request; returns the list
+    stage() appends (name, seconds) to.
+    """
+    timings: List[Tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        STAGE_SECONDS.observe(seconds, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    Server-Timing value: summed duration per stage (ms) plus the total.
+    """
+    per_stage: Dict[str, float] = {}
+    for name, seconds in timings:
+        per_stage[name] = per_stage.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in per_stage.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
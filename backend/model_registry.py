@@ -0,0 +1,185 @@
+# backend/model_registry.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+
+def memory_budget_bytes() -> int:
+    """
+    Memory budget for resident local models, from LOCAL_MODEL_MEMORY_MB.
+    0 (the default) means no budget: models stay loaded until evicted by hand.
+    """
+    try:
+        mb = float(os.environ.get("LOCAL_MODEL_MEMORY_MB", "0"))
+    except ValueError:
+        mb = 0
+    return int(mb * 1024 * 1024)
+
+
+def estimate_model_bytes(gen: Any) -> int:
+    """
+    Rough resident size of a loaded pipeline: parameters + buffers of its model,
+    plus the packed weights of int8-quantized layers (not parameters).
+    """
+    model = getattr(gen, "model", None)
+    if model is None:
+        return 0
+    total = 0
+    try:
+        for t in list(model.parameters()) + list(model.buffers()):
+            total += t.numel() * t.element_size()
+        for m in model.modules():
+            if hasattr(m, "_packed_params") and callable(getattr(m, "weight", None)):
+                w = m.weight()
+                total += w.numel() * w.element_size()
+    except Exception:
+        return 0
+    return total
+
+
+class _Entry:
+    def __init__(self, name: str, gen: Any, nbytes: int, load_seconds: float):
+        self.name = name
+        self.gen = gen
+        self.nbytes = nbytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+        # one generation at a time per model; pipelines are not thread-safe
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded text-generation pipelines, keyed by model name.
+
+    Each model is loaded once; concurrent requests for a model that is still
+    loading wait for that load instead of starting their own. When the total
+    estimated size goes over the memory budget, least recently used models
+    are dropped.
+    """
+
+    def __init__(self, loader: Callable[[str], Any], budget_bytes: Optional[int] = None):
+        self._loader = loader
+        self._budget = budget_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @property
+    def budget_bytes(self) -> int:
+        return memory_budget_bytes() if self._budget is None else self._budget
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            lock = self._load_locks.get(name)
+            if lock is None:
+                lock = self._load_locks[name] = threading.Lock()
+            return lock
+
+    def _lookup(self, name: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                entry.last_used = time.time()
+                entry.uses += 1
+                self.hits += 1
+            return entry
+
+    def _entry(self, name: str) -> _Entry:
+        entry = self._lookup(name)
+        if entry is not None:
+            return entry
+        with self._load_lock(name):
+            # another thread may have finished loading while we waited
+            entry = self._lookup(name)
+            if entry is not None:
+                return entry
+            t0 = time.perf_counter()
+            gen = self._loader(name)
+            entry = _Entry(name, gen, estimate_model_bytes(gen), time.perf_counter() - t0)
+            entry.uses = 1
+            with self._lock:
+                self._entries[name] = entry
+                self.loads += 1
+                self._evict_over_budget(keep=name)
+            return entry
+
+    def _evict_over_budget(self, keep: str):
+        # caller holds self._lock
+        budget = self.budget_bytes
+        if budget <= 0:
+            return
+        total = sum(e.nbytes for e in self._entries.values())
+        for name in list(self._entries.keys()):
+            if total <= budget:
+                break
+            if name == keep:
+                continue
+            total -= self._entries.pop(name).nbytes
+            self.evictions += 1
+            print(f"Model registry: evicted {name} (over {budget} byte budget)")
+
+    def get(self, name: str) -> Any:
+        """
+        Return the pipeline for `name`, loading it on first use.
+        """
+        return self._entry(name).gen
+
+    @contextmanager
+    def acquire(self, name: str):
+        """
+        Yield the pipeline for `name` while holding its generation lock.
+        An eviction during use only drops the registry's reference.
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            yield entry.gen
+
+    def warmup(self, names: List[str]):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Model registry: warmup of {name} failed:", e)
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            return self._entries.pop(name, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": sum(e.nbytes for e in self._entries.values()),
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "models": [
+                    {
+                        "name": e.name,
+                        "backend": getattr(e.gen, "backend", None),
+                        "bytes": e.nbytes,
+                        "load_seconds": round(e.load_seconds, 3),
+                        "uses": e.uses,
+                        "last_used": e.last_used,
+                    }
+                    for e in self._entries.values()
+                ],
+            }
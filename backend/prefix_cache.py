@@ -0,0 +1,154 @@
+# backend/prefix_cache.py
+import copy
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# "{email_text}", "{user_instruction}", ... but not JSON examples like {"category": ...}
+_PLACEHOLDER_RE = re.compile(r"\{[a-z_]+\}")
+
+
+def prefix_cache_enabled() -> bool:
+    """
+    Prefix KV caching for the local model is on unless PREFIX_CACHE=0.
+    """
+    return os.environ.get("PREFIX_CACHE", "1") != "0"
+
+
+def _max_entries() -> int:
+    try:
+        return max(1, int(os.environ.get("PREFIX_CACHE_MAX_ENTRIES", "16")))
+    except ValueError:
+        return 16
+
+
+def template_prefix(template: str) -> str:
+    """
+    The static preamble of a template: everything before its first placeholder.
+    """
+    m = _PLACEHOLDER_RE.search(template or "")
+    return template[:m.start()] if m else ""
+
+
+class PrefixCache:
+    """
+    Past key/values of each Prompt Brain template's fixed preamble.
+
+    The preamble is run through the model once per (model, template text);
+    later prompts rendered from that template only prefill their own suffix.
+    Entries hang off the loaded pipeline, so they go away when the model
+    registry drops the model, and a template edit replaces its entry.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self._max_entries = max_entries
+        self._prefixes: Dict[str, str] = {}  # template name -> preamble text
+        self._entries: "weakref.WeakKeyDictionary[Any, OrderedDict]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.invalidations = 0
+
+    def sync_templates(self, templates: Dict[str, str]):
+        """
+        Record each template's preamble; an edited preamble drops the old entry.
+        """
+        with self._lock:
+            for name, text in templates.items():
+                if not isinstance(text, str):
+                    continue
+                prefix = template_prefix(text)
+                old = self._prefixes.get(name)
+                if old == prefix:
+                    continue
+                self._prefixes[name] = prefix
+                if old is not None:
+                    self.invalidations += 1
+                    for entries in self._entries.values():
+                        entries.pop(old, None)
+
+    def prefix_for(self, prompt: str, template: Optional[str]) -> Optional[str]:
+        if not template or not prefix_cache_enabled():
+            return None
+        prefix = self._prefixes.get(template)
+        return prefix if prefix and prompt.startswith(prefix) else None
+
+    def _entry(self, gen: Any, prefix: str) -> Tuple[List[int], Any]:
+        # caller holds the model's generation lock
+        import torch
+
+        with self._lock:
+            entries = self._entries.setdefault(gen, OrderedDict())
+            entry = entries.get(prefix)
+            if entry is not None:
+                entries.move_to_end(prefix)
+                return entry
+        ids = gen.tokenizer(prefix).input_ids
+        with torch.no_grad():
+            past = gen.model(torch.tensor([ids], device=gen.model.device), use_cache=True).past_key_values
+        entry = (ids, past)
+        with self._lock:
+            self.builds += 1
+            entries[prefix] = entry
+            limit = self._max_entries or _max_entries()
+            while len(entries) > limit:
+                entries.popitem(last=False)
+        return entry
+
+    def encode(self, gen: Any, prompts: List[str], prefix: Optional[str]) -> Dict[str, Any]:
+        """
+        generate() inputs for prompts that all start with `prefix`.
+
+        With a cached preamble the batch is laid out as [prefix][pad...][suffix]
+        with the padding masked out, and a copy of the preamble's key/values is
+        passed along so only the suffixes are prefilled. Falls back to plain
+        left-padded encoding when there is no usable prefix (e.g. the tokens
+        do not split cleanly at the preamble boundary).
+        """
+        import torch
+
+        tok, device = gen.tokenizer, gen.model.device
+        if prefix:
+            prefix_ids, past = self._entry(gen, prefix)
+            n = len(prefix_ids)
+            full = [tok(p).input_ids for p in prompts]
+            if n and all(ids[:n] == prefix_ids and len(ids) > n for ids in full):
+                suffixes = [ids[n:] for ids in full]
+                width = max(len(s) for s in suffixes)
+                pad = tok.pad_token_id
+                input_ids = [prefix_ids + [pad] * (width - len(s)) + s for s in suffixes]
+                mask = [[1] * n + [0] * (width - len(s)) + [1] * len(s) for s in suffixes]
+                past = copy.deepcopy(past)
+                if len(prompts) > 1:
+                    past.batch_repeat_interleave(len(prompts))
+                with self._lock:
+                    self.hits += len(prompts)
+                return {
+                    "input_ids": torch.tensor(input_ids, device=device),
+                    "attention_mask": torch.tensor(mask, device=device),
+                    "past_key_values": past,
+                }
+        with self._lock:
+            self.misses += len(prompts)
+        return dict(tok(prompts, return_tensors="pt", padding=True).to(device))
+
+    def clear(self):
+        with self._lock:
+            self._entries = weakref.WeakKeyDictionary()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = sum(len(e) for e in self._entries.values())
+        return {
+            "enabled": prefix_cache_enabled(),
+            "templates": len(self._prefixes),
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "invalidations": self.invalidations,
+        }
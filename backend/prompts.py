@@ -0,0 +1,187 @@
+# backend/prompts.py
+import hashlib
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from backend.metrics import stage
+
+_PLACEHOLDER_RE = re.compile(r"\{([a-z_]+)\}")
+
+
+class CompiledTemplate:
+    """
+    A Prompt Brain template split once into static text and placeholders;
+    render() is a single join. Placeholders without a value are left as they
+    are, and values are never scanned for placeholders themselves.
+    """
+
+    __slots__ = ("text", "parts", "fields")
+
+    def __init__(self, text: str):
+        self.text = text
+        # even indexes: static text, odd indexes: placeholder names
+        self.parts: List[str] = _PLACEHOLDER_RE.split(text)
+        self.fields = frozenset(self.parts[1::2])
+
+    def render(self, **values: Optional[str]) -> str:
+        parts = self.parts
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            value = values.get(parts[i])
+            out.append("{" + parts[i] + "}" if value is None else value)
+            out.append(parts[i + 1])
+        return "".join(out)
+
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> CompiledTemplate:
+    return CompiledTemplate(text or "")
+
+
+def render(text: str, **values: Optional[str]) -> str:
+    """
+    Fill a template's placeholders; the split is cached per template text.
+    """
+    return compile_template(text).render(**values)
+
+
+class PromptSet(Mapping):
+    """
+    One immutable version of the Prompt Brain: template name -> text, the
+    compiled templates and the version number they were saved under.
+    """
+
+    def __init__(self, templates: Dict[str, str], version: int):
+        self.templates = dict(templates)
+        self.version = version
+        self.compiled = {k: compile_template(v) for k, v in self.templates.items() if isinstance(v, str)}
+
+    def __getitem__(self, name: str) -> str:
+        return self.templates[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.templates)
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def render(self, name: str, **values: Optional[str]) -> str:
+        return self.compiled[name].render(**values)
+
+
+def _content_hash(templates: Dict[str, str]) -> str:
+    return hashlib.sha1(json.dumps(templates, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PromptService:
+    """
+    The Prompt Brain templates, loaded once and swapped atomically.
+
+    The version number lives in the store's meta table and goes up with
+    every save that changes a template, and also when the file was edited
+    by hand (noticed by mtime/size, like the inbox). Listeners (the response
+    and prefix caches) are told about each new version once.
+    """
+
+    def __init__(self, path: Path, store):
+        self.path = Path(path)
+        self.store = store
+        self._lock = threading.Lock()
+        self._current: Optional[PromptSet] = None
+        self._signature: Optional[Tuple] = None
+        self._listeners: List[Callable[[PromptSet], Any]] = []
+        self.reloads = 0
+        self.saves = 0
+
+    def on_change(self, fn: Callable[[PromptSet], Any]):
+        self._listeners.append(fn)
+
+    def _file_signature(self) -> Optional[Tuple]:
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _bump(self, templates: Dict[str, str]) -> int:
+        """
+        Version for `templates`: the stored one if its content is unchanged,
+        else the next one. Records the new content hash.
+        """
+        h = _content_hash(templates)
+        with self.store.transaction() as db:
+            rows = dict(db.execute("SELECT key, value FROM meta WHERE key IN ('prompts_version', 'prompts_hash')").fetchall())
+            version = int(rows.get("prompts_version") or 0)
+            if rows.get("prompts_hash") != h:
+                version += 1
+                self.store.set_meta("prompts_version", str(version), db=db)
+                self.store.set_meta("prompts_hash", h, db=db)
+        return version
+
+    def _swap(self, templates: Dict[str, str], signature: Optional[Tuple]) -> PromptSet:
+        # caller holds self._lock
+        old = self._current
+        current = PromptSet(templates, self._bump(templates))
+        self._current = current
+        self._signature = signature
+        if old is None or old.version != current.version or old.templates != current.templates:
+            for fn in self._listeners:
+                try:
+                    fn(current)
+                except Exception as e:
+                    print("Prompt listener failed:", e)
+        return current
+
+    def current(self) -> PromptSet:
+        """
+        The live templates; re-read only if the file changed on disk.
+        """
+        sig = self._file_signature()
+        current = self._current
+        if current is not None and sig == self._signature:
+            return current
+        with self._lock:
+            if self._current is not None and sig == self._signature:
+                return self._current
+            with stage("load_json"):
+                templates = json.loads(self.path.read_text()) if sig is not None else {}
+            self.reloads += 1
+            return self._swap(templates or {}, sig)
+
+    def save(self, updates: Dict[str, Any]) -> PromptSet:
+        """
+        Merge `updates` (name -> template text) into the templates, write the
+        file atomically and swap in the new version. Names not mentioned keep
+        their text. Raises ValueError for anything that is not a string.
+        """
+        if not isinstance(updates, dict) or not updates:
+            raise ValueError("expected a JSON object of template name -> text")
+        bad = [k for k, v in updates.items() if not isinstance(k, str) or not isinstance(v, str)]
+        if bad:
+            raise ValueError(f"template text must be a string: {', '.join(map(str, bad))}")
+        self.current()
+        with self._lock:
+            current = self._current
+            templates = dict(current.templates, **updates)
+            if templates == current.templates:
+                return current
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(templates, indent=2) + "\n")
+            os.replace(tmp, self.path)
+            self.saves += 1
+            return self._swap(templates, self._file_signature())
+
+    def stats(self) -> Dict[str, Any]:
+        current = self._current
+        return {
+            "version": current.version if current is not None else None,
+            "templates": sorted(current.templates) if current is not None else [],
+            "reloads": self.reloads,
+            "saves": self.saves,
+        }
@@ -0,0 +1,167 @@
+# backend/response_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from backend.config import LLM_CACHE_PATH
+
+
+def cache_enabled() -> bool:
+    """
+    Response caching is on unless LLM_CACHE=0.
+    """
+    return os.environ.get("LLM_CACHE", "1") != "0"
+
+
+def cache_key(model: str, prompt: str, params: Dict[str, Any]) -> str:
+    """
+    Content address of one generation: model name, rendered prompt and generation params.
+    """
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    h.update(b"\0")
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def template_hash(template: str) -> str:
+    return hashlib.sha256((template or "").encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent LLM response cache in a small SQLite file.
+
+    Entries carry the name of the Prompt Brain template they were rendered
+    from, so editing one template drops only that template's entries.
+    Eviction is by TTL and by least recent access once max_entries is reached.
+    """
+
+    def __init__(self, path: Path = None, max_entries: int = None, ttl_seconds: float = None):
+        self.path = Path(path or LLM_CACHE_PATH)
+        self.max_entries = max_entries if max_entries is not None else int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # caller holds self._lock
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, template TEXT, output TEXT NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_template ON responses(template)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS templates (name TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT output, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            output, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                self.evictions += 1
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits += 1
+            return output
+
+    def put(self, key: str, output: str, template: Optional[str] = None):
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, template, output, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, template, output, now, now),
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        if self.ttl_seconds > 0:
+            cur = db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.evictions += max(cur.rowcount, 0)
+        if self.max_entries > 0:
+            (count,) = db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    def sync_templates(self, templates: Dict[str, str]) -> int:
+        """
+        Record the current text of each named template. Entries rendered from a
+        template whose text changed since the last sync are dropped.
+        Returns the number of invalidated entries.
+        """
+        dropped = 0
+        with self._lock:
+            db = self._db()
+            known = dict(db.execute("SELECT name, hash FROM templates").fetchall())
+            for name, text in templates.items():
+                if not isinstance(text, str):
+                    continue
+                h = template_hash(text)
+                if known.get(name) == h:
+                    continue
+                if name in known:
+                    cur = db.execute("DELETE FROM responses WHERE template = ?", (name,))
+                    dropped += max(cur.rowcount, 0)
+                db.execute("INSERT OR REPLACE INTO templates (name, hash) VALUES (?, ?)", (name, h))
+            db.commit()
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM responses")
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (entries,) = self._db().execute("SELECT COUNT(*) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": cache_enabled(),
+            "path": str(self.path),
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,677 @@
+# backend/search_index.py
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:  # numpy is optional; without it there is no full-text search
+    np = None
+
+from backend.metrics import stage
+
+# BM25 parameters and per-field term weights (a simple BM25F)
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {"subject": 2.0, "sender": 1.5, "body": 1.0, "category": 2.0, "tasks": 1.0}
+MAX_TERM_LEN = 40
+# a prefix query scores at most this many of its most frequent expansions
+MAX_PREFIX_TERMS = 128
+# the in-memory delta is merged into the on-disk segment past this many docs
+MERGE_MIN_DOCS = 5000
+KINDS = ("email", "draft")
+
+_TOKEN_RE = re.compile(r"\w+")
+_QUERY_RE = re.compile(r"(\w+)(\*?)")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its me my no not of on or our so that the "
+    "this to was we were will with you your".split()
+)
+
+
+def text_search_enabled() -> bool:
+    """
+    Full-text search, on unless TEXT_SEARCH=0 (and needs numpy).
+    """
+    return np is not None and os.environ.get("TEXT_SEARCH", "1") != "0"
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) <= MAX_TERM_LEN and t not in _STOPWORDS]
+
+
+def parse_query(q: str) -> List[Tuple[str, bool]]:
+    """
+    (term, is_prefix) for each word of a query; "budg*" is a prefix query.
+    """
+    out = []
+    for term, star in _QUERY_RE.findall((q or "").lower()):
+        if len(term) > MAX_TERM_LEN or (term in _STOPWORDS and not star):
+            continue
+        out.append((term, bool(star)))
+    return out
+
+
+def ts_number(value: Optional[str], fill: str = "0") -> int:
+    """
+    An ISO-8601 timestamp as a sortable integer (YYYYMMDDhhmmss); -1 if missing.
+    """
+    digits = re.sub(r"\D", "", (value or "")[:19])
+    return int(digits.ljust(14, fill)[:14]) if digits else -1
+
+
+def snippet(text: Optional[str], q: str, width: int = 160) -> str:
+    """
+    Up to `width` characters of `text` around the first query term it contains
+    (the start of the text when none does).
+    """
+    text = " ".join((text or "").split())
+    if len(text) <= width:
+        return text
+    start = 0
+    lowered = text.lower()
+    for term, prefix in parse_query(q):
+        m = re.search(r"\b" + re.escape(term) + ("" if prefix else r"\b"), lowered)
+        if m:
+            start = max(0, m.start() - width // 4)
+            break
+    end = min(len(text), start + width)
+    start = max(0, end - width)
+    return ("…" if start else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+def _hash64(text: str) -> int:
+    return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def processed_fields(record: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    (category label, task text) from a processed record's raw outputs.
+    """
+    if not isinstance(record, dict):
+        return "", ""
+    category, tasks = "", []
+    try:
+        parsed = json.loads(record.get("category_output") or "")
+        if isinstance(parsed, dict):
+            category = str(parsed.get("category") or "")
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = json.loads(record.get("action_output") or "")
+        for item in parsed if isinstance(parsed, list) else []:
+            if isinstance(item, dict):
+                tasks.extend(str(item.get(k)) for k in ("task", "deadline", "assignee", "context") if item.get(k))
+    except (TypeError, ValueError):
+        pass
+    return category, " ".join(tasks)
+
+
+def email_document(email: Dict[str, Any], record: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    category, tasks = processed_fields(record)
+    return {
+        "kind": "email",
+        "key": "email:" + json.dumps(email.get("id")),
+        "subject": email.get("subject"),
+        "body": email.get("body"),
+        "sender": email.get("sender"),
+        "category": category,
+        "tasks": tasks,
+        "timestamp": email.get("timestamp"),
+    }
+
+
+def draft_document(draft: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "kind": "draft",
+        "key": "draft:" + str(draft.get("id")),
+        "subject": draft.get("subject"),
+        "body": draft.get("body"),
+        "sender": "",
+        "category": "",
+        "tasks": "",
+        "timestamp": draft.get("updated_at") or draft.get("created_at"),
+    }
+
+
+def draft_hash(draft: Dict[str, Any]) -> int:
+    return _hash64(json.dumps([draft.get(k) for k in ("subject", "body", "updated_at", "created_at")]))
+
+
+class _Column:
+    """
+    A growable numpy array (capacity doubles), one value per document slot.
+    """
+
+    def __init__(self, dtype, values=None):
+        values = np.asarray(values if values is not None else [], dtype=dtype)
+        self.data = np.empty(max(1024, len(values)), dtype=dtype)
+        self.data[:len(values)] = values
+        self.n = len(values)
+
+    def append(self, value):
+        if self.n == len(self.data):
+            grown = np.empty(len(self.data) * 2, dtype=self.data.dtype)
+            grown[:self.n] = self.data[:self.n]
+            self.data = grown
+        self.data[self.n] = value
+        self.n += 1
+
+    @property
+    def values(self):
+        return self.data[:self.n]
+
+
+# ---- Index ----
+class SearchIndex:
+    """
+    BM25 full-text search over inbox emails (with their processed category
+    and tasks) and drafts.
+
+    Postings live in an immutable segment on disk (memory-mapped .npy files:
+    sorted terms, offsets, doc slots, each posting's field-weighted term
+    frequency and its BM25 weight, highest first within a term), plus an
+    in-memory delta for documents added since. Document lengths are kept per
+    slot with a running total, so the average length follows the live
+    documents: delta weights are computed from it at query time, segment
+    weights are recomputed from it at every merge. Replacing or deleting a document only marks its
+    slot dead. save() merges the delta, drops dead slots and swaps in the new
+    segment, so startup just maps the files. Emails are synced by content
+    hash (like the vector index), processed records by rowid, drafts
+    explicitly on every write.
+    """
+
+    def __init__(self, store, path: Path):
+        self.store = store
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._opened = False
+        self._synced = None
+        self.queries = 0
+        self.merges = 0
+
+    # ---- Segment I/O ----
+    def _open(self):
+        # caller holds self._lock
+        if self._opened:
+            return
+        segment = None
+        try:
+            current = (self.path / "CURRENT").read_text().strip()
+            segment = self.path / current
+            meta = json.loads((segment / "meta.json").read_text())
+            load = lambda name: np.load(segment / (name + ".npy"), mmap_mode="r")
+            self._terms, self._offsets = load("terms"), load("offsets")
+            self._postings, self._weights, self._tf = load("slots"), load("weights"), load("tf")
+            keys = load("keys")
+            columns = {name: np.load(segment / (name + ".npy")) for name in ("kind", "ts", "sender", "category", "hash", "dl")}
+        except (OSError, ValueError, KeyError):
+            meta, keys, columns, segment = None, [], {}, None
+        if meta is None:
+            self._terms = np.empty(0, dtype="S1")
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._postings = np.empty(0, dtype=np.int32)
+            self._weights = np.empty(0, dtype=np.float32)
+            self._tf = np.empty(0, dtype=np.float16)
+            meta = {"watermark": 0, "senders": [], "categories": []}
+        self._segment = segment
+        self._watermark = meta["watermark"]
+        self._senders = list(meta["senders"])
+        self._categories = list(meta["categories"])
+        self._sender_codes = {s: i for i, s in enumerate(self._senders)}
+        self._category_codes = {c: i for i, c in enumerate(self._categories)}
+        self._keys = [k.decode("utf-8") for k in keys]
+        self._slots = {k: i for i, k in enumerate(self._keys)}
+        self._kind = _Column(np.uint8, columns.get("kind"))
+        self._ts = _Column(np.int64, columns.get("ts"))
+        self._sender = _Column(np.int32, columns.get("sender"))
+        self._category = _Column(np.int32, columns.get("category"))
+        self._hash = _Column(np.uint64, columns.get("hash"))
+        self._dl = _Column(np.float32, columns.get("dl"))
+        self._total_dl = float(self._dl.values.sum(dtype=np.float64))
+        self._alive = _Column(np.bool_, np.ones(len(self._keys), dtype=bool))
+        self._live = len(self._keys)
+        self._base_n = len(self._keys)
+        self._reset_delta()
+        self._opened = True
+
+    def _reset_delta(self):
+        self._dterms: Dict[str, int] = {}
+        self._dterm_list: List[str] = []
+        self._dtids = array("i")
+        self._dslots = array("i")
+        self._dtf = array("f")
+        self._delta_index = None
+        self._dirty = False
+
+    def _code(self, codes: Dict[str, int], names: List[str], value: str) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    # ---- Writes ----
+    def _add(self, doc: Dict[str, Any], content_hash: int):
+        # caller holds self._lock; replaces any document with the same key
+        self._remove(doc["key"])
+        tf: Dict[str, float] = {}
+        dl = 0.0
+        for name, w in FIELD_WEIGHTS.items():
+            toks = tokenize(doc.get(name))
+            dl += w * len(toks)
+            for t in toks:
+                tf[t] = tf.get(t, 0.0) + w
+        slot = len(self._keys)
+        for term, f in tf.items():
+            tid = self._dterms.get(term)
+            if tid is None:
+                tid = self._dterms[term] = len(self._dterm_list)
+                self._dterm_list.append(term)
+            self._dtids.append(tid)
+            self._dslots.append(slot)
+            self._dtf.append(f)
+        self._keys.append(doc["key"])
+        self._slots[doc["key"]] = slot
+        self._kind.append(KINDS.index(doc["kind"]))
+        self._ts.append(ts_number(doc.get("timestamp")))
+        self._sender.append(self._code(self._sender_codes, self._senders, (doc.get("sender") or "").lower()))
+        self._category.append(self._code(self._category_codes, self._categories, (doc.get("category") or "").lower()))
+        self._hash.append(content_hash)
+        self._dl.append(dl)
+        self._total_dl += dl
+        self._alive.append(True)
+        self._live += 1
+        self._delta_index = None
+        self._dirty = True
+
+    def _remove(self, key: str) -> bool:
+        # caller holds self._lock
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return False
+        self._alive.data[slot] = False
+        self._live -= 1
+        self._total_dl -= float(self._dl.data[slot])
+        self._dirty = True
+        return True
+
+    def _avgdl(self) -> float:
+        # caller holds self._lock; mean field-weighted length of the live documents
+        return max(self._total_dl / self._live, 1.0) if self._live > 0 else 1.0
+
+    @staticmethod
+    def _bm25(tf, dl, avgdl: float):
+        # BM25 term-frequency weights for postings with term frequency tf in documents of length dl
+        tf = tf.astype(np.float32)
+        norm = K1 * (1 - B + B * dl / np.float32(avgdl))
+        return (tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+    def _maybe_save(self):
+        # caller holds self._lock
+        delta = len(self._keys) - self._base_n
+        dead = self._alive.n - self._live
+        if delta >= max(MERGE_MIN_DOCS, self._base_n // 10) or dead > max(MERGE_MIN_DOCS, self._base_n // 4):
+            self.save()
+
+    def sync_emails(self, emails: List[Dict[str, Any]], hashes: Dict[Any, str], get_records, signature=None) -> Dict[str, int]:
+        """
+        Bring the email documents in line with `emails` (`hashes` maps id ->
+        content hash; `get_records(ids)` returns {str(id): processed record}).
+        With a `signature`, a repeat call for the same inbox snapshot returns
+        immediately.
+        """
+        if not text_search_enabled():
+            return {"added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            if signature is not None and signature == self._synced:
+                return {"added": 0, "updated": 0, "removed": 0}
+            self._open()
+            seen, todo = set(), []
+            hash_values = self._hash.data
+            for e in emails:
+                key = "email:" + json.dumps(e.get("id"))
+                seen.add(key)
+                h = _hash64(hashes.get(e.get("id")) or "")
+                slot = self._slots.get(key)
+                if slot is None or int(hash_values[slot]) != h:
+                    todo.append((e, h, slot is None))
+            removed = [k for k in self._slots if k.startswith("email:") and k not in seen]
+            with stage("index"):
+                for start in range(0, len(todo), 2000):
+                    chunk = todo[start:start + 2000]
+                    records = get_records([e.get("id") for e, _, _ in chunk])
+                    for e, h, _ in chunk:
+                        self._add(email_document(e, records.get(str(e.get("id")))), h)
+                for k in removed:
+                    self._remove(k)
+            self._synced = signature
+            self._maybe_save()
+            added = sum(1 for _, _, new in todo if new)
+            return {"added": added, "updated": len(todo) - added, "removed": len(removed)}
+
+    def sync_processed(self, get_email) -> int:
+        """
+        Re-index the emails whose processed record changed since the last
+        call (processed rows get a new rowid on every write).
+        """
+        if not text_search_enabled():
+            return 0
+        with self._lock:
+            self._open()
+            with self.store.reader() as db:
+                top = db.execute("SELECT max(rowid) FROM processed").fetchone()[0] or 0
+                if top <= self._watermark:
+                    return 0
+                rows = db.execute("SELECT email_id, data FROM processed WHERE rowid > ?", (self._watermark,)).fetchall()
+            n = 0
+            with stage("index"):
+                for email_id, data in rows:
+                    email = get_email(int(email_id) if email_id.lstrip("-").isdigit() else email_id)
+                    slot = self._slots.get("email:" + json.dumps(email.get("id"))) if email else None
+                    if slot is None:
+                        continue
+                    self._add(email_document(email, json.loads(data)), int(self._hash.data[slot]))
+                    n += 1
+            self._watermark = top
+            self._dirty = True
+            self._maybe_save()
+            return n
+
+    def sync_drafts(self, drafts: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Bring the draft documents in line with the draft store (at startup).
+        """
+        if not text_search_enabled():
+            return {"added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            self._open()
+            seen, added, updated = set(), 0, 0
+            with stage("index"):
+                for d in drafts:
+                    doc = draft_document(d)
+                    seen.add(doc["key"])
+                    h = draft_hash(d)
+                    slot = self._slots.get(doc["key"])
+                    if slot is None or int(self._hash.data[slot]) != h:
+                        self._add(doc, h)
+                        added += slot is None
+                        updated += slot is not None
+                removed = [k for k in self._slots if k.startswith("draft:") and k not in seen]
+                for k in removed:
+                    self._remove(k)
+            self._maybe_save()
+            return {"added": added, "updated": updated, "removed": len(removed)}
+
+    def put_draft(self, draft: Dict[str, Any]):
+        if not text_search_enabled():
+            return
+        with self._lock:
+            self._open()
+            self._add(draft_document(draft), draft_hash(draft))
+            self._maybe_save()
+
+    def remove_draft(self, draft_id: str):
+        if not text_search_enabled():
+            return
+        with self._lock:
+            self._open()
+            self._remove("draft:" + str(draft_id))
+            self._maybe_save()
+
+    # ---- Merge ----
+    def save(self):
+        """
+        Merge the delta into a new on-disk segment (dropping dead slots) and
+        switch to it.
+        """
+        with self._lock:
+            if not self._opened or not self._dirty:
+                return
+            with stage("index_merge"):
+                self._merge_and_write()
+            self.merges += 1
+
+    def _merge_and_write(self):
+        # caller holds self._lock
+        alive = self._alive.values
+        new_slot = (np.cumsum(alive, dtype=np.int64) - 1).astype(np.int32)
+        n_terms = len(self._terms)
+        counts_b = np.diff(self._offsets)
+        b_tids = np.repeat(np.arange(n_terms, dtype=np.int64), counts_b)
+        b_keep = alive[self._postings] if len(self._postings) else np.empty(0, dtype=bool)
+        d_tids = np.frombuffer(self._dtids, dtype=np.int32) if len(self._dtids) else np.empty(0, dtype=np.int32)
+        d_slots = np.frombuffer(self._dslots, dtype=np.int32) if len(self._dslots) else np.empty(0, dtype=np.int32)
+        d_tf = np.frombuffer(self._dtf, dtype=np.float32) if len(self._dtf) else np.empty(0, dtype=np.float32)
+        d_keep = alive[d_slots] if len(d_slots) else np.empty(0, dtype=bool)
+
+        # union vocabulary; the base map is monotonic, so base postings stay grouped
+        d_terms = np.array([t.encode("utf-8") for t in self._dterm_list], dtype="S") if self._dterm_list else np.empty(0, dtype="S1")
+        terms = np.union1d(self._terms, d_terms)
+        bt = np.searchsorted(terms, self._terms)[b_tids[b_keep]] if n_terms else np.empty(0, dtype=np.int64)
+        dt = np.searchsorted(terms, d_terms)[d_tids[d_keep]] if len(d_terms) else np.empty(0, dtype=np.int64)
+        bcount = np.bincount(bt, minlength=len(terms))
+        dcount = np.bincount(dt, minlength=len(terms))
+        total = bcount + dcount
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(total, out=offsets[1:])
+
+        slots = np.empty(int(offsets[-1]), dtype=np.int32)
+        tf = np.empty(int(offsets[-1]), dtype=np.float16)
+        b_start = np.cumsum(bcount) - bcount
+        pos = offsets[bt] + np.arange(len(bt)) - b_start[bt]
+        slots[pos] = new_slot[self._postings[b_keep]] if len(bt) else []
+        tf[pos] = self._tf[b_keep] if len(bt) else []
+        order = np.argsort(dt, kind="stable")
+        dts = dt[order]
+        d_start = np.cumsum(dcount) - dcount
+        pos = offsets[dts] + bcount[dts] + np.arange(len(dts)) - d_start[dts]
+        slots[pos] = new_slot[d_slots[d_keep][order]] if len(dts) else []
+        tf[pos] = d_tf[d_keep][order] if len(dts) else []
+
+        # every weight is recomputed against the current average length
+        avgdl = self._avgdl()
+        dl = self._dl.values[alive]
+        weights = self._bm25(tf, dl[slots], avgdl)
+
+        # impact order: each term's postings by descending weight, so a one-term
+        # query can stop after its first k live hits
+        order = np.lexsort((-weights, np.repeat(np.arange(len(terms)), total)))
+        slots, weights, tf = slots[order], weights[order], tf[order]
+
+        used = total > 0
+        if not used.all():
+            terms = terms[used]
+            offsets = np.concatenate([[0], np.cumsum(total[used])]).astype(np.int64)
+        keys = np.array([k.encode("utf-8") for k, a in zip(self._keys, alive) if a], dtype="S")
+
+        generation = int(self._segment.name.split("-")[1]) + 1 if self._segment is not None else 1
+        segment = self.path / f"segment-{generation}"
+        if segment.exists():
+            shutil.rmtree(segment)
+        segment.mkdir(parents=True)
+        arrays = {
+            "terms": terms, "offsets": offsets, "slots": slots, "weights": weights, "tf": tf, "keys": keys,
+            "kind": self._kind.values[alive], "ts": self._ts.values[alive], "sender": self._sender.values[alive],
+            "category": self._category.values[alive], "hash": self._hash.values[alive], "dl": dl,
+        }
+        for name, values in arrays.items():
+            np.save(segment / (name + ".npy"), values)
+        meta = {
+            "avgdl": avgdl, "watermark": self._watermark, "documents": int(alive.sum()),
+            "senders": self._senders, "categories": self._categories,
+        }
+        (segment / "meta.json").write_text(json.dumps(meta))
+        tmp = self.path / "CURRENT.tmp"
+        tmp.write_text(segment.name)
+        os.replace(tmp, self.path / "CURRENT")
+        old = self._segment
+        self._opened = False
+        self._open()
+        if old is not None and old != segment:
+            shutil.rmtree(old, ignore_errors=True)
+
+    # ---- Query ----
+    def _delta(self):
+        # caller holds self._lock; delta postings grouped by term with their BM25
+        # weights, rebuilt after writes and whenever the average length moves
+        avgdl = self._avgdl()
+        if self._delta_index is None or self._delta_index[3] != avgdl:
+            tids = np.frombuffer(self._dtids, dtype=np.int32) if len(self._dtids) else np.empty(0, dtype=np.int32)
+            order = np.argsort(tids, kind="stable")
+            offsets = np.zeros(len(self._dterm_list) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(tids, minlength=len(self._dterm_list)), out=offsets[1:])
+            slots = np.frombuffer(self._dslots, dtype=np.int32)[order] if len(order) else np.empty(0, dtype=np.int32)
+            tf = np.frombuffer(self._dtf, dtype=np.float32)[order] if len(order) else np.empty(0, dtype=np.float32)
+            self._delta_index = (offsets, slots, self._bm25(tf, self._dl.values[slots], avgdl), avgdl)
+        return self._delta_index[:3]
+
+    def _postings_for(self, term: str, prefix: bool) -> List[List[Tuple[Any, Any, bool]]]:
+        # caller holds self._lock; per matching term, its (slots, tf weights,
+        # impact-ordered) parts: the segment's block and the delta's
+        found: Dict[str, List] = {}
+        raw = term.encode("utf-8")
+        if len(self._terms):
+            lo = int(np.searchsorted(self._terms, raw, "left"))
+            if prefix and len(raw) < self._terms.dtype.itemsize:
+                hi = int(np.searchsorted(self._terms, raw + b"\xff", "left"))
+            else:
+                hi = lo + 1 if lo < len(self._terms) and self._terms[lo] == raw else lo
+            tids = np.arange(lo, hi)
+            if len(tids) > MAX_PREFIX_TERMS:
+                df = np.diff(self._offsets[lo:hi + 1])
+                tids = tids[np.argpartition(-df, MAX_PREFIX_TERMS - 1)[:MAX_PREFIX_TERMS]]
+            for tid in tids:
+                a, b = int(self._offsets[tid]), int(self._offsets[tid + 1])
+                found.setdefault(self._terms[tid].decode("utf-8"), []).append((self._postings[a:b], self._weights[a:b], True))
+        offsets, slots, weights = self._delta()
+        names = [t for t in self._dterm_list if t.startswith(term)] if prefix else ([term] if term in self._dterms else [])
+        for t in names:
+            tid = self._dterms[t]
+            a, b = int(offsets[tid]), int(offsets[tid + 1])
+            found.setdefault(t, []).append((slots[a:b], weights[a:b], False))
+        if prefix and len(found) > MAX_PREFIX_TERMS:
+            ranked = sorted(found, key=lambda t: -sum(len(p[0]) for p in found[t]))
+            found = {t: found[t] for t in ranked[:MAX_PREFIX_TERMS]}
+        return list(found.values())
+
+    def _filter(self, kind, sender, category, since, until):
+        # caller holds self._lock; slots -> bool mask of live documents passing the filters
+        alive = self._alive.values
+        kind_code = None if kind is None else KINDS.index(kind) if kind in KINDS else 255
+        sender_code = None if sender is None else self._sender_codes.get(sender.lower(), -1)
+        category_code = None if category is None else self._category_codes.get(category.lower(), -1)
+        lo = ts_number(since) if since else None
+        hi = ts_number(until, "9" if len(until) <= 10 else "0") if until else None
+
+        def keep(cand):
+            m = alive[cand]
+            if kind_code is not None:
+                m &= self._kind.values[cand] == kind_code
+            if sender_code is not None:
+                m &= self._sender.values[cand] == sender_code
+            if category_code is not None:
+                m &= self._category.values[cand] == category_code
+            if lo is not None or hi is not None:
+                ts = self._ts.values[cand]
+                if lo is not None:
+                    m &= ts >= lo
+                if hi is not None:
+                    m &= (ts >= 0) & (ts <= hi)
+            return m
+
+        return keep
+
+    @staticmethod
+    def _scan(slots, weights, k: int, keep):
+        # the first k postings of an impact-ordered block that pass `keep`
+        got_s, got_w, found, pos, step = [], [], 0, 0, max(4 * k, 256)
+        while pos < len(slots) and found < k:
+            s, w = slots[pos:pos + step], weights[pos:pos + step]
+            m = keep(s)
+            got_s.append(s[m])
+            got_w.append(w[m])
+            found += int(m.sum())
+            pos += step
+            step *= 4
+        return got_s, got_w
+
+    def search(
+        self,
+        q: str,
+        k: int = 10,
+        kind: Optional[str] = None,
+        sender: Optional[str] = None,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> List[Tuple[str, float]]:
+        """
+        (document key, BM25 score) of the best `k` matches for `q`, optionally
+        restricted by kind ("email"/"draft"), sender, category and timestamp range.
+        Words ending in * match as prefixes.
+        """
+        if not text_search_enabled():
+            return []
+        terms = parse_query(q)
+        with self._lock:
+            self._open()
+            self.queries += 1
+            lists = [parts for term, prefix in terms for parts in self._postings_for(term, prefix)]
+            if not lists or k <= 0:
+                return []
+            # document frequencies include postings of dead slots until the next
+            # merge drops them, so the document count does too
+            n_docs = max(1, len(self._keys))
+            keep = self._filter(kind, sender, category, since, until)
+            slot_parts, weight_parts = [], []
+            for parts in lists:
+                df = sum(len(p[0]) for p in parts)
+                idf = np.float32(np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+                for slots, weights, ordered in parts:
+                    if len(lists) == 1 and ordered:
+                        # one term: its best postings come first
+                        got_s, got_w = self._scan(slots, weights, k, keep)
+                        slot_parts += got_s
+                        weight_parts += [w * idf for w in got_w]
+                    else:
+                        slot_parts.append(slots)
+                        weight_parts.append(weights * idf)
+            slots = np.concatenate(slot_parts)
+            weights = np.concatenate(weight_parts)
+            if len(lists) == 1:
+                cand, sc = slots, weights.astype(np.float64)
+            elif len(slots) > self._alive.n // 8:
+                scores = np.bincount(slots, weights=weights, minlength=self._alive.n)
+                cand = np.flatnonzero(scores)
+                sc = scores[cand]
+            else:
+                cand, inverse = np.unique(slots, return_inverse=True)
+                sc = np.bincount(inverse, weights=weights)
+            m = keep(cand)
+            cand, sc = cand[m], sc[m]
+            if len(cand) > k:
+                top = np.argpartition(-sc, k - 1)[:k]
+                cand, sc = cand[top], sc[top]
+            order = np.lexsort((cand, -sc))
+            return [(self._keys[int(cand[i])], round(float(sc[i]), 4)) for i in order]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            opened = self._opened
+            return {
+                "enabled": text_search_enabled(),
+                "documents": self._live if opened else 0,
+                "segment_documents": self._base_n if opened else 0,
+                "delta_documents": len(self._keys) - self._base_n if opened else 0,
+                "terms": len(self._terms) if opened else 0,
+                "avgdl": round(self._avgdl(), 3) if opened else None,
+                "merges": self.merges,
+                "queries": self.queries,
+            }
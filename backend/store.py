@@ -0,0 +1,341 @@
+# backend/store.py
+import json
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from backend.metrics import stage
+
+# ingested emails are numbered from here up, clear of the JSON inbox's ids
+INGESTED_ID_BASE = 1_000_000_000
+
+# fields a PUT /drafts/{id} is allowed to change
+DRAFT_UPDATABLE_FIELDS = ("subject", "body", "source_email_id", "type", "metadata")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS drafts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS processed (
+    email_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS emails (
+    id INTEGER PRIMARY KEY,
+    source_key TEXT UNIQUE NOT NULL,
+    data TEXT NOT NULL
+);
+"""
+
+
+class Store:
+    """
+    Embedded SQLite store shared by the repositories below.
+
+    One connection per process, serialized by a lock; every write goes through
+    transaction(), which takes SQLite's write lock up front (BEGIN IMMEDIATE)
+    so read-modify-write sequences cannot lose updates, even across processes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._schemas: List[str] = [_SCHEMA]
+
+    def add_schema(self, script: str):
+        """
+        Register extra CREATE ... IF NOT EXISTS statements (e.g. the job queue's
+        tables), applied when the connection opens.
+        """
+        with self._lock:
+            self._schemas.append(script)
+            if self._conn is not None:
+                self._conn.executescript(script)
+
+    def _db(self) -> sqlite3.Connection:
+        # caller holds self._lock
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for script in self._schemas:
+                conn.executescript(script)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        with self._lock, stage("store_write"):
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    @contextmanager
+    def reader(self):
+        with self._lock:
+            yield self._db()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self.reader() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str, db: sqlite3.Connection = None):
+        if db is not None:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            return
+        with self.transaction() as tx:
+            tx.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class DraftRepository:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def get(self, draft_id: str) -> Optional[Dict[str, Any]]:
+        with self.store.reader() as db:
+            row = db.execute("SELECT data FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self.store.reader() as db:
+            rows = db.execute("SELECT data FROM drafts ORDER BY seq").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def create(self, draft: Dict[str, Any]) -> Dict[str, Any]:
+        with self.store.transaction() as db:
+            db.execute("INSERT INTO drafts (id, data) VALUES (?, ?)", (draft["id"], json.dumps(draft)))
+        return draft
+
+    def update(self, draft_id: str, changes: Dict[str, Any], updated_at: str) -> Optional[Dict[str, Any]]:
+        """
+        Apply the allowed fields of `changes` to one draft, atomically.
+        Returns the updated draft, or None if it does not exist.
+        """
+        with self.store.transaction() as db:
+            row = db.execute("SELECT data FROM drafts WHERE id = ?", (draft_id,)).fetchone()
+            if row is None:
+                return None
+            draft = json.loads(row[0])
+            for field in DRAFT_UPDATABLE_FIELDS:
+                if field in changes:
+                    draft[field] = changes.get(field)
+            draft["updated_at"] = updated_at
+            db.execute("UPDATE drafts SET data = ? WHERE id = ?", (json.dumps(draft), draft_id))
+        return draft
+
+    def delete(self, draft_id: str) -> bool:
+        with self.store.transaction() as db:
+            cur = db.execute("DELETE FROM drafts WHERE id = ?", (draft_id,))
+        return cur.rowcount > 0
+
+
+class ProcessedRepository:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def get(self, email_id) -> Optional[Dict[str, Any]]:
+        with self.store.reader() as db:
+            row = db.execute("SELECT data FROM processed WHERE email_id = ?", (str(email_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, email_ids: Iterable[Any]) -> Dict[str, Any]:
+        """
+        {email_id (as stored, a string): record} for those of `email_ids` processed.
+        """
+        keys = [str(k) for k in email_ids]
+        out = {}
+        with self.store.reader() as db:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = db.execute(
+                    f"SELECT email_id, data FROM processed WHERE email_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                out.update((k, json.loads(v)) for k, v in rows)
+        return out
+
+    def all(self) -> Dict[str, Any]:
+        with self.store.reader() as db:
+            rows = db.execute("SELECT email_id, data FROM processed").fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def ids(self) -> set:
+        with self.store.reader() as db:
+            return {r[0] for r in db.execute("SELECT email_id FROM processed")}
+
+    def versions(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        email_id -> (content_hash, template_version) of every record, read
+        inside SQLite so the records themselves are not decoded.
+        """
+        with self.store.reader() as db:
+            rows = db.execute(
+                "SELECT email_id, json_extract(data, '$.content_hash'), json_extract(data, '$.template_version') FROM processed"
+            ).fetchall()
+        return {k: (h, v) for k, h, v in rows}
+
+    def put(self, email_id, record: Dict[str, Any]):
+        self.put_many([(email_id, record)])
+
+    def put_many(self, items: Iterable[Tuple[Any, Dict[str, Any]]]):
+        """
+        Upsert several processed records in one transaction.
+        """
+        rows = [(str(k), json.dumps(v)) for k, v in items]
+        with self.store.transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO processed (email_id, data) VALUES (?, ?)", rows)
+
+
+class EmailRepository:
+    """
+    Emails ingested from mailboxes (see backend/ingest.py), in the inbox's
+    {id, sender, subject, timestamp, body} shape. `source_key` (Message-ID or
+    a content hash) makes re-ingesting the same mailbox a no-op.
+    """
+
+    def __init__(self, store: Store):
+        self.store = store
+
+    def version(self) -> int:
+        """
+        Bumped by every insert that added rows; cheap change detection for readers.
+        """
+        return int(self.store.get_meta("emails_version") or 0)
+
+    def count(self) -> int:
+        with self.store.reader() as db:
+            return db.execute("SELECT COUNT(*) FROM emails").fetchone()[0]
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self.store.reader() as db:
+            rows = db.execute("SELECT data FROM emails ORDER BY id").fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def after(self, after_id: int = 0, limit: int = 5000) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` emails with ids above `after_id`, in id order; new
+        emails always get higher ids, so this pages through new mail too.
+        """
+        with self.store.reader() as db:
+            rows = db.execute("SELECT data FROM emails WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def insert_many(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Insert (source_key, email) pairs in one transaction, numbering new emails
+        after the highest stored id and at least INGESTED_ID_BASE + 1, so they
+        never take an id the JSON inbox may use later. Known keys are skipped.
+        Returns the number inserted.
+        """
+        inserted = 0
+        with self.store.transaction() as db:
+            next_id = max(db.execute("SELECT COALESCE(MAX(id), 0) FROM emails").fetchone()[0], INGESTED_ID_BASE) + 1
+            for key, email in items:
+                if db.execute("SELECT 1 FROM emails WHERE source_key = ?", (key,)).fetchone():
+                    continue
+                email = dict(email, id=next_id)
+                db.execute("INSERT INTO emails (id, source_key, data) VALUES (?, ?, ?)", (next_id, key, json.dumps(email)))
+                next_id += 1
+                inserted += 1
+            if inserted:
+                self._bump_version(db)
+        return inserted
+
+    def renumber(self, ids: Iterable[int]) -> Dict[int, int]:
+        """
+        Move the given emails to fresh ids after the highest stored one; for
+        emails ingested before INGESTED_ID_BASE that collide with the JSON
+        inbox. Returns {old id: new id}.
+        """
+        moved: Dict[int, int] = {}
+        with self.store.transaction() as db:
+            next_id = max(db.execute("SELECT COALESCE(MAX(id), 0) FROM emails").fetchone()[0], INGESTED_ID_BASE) + 1
+            for old in ids:
+                row = db.execute("SELECT data FROM emails WHERE id = ?", (old,)).fetchone()
+                if row is None:
+                    continue
+                email = dict(json.loads(row[0]), id=next_id)
+                db.execute("UPDATE emails SET id = ?, data = ? WHERE id = ?", (next_id, json.dumps(email), old))
+                moved[old] = next_id
+                next_id += 1
+            if moved:
+                self._bump_version(db)
+        return moved
+
+    def _bump_version(self, db):
+        version = db.execute("SELECT value FROM meta WHERE key = 'emails_version'").fetchone()
+        self.store.set_meta("emails_version", str(int(version[0] if version else 0) + 1), db=db)
+
+
+def import_json(store: Store, drafts_path: Path, processed_path: Path, force: bool = False) -> Dict[str, int]:
+    """
+    One-time import of the legacy drafts.json / processed.json files.
+    Runs in a single transaction and records itself in the meta table, so it
+    is a no-op afterwards unless `force` is set.
+    """
+    counts = {"drafts": 0, "processed": 0}
+    if not force and store.get_meta("json_imported"):
+        return counts
+    drafts = _read_json(drafts_path) or []
+    processed = _read_json(processed_path) or {}
+    with store.transaction() as db:
+        for d in drafts:
+            if not isinstance(d, dict) or not d.get("id"):
+                continue
+            db.execute("INSERT OR REPLACE INTO drafts (id, data) VALUES (?, ?)", (d["id"], json.dumps(d)))
+            counts["drafts"] += 1
+        for k, v in processed.items():
+            db.execute("INSERT OR REPLACE INTO processed (email_id, data) VALUES (?, ?)", (str(k), json.dumps(v)))
+            counts["processed"] += 1
+        store.set_meta("json_imported", "1", db=db)
+    return counts
+
+
+def export_json(store: Store, drafts_path: Path, processed_path: Path):
+    """
+    Write the store back out in the legacy JSON layout, for inspection.
+    """
+    drafts_path.write_text(json.dumps(DraftRepository(store).list(), indent=2))
+    processed_path.write_text(json.dumps(ProcessedRepository(store).all(), indent=2))
+
+
+def _read_json(path: Path):
+    path = Path(path)
+    if path.exists():
+        return json.loads(path.read_text())
+    return None
+
+
+if __name__ == "__main__":
+    # python -m backend.store import|export
+    from backend.config import STORE_PATH, DRAFTS_PATH, PROCESSED_PATH
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "import"
+    s = Store(STORE_PATH)
+    if cmd == "import":
+        print(import_json(s, DRAFTS_PATH, PROCESSED_PATH, force=True))
+    elif cmd == "export":
+        export_json(s, DRAFTS_PATH, PROCESSED_PATH)
+        print("exported to", DRAFTS_PATH, "and", PROCESSED_PATH)
+    else:
+        print("usage: python -m backend.store [import|export]")
+        sys.exit(2)
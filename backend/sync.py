@@ -0,0 +1,66 @@
+# backend/sync.py
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+# Prompt Brain templates each processing mode renders
+MODE_TEMPLATES = {
+    "separate": ("categorization_prompt", "action_prompt"),
+    "triage": ("triage_prompt",),
+}
+
+SYNC_REASONS = ("new", "changed", "stale_template")
+
+
+def email_hash(email: Dict[str, Any]) -> str:
+    """
+    Content hash of the fields processing reads; edits to any of them
+    make the processed record out of date.
+    """
+    fields = {k: email.get(k) for k in ("sender", "subject", "timestamp", "body")}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def template_version(prompts: Dict[str, str], mode: str) -> str:
+    """
+    Short hash of the templates `mode` uses; changes whenever one is edited.
+    """
+    texts = [[k, prompts.get(k)] for k in MODE_TEMPLATES[mode]]
+    return mode + ":" + hashlib.sha1(json.dumps(texts).encode("utf-8")).hexdigest()[:12]
+
+
+def stamp(record: Dict[str, Any], email: Dict[str, Any], version: str, prompts_version: Optional[int] = None) -> Dict[str, Any]:
+    record["content_hash"] = email_hash(email)
+    record["template_version"] = version
+    if prompts_version is not None:
+        record["prompts_version"] = prompts_version
+    return record
+
+
+def plan_sync(
+    emails: List[Dict[str, Any]],
+    hashes: Dict[Any, str],
+    states: Dict[str, Tuple[Optional[str], Optional[str]]],
+    version: str,
+) -> Tuple[List[Tuple[Dict[str, Any], str]], int]:
+    """
+    Emails whose processed record is missing or out of date, with the reason
+    ("new", "changed" or "stale_template"), and the number already up to date.
+
+    `hashes` maps email id -> content hash, `states` maps processed email id
+    (as stored, a string) -> (content_hash, template_version) of its record.
+    Records from before hashes were kept count as changed.
+    """
+    todo = []
+    fresh = 0
+    for email in emails:
+        state = states.get(str(email.get("id")))
+        if state is None:
+            todo.append((email, "new"))
+        elif state[0] != hashes.get(email.get("id")):
+            todo.append((email, "changed"))
+        elif state[1] != version:
+            todo.append((email, "stale_template"))
+        else:
+            fresh += 1
+    return todo, fresh
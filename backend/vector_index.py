@@ -0,0 +1,310 @@
+# backend/vector_index.py
+import json
+import os
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except Exception:  # numpy is optional; without it there is no semantic search
+    np = None
+
+from backend.metrics import stage
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i if in is it its me my no not of on or our so that the "
+    "this to was we were will with you your".split()
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    email_id TEXT PRIMARY KEY,
+    row INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+"""
+
+
+def semantic_enabled() -> bool:
+    """
+    Semantic search and related-email context, on unless SEMANTIC_INDEX=0
+    (and needs numpy).
+    """
+    return np is not None and os.environ.get("SEMANTIC_INDEX", "1") != "0"
+
+
+def related_context_k() -> int:
+    """
+    How many related emails /agent/query adds to the prompt (RELATED_CONTEXT_K, 0 = none).
+    """
+    try:
+        return max(0, int(os.environ.get("RELATED_CONTEXT_K", "3")))
+    except ValueError:
+        return 3
+
+
+def embedding_text(email: Dict[str, Any]) -> str:
+    return (email.get("subject") or "") + "\n" + (email.get("body") or "")
+
+
+# ---- Embedders ----
+def embedding_dim() -> int:
+    """
+    Hashed embedding width (EMBEDDING_DIM, default 192). A query reads every
+    row, so search time grows with it: ~9 ms over 100k emails at 192 on one core.
+    """
+    try:
+        return max(16, int(os.environ.get("EMBEDDING_DIM", "192")))
+    except ValueError:
+        return 192
+
+
+class HashedEmbedder:
+    """
+    Dependency-free sentence embedding: signed feature hashing of words,
+    word bigrams and in-word character trigrams, with sublinear term weights,
+    L2-normalized. Deterministic across processes.
+    """
+
+    def __init__(self, dim: int = None):
+        self.dim = dim or embedding_dim()
+        self.name = f"hashed-v1-{self.dim}"
+
+    @staticmethod
+    def _grams(text: str) -> List[Tuple[str, float]]:
+        toks = [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+        grams = [(t, 1.0) for t in toks]
+        grams += [(a + " " + b, 0.7) for a, b in zip(toks, toks[1:])]
+        for t in toks:
+            w = "<" + t + ">"
+            grams += [("#" + w[i:i + 3], 0.1) for i in range(len(w) - 2)]
+        return grams
+
+    def embed(self, texts: List[str]):
+        dim = self.dim
+        out = np.zeros((len(texts), dim), dtype=np.float32)
+        for n, text in enumerate(texts):
+            weights: Dict[str, float] = {}
+            for g, w in self._grams(text):
+                weights[g] = weights.get(g, 0.0) + w
+            row = out[n]
+            for g, w in weights.items():
+                h = zlib.crc32(g.encode("utf-8"))
+                row[h % dim] += (1.0 + np.log(w)) if (h >> 31) else -(1.0 + np.log(w))
+            norm = np.linalg.norm(row)
+            if norm > 0:
+                row /= norm
+        return out
+
+
+class SentenceTransformerEmbedder:
+    """
+    sentence-transformers model (EMBEDDING_MODEL) on CPU, normalized output.
+    """
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.name = f"st:{model_name}:{self.dim}"
+
+    def embed(self, texts: List[str]):
+        return self.model.encode(texts, batch_size=64, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def make_embedder():
+    """
+    EMBEDDING_MODEL selects a sentence-transformers model; the hashed embedder
+    is used when unset or when the model cannot be loaded.
+    """
+    model_name = os.environ.get("EMBEDDING_MODEL", "").strip()
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except Exception as e:
+            print("Embedding model load failed, using hashed embeddings:", e)
+    return HashedEmbedder()
+
+
+# ---- Index ----
+class VectorIndex:
+    """
+    Top-k cosine search over inbox emails.
+
+    Unit vectors live in a memory-mapped .npy matrix next to the store, one
+    row per email; the store's vectors table maps email ids to rows with the
+    content hash each row was embedded from. sync() embeds only new or edited
+    emails and frees rows of removed ones, so restarts and new mail cost
+    nothing for what is already indexed. Changing the embedder rebuilds.
+    """
+
+    def __init__(self, store, path: Path, embedder=None):
+        self.store = store
+        self.path = Path(path)
+        self._embedder = embedder
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._rows: Dict[str, int] = {}  # json-encoded email id -> row
+        self._ids: List[Optional[Any]] = []  # row -> email id (None when free)
+        self._synced = None
+        self.embedded = 0
+        self.queries = 0
+        store.add_schema(_SCHEMA)
+
+    @property
+    def embedder(self):
+        with self._lock:
+            if self._embedder is None:
+                self._embedder = make_embedder()
+            return self._embedder
+
+    def _open(self):
+        # caller holds self._lock
+        if self._matrix is not None:
+            return
+        emb = self.embedder
+        if self.store.get_meta("vector_index_embedder") != emb.name or not self.path.exists():
+            with self.store.transaction() as db:
+                db.execute("DELETE FROM vectors")
+                self.store.set_meta("vector_index_embedder", emb.name, db=db)
+            self._matrix = self._allocate(1024, emb.dim)
+            return
+        self._matrix = np.lib.format.open_memmap(str(self.path), mode="r+")
+        with self.store.reader() as db:
+            rows = db.execute("SELECT email_id, row FROM vectors").fetchall()
+        self._ids = [None] * (max((r for _, r in rows), default=-1) + 1)
+        for key, row in rows:
+            self._rows[key] = row
+            self._ids[row] = json.loads(key)
+
+    def _allocate(self, capacity: int, dim: int, old=None):
+        # a new, larger file replaces the old one; rows keep their positions
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        matrix = np.lib.format.open_memmap(str(tmp), mode="w+", dtype=np.float32, shape=(capacity, dim))
+        if old is not None:
+            matrix[:len(old)] = old
+        matrix.flush()
+        os.replace(tmp, self.path)
+        return matrix
+
+    def sync(self, emails: List[Dict[str, Any]], hashes: Dict[Any, str], signature=None) -> Dict[str, int]:
+        """
+        Bring the index in line with `emails` (`hashes` maps id -> content
+        hash). With a `signature`, a repeat call for the same inbox snapshot
+        returns immediately.
+        """
+        if not semantic_enabled():
+            return {"added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            if signature is not None and signature == self._synced:
+                return {"added": 0, "updated": 0, "removed": 0}
+            self._open()
+            with self.store.reader() as db:
+                stored = dict(db.execute("SELECT email_id, content_hash FROM vectors").fetchall())
+            todo, seen = [], set()
+            for e in emails:
+                key = json.dumps(e.get("id"))
+                seen.add(key)
+                h = hashes.get(e.get("id"))
+                if stored.get(key) != h:
+                    todo.append((key, e, h))
+            removed = [k for k in stored if k not in seen]
+            added = sum(1 for key, _, _ in todo if key not in self._rows)
+            with stage("embed"):
+                for start in range(0, len(todo), 512):
+                    self._write(todo[start:start + 512])
+            if removed:
+                with self.store.transaction() as db:
+                    db.executemany("DELETE FROM vectors WHERE email_id = ?", [(k,) for k in removed])
+                for k in removed:
+                    row = self._rows.pop(k)
+                    self._matrix[row] = 0.0
+                    self._ids[row] = None
+            if todo or removed:
+                self._matrix.flush()
+            self._synced = signature
+            return {"added": added, "updated": len(todo) - added, "removed": len(removed)}
+
+    def _write(self, chunk: List[Tuple[str, Dict[str, Any], str]]):
+        # caller holds self._lock
+        vectors = self.embedder.embed([embedding_text(e) for _, e, _ in chunk])
+        rows = []
+        for key, email, _ in chunk:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._ids)
+                self._ids.append(email.get("id"))
+            rows.append(row)
+        if len(self._ids) > len(self._matrix):
+            capacity = len(self._matrix)
+            while capacity < len(self._ids):
+                capacity *= 2
+            self._matrix = self._allocate(capacity, self._matrix.shape[1], self._matrix)
+        self._matrix[rows] = vectors
+        with self.store.transaction() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO vectors (email_id, row, content_hash) VALUES (?, ?, ?)",
+                [(key, row, h) for (key, _, h), row in zip(chunk, rows)],
+            )
+        self.embedded += len(chunk)
+
+    def _top_k(self, query, k: int, exclude: Iterable[Any] = ()) -> List[Tuple[Any, float]]:
+        # caller holds self._lock
+        n = len(self._ids)
+        if not n or k <= 0:
+            return []
+        scores = self._matrix[:n] @ query
+        skip = {self._rows.get(json.dumps(i)) for i in exclude}
+        want = min(n, k + len(skip))
+        top = np.argpartition(-scores, want - 1)[:want] if want < n else np.arange(n)
+        top = top[np.argsort(-scores[top])]
+        out = []
+        for row in top:
+            row = int(row)
+            if row in skip or self._ids[row] is None or scores[row] <= 0:
+                continue
+            out.append((self._ids[row], round(float(scores[row]), 4)))
+            if len(out) == k:
+                break
+        self.queries += 1
+        return out
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Any, float]]:
+        """
+        (email id, cosine score) of the `k` emails closest to `query`.
+        """
+        if not semantic_enabled():
+            return []
+        with self._lock:
+            self._open()
+            q = self.embedder.embed([query])[0]
+            return self._top_k(q, k)
+
+    def similar(self, email: Dict[str, Any], k: int = 3, exclude: Iterable[Any] = ()) -> List[Tuple[Any, float]]:
+        """
+        Emails closest to `email` (itself and `exclude` left out). Uses its
+        stored vector when indexed, else embeds it.
+        """
+        if not semantic_enabled():
+            return []
+        with self._lock:
+            self._open()
+            row = self._rows.get(json.dumps(email.get("id")))
+            q = self._matrix[row] if row is not None else self.embedder.embed([embedding_text(email)])[0]
+            return self._top_k(np.array(q), k, exclude=[email.get("id"), *exclude])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": semantic_enabled(),
+            "embedder": self._embedder.name if self._embedder is not None else None,
+            "indexed": len(self._rows),
+            "capacity": len(self._matrix) if self._matrix is not None else 0,
+            "embedded": self.embedded,
+            "queries": self.queries,
+        }
@@ -0,0 +1,322 @@
+# benchmarks/bench_backend.py
+"""
+Benchmark: end-to-end latency and throughput of the backend endpoints.
+
+    python -m benchmarks.bench_backend run [--emails N] [--drafts N] [--local]
+    python -m benchmarks.bench_backend compare OLD.json NEW.json
+
+Builds a synthetic inbox and draft store of the requested size (seeded, so
+every run sees the same data) in a temporary directory, starts the app
+in-process with FastAPI's TestClient and times /inbox, /search (semantic and
+text), /process,
+/agent/query and draft CRUD. Mock LLM by default; --local uses the local model
+(LOCAL_MODEL_NAME, e.g. a tiny GPT-2). The response cache is off so every
+call does its work.
+
+Results (p50/p95/p99/mean ms and requests per second per scenario, plus the
+commit and settings they came from) are written as JSON to benchmarks/results/;
+`compare` prints the p50/p95 and throughput change per scenario.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BASE / "benchmarks" / "results"
+
+_SENDERS = ("manager@company.com", "hr@company.com", "noreply@newsletter.com", "client@partner.io",
+            "it-support@company.com", "alerts@monitoring.dev", "friend@mail.com", "billing@vendor.com")
+_SUBJECTS = ("Project Update & Next Steps", "Action Required: Benefits Enrollment", "Weekly Digest",
+             "Invoice overdue", "Meeting moved to Thursday", "Server CPU alert", "Lunch on Friday?",
+             "Contract review needed")
+_SENTENCES = ("Please prepare the Q4 report by Friday.", "Can you schedule a 30-min sync next week?",
+              "Open enrollment closes Nov 30.", "The attached invoice is now 15 days overdue.",
+              "CPU usage on prod-3 has been above 90% for an hour.", "Here is this week's product news.",
+              "Let me know if the new timeline works for you.", "Please review the contract before Monday.",
+              "No action needed, just keeping you in the loop.", "Could you assign someone to the ticket?")
+_TEXT_QUERIES = ("invoice overdue", "contract review", "enroll*", "cpu prod", "q4 report friday", "timeline",
+                 "sync next week", "ticket assign*")
+
+# the LLM scenarios run --llm-iterations times, the rest --iterations
+SCENARIOS = ("inbox_full", "inbox_page", "inbox_sender", "search", "text_search", "process_email", "process_batch",
+             "agent_query", "draft_create", "draft_get", "draft_update", "draft_list_page", "draft_delete")
+LLM_SCENARIOS = ("process_email", "process_batch", "agent_query")
+
+
+# ---- Synthetic data ----
+def synthetic_emails(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(1, n + 1):
+        ts = start + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        yield {
+            "id": i,
+            "sender": rng.choice(_SENDERS),
+            "subject": rng.choice(_SUBJECTS),
+            "timestamp": ts.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "body": " ".join(rng.choice(_SENTENCES) for _ in range(rng.randint(1, 6))),
+        }
+
+
+def write_inbox(path: Path, n: int, seed: int = 0):
+    # written incrementally so a 1M-email inbox never sits in memory twice
+    with open(path, "w") as f:
+        f.write("[")
+        for i, email in enumerate(synthetic_emails(n, seed)):
+            f.write(("," if i else "") + json.dumps(email))
+        f.write("]")
+
+
+def seed_drafts(store, n: int, n_emails: int, seed: int = 0, chunk: int = 10000):
+    """
+    Insert `n` drafts straight into the store, `chunk` rows per transaction.
+    Returns their ids.
+    """
+    rng = random.Random(seed + 1)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    ids = []
+    rows = []
+    for i in range(n):
+        ts = (start + timedelta(seconds=i)).strftime("%Y-%m-%dT%H:%M:%S.000000+00:00")
+        draft = {
+            "id": f"bench-{i:08d}",
+            "subject": "Re: " + rng.choice(_SUBJECTS),
+            "body": " ".join(rng.choice(_SENTENCES) for _ in range(3)),
+            "created_at": ts,
+            "updated_at": ts,
+            "source_email_id": rng.randint(1, max(1, n_emails)),
+            "type": rng.choice(("agent-generated", "custom")),
+            "metadata": {},
+        }
+        ids.append(draft["id"])
+        rows.append((draft["id"], json.dumps(draft)))
+        if len(rows) >= chunk or i == n - 1:
+            with store.transaction() as db:
+                db.executemany("INSERT OR IGNORE INTO drafts (id, data) VALUES (?, ?)", rows)
+            rows = []
+    return ids
+
+
+# ---- Timing ----
+def percentile(sorted_values, q: float) -> float:
+    # nearest-rank, on an already sorted list
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples, wall: float):
+    s = sorted(samples)
+    ms = lambda v: round(v * 1e3, 3)
+    return {
+        "requests": len(s),
+        "p50_ms": ms(percentile(s, 50)),
+        "p95_ms": ms(percentile(s, 95)),
+        "p99_ms": ms(percentile(s, 99)),
+        "mean_ms": ms(sum(s) / len(s)) if s else None,
+        "max_ms": ms(s[-1]) if s else None,
+        "requests_per_second": round(len(s) / wall, 2) if wall > 0 else None,
+    }
+
+
+def _request(client, rng, state, scenario):
+    n = state["emails"]
+    eid = rng.randint(1, n)
+    if scenario == "inbox_full":
+        return client.get("/inbox")
+    if scenario == "inbox_page":
+        return client.get("/inbox", params={"limit": 50, "fields": "id,sender,subject,timestamp"})
+    if scenario == "inbox_sender":
+        return client.get("/inbox", params={"sender": rng.choice(_SENDERS), "limit": 50})
+    if scenario == "search":
+        return client.get("/search", params={"q": rng.choice(_SENTENCES), "k": 10})
+    if scenario == "text_search":
+        return client.get("/search", params={"q": rng.choice(_TEXT_QUERIES), "k": 10, "mode": "text"})
+    if scenario == "process_email":
+        return client.post(f"/process/{eid}", params={"mode": state["mode"]})
+    if scenario == "process_batch":
+        ids = [rng.randint(1, n) for _ in range(state["batch"])]
+        return client.post("/process/batch", json={"email_ids": ids, "batch_size": state["batch"], "mode": state["mode"]})
+    if scenario == "agent_query":
+        ptype = rng.choice(("categorization", "action", "auto_reply"))
+        return client.post("/agent/query", json={"email_id": eid, "prompt_type": ptype, "user_instruction": "keep it short"})
+    if scenario == "draft_create":
+        r = client.post("/drafts", json={"subject": "Benchmark draft", "body": rng.choice(_SENTENCES), "source_email_id": eid})
+        state["created"].append(r.json()["draft"]["id"])
+        return r
+    if scenario == "draft_get":
+        return client.get(f"/drafts/{rng.choice(state['drafts'])}")
+    if scenario == "draft_update":
+        return client.put(f"/drafts/{rng.choice(state['drafts'])}", json={"body": rng.choice(_SENTENCES)})
+    if scenario == "draft_list_page":
+        return client.get("/drafts", params={"limit": 50, "fields": "id,subject,updated_at"})
+    if scenario == "draft_delete":
+        # deletes what draft_create added, so the store ends the size it started
+        return client.delete(f"/drafts/{state['created'].pop()}")
+    raise ValueError(f"unknown scenario {scenario!r}")
+
+
+def run_scenario(client, scenario, iterations, warmup, rng, state):
+    for _ in range(warmup):
+        if scenario == "draft_delete" and not state["created"]:
+            break
+        _request(client, rng, state, scenario)
+    samples = []
+    errors = 0
+    t_wall = time.perf_counter()
+    for _ in range(iterations):
+        if scenario == "draft_delete" and not state["created"]:
+            break
+        t0 = time.perf_counter()
+        r = _request(client, rng, state, scenario)
+        samples.append(time.perf_counter() - t0)
+        errors += r.status_code >= 400
+    result = summarize(samples, time.perf_counter() - t_wall)
+    result["errors"] = errors
+    return result
+
+
+# ---- Run ----
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE, capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE, capture_output=True, text=True, timeout=30)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") if out.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    workdir = Path(tempfile.mkdtemp(prefix="bench_backend_"))
+    inbox_path = workdir / "inbox.json"
+    t0 = time.perf_counter()
+    write_inbox(inbox_path, args.emails, args.seed)
+
+    # the app reads these at import time
+    os.environ["INBOX_PATH"] = str(inbox_path)
+    os.environ["STORE_PATH"] = str(workdir / "agent.sqlite3")
+    os.environ["JOB_WORKERS"] = "0"
+    os.environ["LLM_CACHE"] = "0"
+    os.environ["LLM_CACHE_PATH"] = str(workdir / "llm_cache.sqlite3")
+    os.environ["LOCAL_LLM"] = "1" if args.local else "0"
+    if args.local:
+        os.environ.setdefault("LOCAL_MODEL_WARMUP", "eager")
+
+    from fastapi.testclient import TestClient
+
+    from backend.app import app, drafts_repo, search_index, store
+    from backend.llm import local_model_name
+
+    scenarios = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"unknown scenario(s): {', '.join(unknown)}")
+
+    rng = random.Random(args.seed)
+    results = {}
+    try:
+        with TestClient(app) as client:
+            draft_ids = seed_drafts(store, args.drafts, args.emails, args.seed)
+            # seeded behind the app's back, so index them the way a restart would
+            search_index.sync_drafts(drafts_repo.list())
+            setup_seconds = time.perf_counter() - t0
+            state = {"emails": args.emails, "drafts": draft_ids or ["missing"], "created": [],
+                     "mode": args.mode, "batch": args.batch_size}
+            for name in scenarios:
+                iterations = args.llm_iterations if name in LLM_SCENARIOS else args.iterations
+                results[name] = run_scenario(client, name, iterations, args.warmup, rng, state)
+                print(f"{name:16s} p50 {results[name]['p50_ms']:>9} ms  p95 {results[name]['p95_ms']:>9} ms  "
+                      f"{results[name]['requests_per_second']} req/s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "llm": "local" if args.local else "mock",
+            "model": local_model_name() if args.local else None,
+            "process_mode": args.mode,
+            "emails": args.emails,
+            "drafts": args.drafts,
+            "iterations": args.iterations,
+            "llm_iterations": args.llm_iterations,
+            "batch_size": args.batch_size,
+            "seed": args.seed,
+            "setup_seconds": round(setup_seconds, 2),
+        },
+        "scenarios": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{report['meta']['commit'] or 'nogit'}-{report['meta']['llm']}-{args.emails}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    print(f"written to {out}", file=sys.stderr)
+    return report
+
+
+# ---- Compare ----
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return round((new - old) / old * 100, 1)
+
+
+def compare(old_path: Path, new_path: Path):
+    """
+    Per-scenario change (percent) between two result files; negative p50/p95
+    and positive req/s are improvements.
+    """
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    rows = {}
+    for name, n in new["scenarios"].items():
+        o = old["scenarios"].get(name)
+        if o is None:
+            continue
+        rows[name] = {
+            "p50_ms": [o["p50_ms"], n["p50_ms"], _change(o["p50_ms"], n["p50_ms"])],
+            "p95_ms": [o["p95_ms"], n["p95_ms"], _change(o["p95_ms"], n["p95_ms"])],
+            "requests_per_second": [o["requests_per_second"], n["requests_per_second"],
+                                    _change(o["requests_per_second"], n["requests_per_second"])],
+        }
+    result = {"old": old["meta"], "new": new["meta"], "scenarios": rows}
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Backend latency/throughput benchmark.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--emails", type=int, default=1000)
+    r.add_argument("--drafts", type=int, default=1000)
+    r.add_argument("--iterations", type=int, default=200)
+    r.add_argument("--llm-iterations", type=int, default=50, help="for the scenarios that call the LLM")
+    r.add_argument("--warmup", type=int, default=5)
+    r.add_argument("--batch-size", type=int, default=8)
+    r.add_argument("--mode", default="separate", help="processing mode: separate or triage")
+    r.add_argument("--local", action="store_true", help="use the local model instead of the mock LLM")
+    r.add_argument("--scenarios", help="comma-separated subset of: " + ",".join(SCENARIOS))
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--out", help="result file (default benchmarks/results/<commit>-<llm>-<emails>.json)")
+    c = sub.add_parser("compare")
+    c.add_argument("old", type=Path)
+    c.add_argument("new", type=Path)
+    args = ap.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args.old, args.new)
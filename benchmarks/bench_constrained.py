@@ -0,0 +1,72 @@
+# benchmarks/bench_constrained.py
+"""
+Benchmark: free sampling vs. schema-constrained JSON decoding on the local model.
+
+    LOCAL_MODEL_NAME=distilgpt2 python -m benchmarks.bench_constrained [n_emails]
+
+For each Prompt Brain template, reports new tokens per call, time per call and
+how often the output fails to parse: strictly (json.loads on the returned
+text, as /agent/query does) and leniently (first JSON value after the prompt).
+"""
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import torch
+
+from backend.llm import call_local_model_batch, local_model_name, parse_json_lenient, prefix_cache, registry
+
+BASE = Path(__file__).resolve().parent.parent
+INBOX_PATH = BASE / "data" / "mock_inbox.json"
+PROMPT_PATH = BASE / "prompts" / "default_p.json"
+
+TEMPLATES = ("categorization_prompt", "action_prompt", "auto_reply_prompt", "triage_prompt")
+
+
+def _strict_ok(text):
+    try:
+        json.loads(text)
+        return True
+    except Exception:
+        return False
+
+
+def _run(prompts, template, max_tokens):
+    with registry.acquire(local_model_name()) as gen:
+        tok = gen.tokenizer
+    t0 = time.perf_counter()
+    outs = call_local_model_batch(prompts, max_tokens=max_tokens, batch_size=8, templates=[template] * len(prompts))
+    secs = time.perf_counter() - t0
+    new = [o[len(p):] if o.startswith(p) else o for p, o in zip(prompts, outs)]
+    n = len(prompts)
+    return {
+        "new_tokens_per_call": round(sum(len(tok(t).input_ids) for t in new) / n, 1),
+        "ms_per_call": round(secs / n * 1e3, 2),
+        "strict_parse_failures": sum(1 for o in outs if not _strict_ok(o)),
+        "lenient_parse_failures": sum(1 for p, o in zip(prompts, outs) if parse_json_lenient(o, p) is None),
+    }
+
+
+def main(n: int = 24, max_tokens: int = 256):
+    inbox = json.loads(INBOX_PATH.read_text())
+    templates = json.loads(PROMPT_PATH.read_text())
+    prefix_cache.sync_templates(templates)
+    emails = [inbox[i % len(inbox)] for i in range(n)]
+    torch.manual_seed(0)
+
+    result = {"model": local_model_name(), "emails": n, "max_tokens": max_tokens, "templates": {}}
+    for name in TEMPLATES:
+        prompts = [templates[name].replace("{email_text}", e["body"]).replace("{user_instruction}", "friendly") for e in emails]
+        row = {}
+        for label, flag in (("free", "0"), ("constrained", "1")):
+            os.environ["CONSTRAINED_DECODING"] = flag
+            row[label] = _run(prompts, name, max_tokens)
+        result["templates"][name] = row
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 24)
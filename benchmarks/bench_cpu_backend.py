@@ -0,0 +1,182 @@
+# benchmarks/bench_cpu_backend.py
+"""
+Benchmark + regression check: float32 vs. int8 vs. ONNX Runtime CPU inference.
+
+    LOCAL_MODEL_NAME=distilgpt2 python -m benchmarks.bench_cpu_backend [--emails 8] [--backends torch,int8,onnx]
+
+Each backend runs in its own process (LOCAL_MODEL_BACKEND) so peak RSS is
+its own. The regression set is the mock inbox rendered through the
+categorization and action templates. float32 runs first and records its
+greedy continuations; every other backend is then scored on them:
+
+- top1_agreement: share of positions where the backend's next-token argmax
+  equals float32's, fed float32's continuation (teacher forcing)
+- nll / nll_delta: mean negative log-likelihood of that continuation, and the
+  difference to float32's (0 = identical predictions)
+- greedy_exact: prompts whose own greedy continuation matches float32's
+- json_valid: constrained categorization outputs that parse
+
+plus load time, model bytes, resident and peak RSS and greedy tokens/s.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE = Path(__file__).resolve().parent.parent
+INBOX_PATH = BASE / "data" / "mock_inbox.json"
+PROMPT_PATH = BASE / "prompts" / "default_p.json"
+
+TEMPLATES = ("categorization_prompt", "action_prompt")
+
+
+def _regression_set(n: int):
+    from backend.prompts import render
+
+    inbox = json.loads(INBOX_PATH.read_text())
+    templates = json.loads(PROMPT_PATH.read_text())
+    emails = [inbox[i % len(inbox)] for i in range(n)]
+    return [(name, render(templates[name], email_text=e["body"], user_instruction="friendly")) for name in TEMPLATES for e in emails]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _rss_mb():
+    # resident size right now (Linux only); the peak includes loading the float32 checkpoint
+    try:
+        return round(int(Path("/proc/self/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def worker(backend: str, n: int, max_tokens: int, reference_path: str = None, reference_out: str = None):
+    os.environ["LOCAL_MODEL_BACKEND"] = backend
+    import torch
+
+    from backend.llm import call_local_model_batch, local_model_name, registry
+    from backend.model_registry import estimate_model_bytes
+
+    cases = _regression_set(n)
+    t0 = time.perf_counter()
+    gen = registry.get(local_model_name())
+    load_seconds = time.perf_counter() - t0
+    tok, model = gen.tokenizer, gen.model
+    reference = json.loads(Path(reference_path).read_text()) if reference_path else None
+
+    continuations, new_tokens, gen_seconds = [], 0, 0.0
+    agree = positions = 0
+    nll = 0.0
+    exact = 0
+    with torch.no_grad():
+        for i, (_, prompt) in enumerate(cases):
+            enc = tok(prompt, return_tensors="pt")
+            n_prompt = enc["input_ids"].shape[1]
+            t0 = time.perf_counter()
+            out = model.generate(**enc, max_new_tokens=max_tokens, do_sample=False, pad_token_id=tok.pad_token_id)
+            gen_seconds += time.perf_counter() - t0
+            ids = out[0, n_prompt:].tolist()
+            new_tokens += len(ids)
+            continuations.append(ids)
+
+            ref = reference["continuations"][i] if reference else ids
+            exact += ids == ref
+            if not ref:
+                continue
+            full = torch.tensor([enc["input_ids"][0].tolist() + ref])
+            logits = model(input_ids=full, attention_mask=torch.ones_like(full)).logits[0, n_prompt - 1:-1].float()
+            target = torch.tensor(ref)
+            agree += int((logits.argmax(-1) == target).sum())
+            positions += len(ref)
+            nll -= float(torch.log_softmax(logits, -1).gather(1, target[:, None]).sum())
+
+    os.environ["CONSTRAINED_DECODING"] = "1"
+    torch.manual_seed(0)
+    cat = [p for name, p in cases if name == "categorization_prompt"]
+    outs = call_local_model_batch(cat, max_tokens=64, templates=["categorization_prompt"] * len(cat))
+    valid = 0
+    for o in outs:
+        try:
+            json.loads(o or "")
+            valid += 1
+        except ValueError:
+            pass
+
+    if reference_out:
+        Path(reference_out).write_text(json.dumps({"continuations": continuations}))
+    result = {
+        "backend": getattr(gen, "backend", backend),
+        "load_seconds": round(load_seconds, 2),
+        "model_mb": round(estimate_model_bytes(gen) / 2**20, 1),
+        "rss_mb": _rss_mb(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "tokens_per_second": round(new_tokens / gen_seconds, 1) if gen_seconds else None,
+        "top1_agreement": round(agree / positions, 4) if positions else None,
+        "nll": round(nll / positions, 4) if positions else None,
+        "greedy_exact": f"{exact}/{len(cases)}",
+        "json_valid": f"{valid}/{len(cat)}",
+    }
+    print(json.dumps(result))
+    return result
+
+
+def _spawn(backend: str, args, extra):
+    cmd = [sys.executable, "-m", "benchmarks.bench_cpu_backend", "--worker", backend,
+           "--emails", str(args.emails), "--max-tokens", str(args.max_tokens), *extra]
+    env = dict(os.environ, LOCAL_LLM="1", LLM_CACHE="0")
+    proc = subprocess.run(cmd, cwd=BASE, env=env, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+    if proc.returncode or not lines:
+        return {"backend": backend, "error": (proc.stderr or proc.stdout).strip().splitlines()[-1:]}
+    return json.loads(lines[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--emails", type=int, default=8, help="emails per template in the regression set")
+    ap.add_argument("--max-tokens", type=int, default=32)
+    ap.add_argument("--backends", default="torch,int8,onnx")
+    ap.add_argument("--worker", help=argparse.SUPPRESS)
+    ap.add_argument("--reference", help=argparse.SUPPRESS)
+    ap.add_argument("--reference-out", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker:
+        worker(args.worker, args.emails, args.max_tokens, args.reference, args.reference_out)
+        return
+
+    from backend.llm import local_model_name
+
+    result = {"model": local_model_name(), "emails": args.emails, "max_tokens": args.max_tokens, "backends": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        ref = os.path.join(tmp, "reference.json")
+        base = _spawn("torch", args, ["--reference-out", ref])
+        result["backends"]["torch"] = base
+        for backend in args.backends.split(","):
+            backend = backend.strip()
+            if backend == "torch" or not backend:
+                continue
+            row = _spawn(backend, args, ["--reference", ref])
+            if row.get("backend") != backend and "error" not in row:
+                row = {"backend": backend, "error": "not available, the loader fell back to float32"}
+            if "error" not in row:
+                if row.get("nll") is not None and base.get("nll") is not None:
+                    row["nll_delta"] = round(row["nll"] - base["nll"], 4)
+                if row.get("tokens_per_second") and base.get("tokens_per_second"):
+                    row["speedup"] = round(row["tokens_per_second"] / base["tokens_per_second"], 2)
+                if row.get("rss_mb") is not None and base.get("rss_mb") is not None:
+                    row["rss_saved_mb"] = round(base["rss_mb"] - row["rss_mb"], 1)
+            result["backends"][backend] = row
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
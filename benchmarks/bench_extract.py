@@ -0,0 +1,72 @@
+# benchmarks/bench_extract.py
+"""
+Micro-benchmark: rule-based action extraction vs. the previous mock extractor.
+
+    python -m benchmarks.bench_extract [n_emails]
+
+The legacy implementation is kept here verbatim as the baseline. It was fed
+the whole rendered prompt, so it is benchmarked the same way.
+"""
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+from backend.extract import extract_actions_batch
+
+BASE = Path(__file__).resolve().parent.parent
+INBOX_PATH = BASE / "data" / "mock_inbox.json"
+PROMPT_PATH = BASE / "prompts" / "default_p.json"
+
+
+def _simple_json_safe(s: str) -> str:
+    return s.replace('\n', ' ').strip()
+
+
+def legacy_extract_actions(email_text: str) -> list:
+    t = email_text
+    tasks = []
+    if re.search(r'(please|kindly|could you|can you|need you to|we need)', t, re.I):
+        m = re.search(r'(?:please|kindly|could you|can you|we need to|we need)\s+([^\\.|\\n]+)', t, re.I)
+        if m:
+            task_text = m.group(1).strip()
+            tasks.append({"task": _simple_json_safe(task_text), "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
+    if re.search(r'(meet|meeting|schedule|proposed agenda|proposed time|availability)', t, re.I):
+        tasks.append({"task": "Schedule meeting / confirm time", "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
+    if re.search(r'(invoice|payment|due)', t, re.I):
+        tasks.append({"task": "Review invoice / arrange payment", "deadline": None, "assignee": None, "context": _simple_json_safe(t)})
+    return tasks
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+def main(n: int = 10000):
+    inbox = json.loads(INBOX_PATH.read_text())
+    template = json.loads(PROMPT_PATH.read_text())["action_prompt"]
+    emails = [inbox[i % len(inbox)] for i in range(n)]
+    prompts = [template.replace("{email_text}", e["body"]) for e in emails]
+
+    legacy, t_legacy = _timed(lambda: [legacy_extract_actions(p) for p in prompts])
+    engine, t_engine = _timed(lambda: extract_actions_batch(emails))
+
+    result = {
+        "emails": n,
+        "legacy_us_per_email": round(t_legacy / n * 1e6, 2),
+        "engine_us_per_email": round(t_engine / n * 1e6, 2),
+        "legacy_tasks": sum(map(len, legacy)),
+        "engine_tasks": sum(map(len, engine)),
+        "engine_tasks_with_deadline": sum(1 for ts in engine for t in ts if t["deadline"]),
+        "legacy_output_bytes": len(json.dumps(legacy)),
+        "engine_output_bytes": len(json.dumps(engine)),
+    }
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,120 @@
+# benchmarks/bench_search_index.py
+"""
+Benchmark: full-text index build, open and query latency at mailbox scale.
+
+    python -m benchmarks.bench_search_index [--emails 1000000] [--drafts 10000] [--iterations 50]
+
+Indexes the synthetic inbox from bench_backend (plus drafts) into a fresh
+SearchIndex in a temporary directory, then reopens it from disk the way a
+restarted backend would and times single-term, multi-term, prefix and
+filtered queries, a draft write followed by a query, and a full merge.
+"""
+import argparse
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from backend.search_index import SearchIndex
+from backend.store import Store
+from backend.sync import email_hash
+from benchmarks.bench_backend import percentile, synthetic_emails
+
+QUERIES = (
+    ("single_term", "invoice", {}),
+    ("two_terms", "overdue invoice", {}),
+    ("three_terms", "q4 report friday", {}),
+    ("prefix", "inv*", {}),
+    ("sender_filter", "contract", {"sender": "client@partner.io"}),
+    ("date_filter", "review", {"since": "2025-06-01", "until": "2025-06-30"}),
+    ("drafts_only", "timeline", {"kind": "draft"}),
+    ("no_match", "zzzz", {}),
+)
+
+
+def _percentiles(samples):
+    s = sorted(samples)
+    return {"p50_ms": round(percentile(s, 50) * 1e3, 3), "p95_ms": round(percentile(s, 95) * 1e3, 3),
+            "max_ms": round(s[-1] * 1e3, 3)}
+
+
+def _timed_queries(index, q, kw, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        hits = index.search(q, 10, **kw)
+        samples.append(time.perf_counter() - t0)
+    return dict(_percentiles(samples), hits=len(hits))
+
+
+def _dir_mb(path: Path) -> float:
+    return round(sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2**20, 1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--emails", type=int, default=1_000_000)
+    ap.add_argument("--drafts", type=int, default=10_000)
+    ap.add_argument("--iterations", type=int, default=50)
+    args = ap.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-search-"))
+    try:
+        store = Store(workdir / "agent.sqlite3")
+        emails = list(synthetic_emails(args.emails))
+        hashes = {e["id"]: email_hash(e) for e in emails}
+        drafts = [{"id": f"bench-{i}", "subject": f"Re: {e['subject']}", "body": e["body"], "updated_at": e["timestamp"]}
+                  for i, e in enumerate(emails[:args.drafts])]
+
+        index = SearchIndex(store, workdir / "agent.search")
+        t0 = time.perf_counter()
+        index.sync_emails(emails, hashes, lambda ids: {})
+        index.sync_drafts(drafts)
+        index.save()
+        build_seconds = time.perf_counter() - t0
+        del index
+
+        # a restart: the segment is memory-mapped, nothing is re-tokenized
+        reopened = SearchIndex(store, workdir / "agent.search")
+        t0 = time.perf_counter()
+        reopened.search("invoice", 1)
+        open_seconds = time.perf_counter() - t0
+
+        queries = {name: _timed_queries(reopened, q, kw, args.iterations) for name, q, kw in QUERIES}
+
+        samples = []
+        for i in range(args.iterations):
+            t0 = time.perf_counter()
+            reopened.put_draft({"id": f"new-{i}", "subject": "Timeline", "body": "Updated invoice timeline",
+                                "updated_at": "2025-02-01T00:00:00Z"})
+            reopened.search("timeline", 10, kind="draft")
+            samples.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        reopened.save()
+        merge_seconds = time.perf_counter() - t0
+
+        result = {
+            "emails": args.emails,
+            "drafts": args.drafts,
+            "build_seconds": round(build_seconds, 2),
+            "open_seconds": round(open_seconds, 3),
+            "merge_seconds": round(merge_seconds, 2),
+            "index_mb": _dir_mb(workdir / "agent.search"),
+            # ru_maxrss is in KB on Linux, bytes on macOS
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10), 1),
+            "queries": queries,
+            "draft_write_then_query": _percentiles(samples),
+            "stats": reopened.stats(),
+        }
+        print(json.dumps(result, indent=2))
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
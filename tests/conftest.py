@@ -0,0 +1,46 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# the app opens its store, caches and indexes at import time: point them at a
+# scratch directory, keep the worker pool and response cache off, use the mock LLM
+_TMP = Path(tempfile.mkdtemp(prefix="email-agent-tests-"))
+os.environ.setdefault("STORE_PATH", str(_TMP / "agent.sqlite3"))
+os.environ.setdefault("LLM_CACHE_PATH", str(_TMP / "llm_cache.sqlite3"))
+os.environ.setdefault("LLM_CACHE", "0")
+os.environ.setdefault("JOB_WORKERS", "0")
+os.environ.setdefault("LOCAL_LLM", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+
+    from backend.app import app
+
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def local_model():
+    """
+    A loaded text-generation pipeline for the tests that drive the model
+    directly: TEST_LOCAL_MODEL names it (a model directory or a Hub name
+    already in the local cache). Skipped when unset or not loadable.
+    """
+    name = os.environ.get("TEST_LOCAL_MODEL")
+    if not name:
+        pytest.skip("set TEST_LOCAL_MODEL to run the local model tests")
+    from backend.llm import _load_transformer_model
+
+    try:
+        return _load_transformer_model(name)
+    except Exception as e:
+        pytest.skip(f"local model {name!r} not available: {e}")
@@ -0,0 +1,48 @@
+# tests/test_constrained.py
+import json
+
+import pytest
+
+from backend.classifier import CATEGORIES
+from backend.constrained import SCHEMAS, decode_json, schema_for
+
+
+def _decode(gen, prompt, schema, max_tokens=256):
+    enc = dict(gen.tokenizer([prompt], return_tensors="pt").to(gen.model.device))
+    return json.loads("".join(decode_json(gen, enc, schema, max_tokens=max_tokens)))
+
+
+def _check(value, schema):
+    if "enum" in schema:
+        assert value in schema["enum"]
+    elif schema.get("type") == "object":
+        assert list(value) == list(schema["properties"])
+        for key, sub in schema["properties"].items():
+            _check(value[key], sub)
+    elif schema.get("type") == "array":
+        assert isinstance(value, list) and len(value) <= schema.get("maxItems", 5)
+        for item in value:
+            _check(item, schema["items"])
+    elif isinstance(schema.get("type"), list):
+        assert value is None or isinstance(value, str)
+    else:
+        assert isinstance(value, str)
+
+
+def test_schema_lookup(monkeypatch):
+    assert schema_for("categorization_prompt")["properties"]["category"]["enum"] == CATEGORIES
+    assert schema_for("some_other_prompt") is None
+    monkeypatch.setenv("CONSTRAINED_DECODING", "0")
+    assert schema_for("categorization_prompt") is None
+
+
+@pytest.mark.parametrize("template", sorted(SCHEMAS))
+def test_output_parses_and_fits_the_schema(local_model, template):
+    prompt = "Email: Can we meet on Friday to review the Q4 invoice?\nAnswer in JSON:\n"
+    _check(_decode(local_model, prompt, SCHEMAS[template]), SCHEMAS[template])
+
+
+@pytest.mark.parametrize("max_tokens", [1, 4, 12])
+def test_output_still_parses_when_the_token_budget_runs_out(local_model, max_tokens):
+    value = _decode(local_model, "Tasks:\n", SCHEMAS["triage_prompt"], max_tokens=max_tokens)
+    _check(value, SCHEMAS["triage_prompt"])
@@ -0,0 +1,61 @@
+# tests/test_context.py
+from backend.context import TokenCounter, build_context, fit_metadata
+
+COUNTER = TokenCounter()
+
+
+def _email(i=1, words=400):
+    return {"id": i, "sender": "client@partner.io", "subject": " ".join(["quarterly"] * words),
+            "timestamp": "2025-01-10T09:00:00Z", "body": "Please send the signed report by Friday. " * 60}
+
+
+def test_long_subject_stays_within_budget():
+    text, stats = build_context(_email(), COUNTER, 256)
+    assert stats["tokens"] <= 256
+    assert stats["truncated"]
+    assert "client@partner.io" in text
+
+
+def test_related_emails_stay_within_budget():
+    related = [_email(i) for i in range(2, 6)]
+    for budget in (1, 16, 64, 256, 1000):
+        _, stats = build_context(_email(), COUNTER, budget, related)
+        assert stats["tokens"] <= budget
+
+
+def test_short_metadata_is_kept_whole():
+    email = _email(words=3)
+    meta, truncated = fit_metadata(email, 256, COUNTER)
+    assert not truncated and "quarterly quarterly quarterly" in meta
+
+
+def test_no_budget_keeps_everything():
+    text, stats = build_context(_email(), COUNTER, 0)
+    assert not stats["truncated"] and " ".join(["quarterly"] * 400) in text
+
+
+class SuperadditiveCounter(TokenCounter):
+    """
+    Joined text counts more than its pieces, as merges can make a real
+    tokenizer do, so trimming piece by piece is not enough.
+    """
+
+    name = "superadditive"
+
+    def __init__(self):
+        self.tokenizer = None
+
+    def count(self, text):
+        n = super().count(text)
+        return n + n * n // 200
+
+    def truncate(self, text, max_tokens):
+        return super().truncate(text, max_tokens)
+
+
+def test_budget_holds_when_token_counts_do_not_add_up():
+    counter = SuperadditiveCounter()
+    related = [_email(i) for i in range(2, 6)]
+    for budget in (1, 8, 32, 64, 256):
+        text, stats = build_context(_email(), counter, budget, related)
+        assert stats["tokens"] == counter.count(text) <= budget
@@ -0,0 +1,31 @@
+# tests/test_extract.py
+from datetime import date
+
+import pytest
+
+from backend.extract import parse_deadline
+
+REF = date(2025, 8, 20)
+
+
+@pytest.mark.parametrize("text", [
+    "Please send 2 separate invoices",
+    "review the marketing 10 slides",
+    "decide 3 options",
+    "Mayor 4 candidates",
+    "Junior 5 engineers",
+])
+def test_words_starting_with_a_month_are_not_deadlines(text):
+    assert parse_deadline(text, REF) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("due Nov 30", "2025-11-30"),
+    ("due November 30th", "2025-11-30"),
+    ("by Sept. 5", "2025-09-05"),
+    ("by 3 Dec", "2025-12-03"),
+    ("by 3rd December", "2025-12-03"),
+    ("on 12 Jan", "2026-01-12"),
+])
+def test_month_names_and_abbreviations(text, expected):
+    assert parse_deadline(text, REF) == expected
@@ -0,0 +1,65 @@
+# tests/test_inbox.py
+import json
+
+from backend.inbox import InboxService
+from backend.store import INGESTED_ID_BASE, EmailRepository, Store
+
+
+def _mail(i):
+    return {"sender": f"s{i % 3}@x.io", "subject": f"Re: topic {i % 4}",
+            "timestamp": f"2025-01-{30 - i % 28:02d}T09:00:00Z", "body": f"message {i}"}
+
+
+def _same(a, b):
+    assert a.emails == b.emails and a.by_id == b.by_id and a.by_sender == b.by_sender
+    assert a.between("2025-01-05", "2025-01-20") == b.between("2025-01-05", "2025-01-20")
+    assert a.payload == b.payload and a.etag == b.etag
+    assert a.content_hashes() == b.content_hashes() and a.threads() == b.threads()
+
+
+def test_ingest_extends_the_snapshot_instead_of_rebuilding(tmp_path):
+    inbox = tmp_path / "inbox.json"
+    inbox.write_text(json.dumps([dict(_mail(i), id=i) for i in range(1, 6)]))
+    repo = EmailRepository(Store(tmp_path / "agent.sqlite3"))
+    service = InboxService(inbox, ingested=repo)
+    snap = service.snapshot()
+    snap.payload, snap.content_hashes(), snap.threads()  # built before the ingest
+
+    for chunk in range(3):
+        repo.insert_many(((f"k{chunk}-{i}", _mail(i)) for i in range(chunk * 7, chunk * 7 + 7)))
+        snap = service.snapshot()
+    assert (service.reloads, service.extends) == (1, 3)
+    assert len(snap.emails) == 26 and snap.ingested_to == INGESTED_ID_BASE + 21
+
+    _same(snap, InboxService(inbox, ingested=repo).snapshot())
+
+
+def test_inbox_file_change_reloads(tmp_path):
+    inbox = tmp_path / "inbox.json"
+    inbox.write_text(json.dumps([dict(_mail(1), id=1)]))
+    repo = EmailRepository(Store(tmp_path / "agent.sqlite3"))
+    repo.insert_many([("k", _mail(2))])
+    service = InboxService(inbox, ingested=repo)
+    assert [e["id"] for e in service.all()] == [1, INGESTED_ID_BASE + 1]
+    inbox.write_text(json.dumps([dict(_mail(1), id=1), dict(_mail(3), id=3)]))
+    assert [e["id"] for e in service.all()] == [1, 3, INGESTED_ID_BASE + 1]
+    assert service.reloads == 2 and service.extends == 0
+
+
+def test_ids_ingested_before_the_id_range_are_moved_off_the_inbox_files(tmp_path):
+    inbox = tmp_path / "inbox.json"
+    inbox.write_text(json.dumps([dict(_mail(1), id=1)]))
+    repo = EmailRepository(Store(tmp_path / "agent.sqlite3"))
+    # numbered right after the inbox file, as older versions did
+    with repo.store.transaction() as db:
+        db.execute("INSERT INTO emails (id, source_key, data) VALUES (2, 'old', ?)", (json.dumps(dict(_mail(2), id=2)),))
+    service = InboxService(inbox, ingested=repo)
+    assert [e["id"] for e in service.all()] == [1, 2]
+
+    # the inbox file gains an email with id 2
+    inbox.write_text(json.dumps([dict(_mail(1), id=1), dict(_mail(3), id=2)]))
+    snap = service.snapshot()
+    assert [e["id"] for e in snap.emails] == [1, 2, INGESTED_ID_BASE + 1]
+    assert snap.by_id[2]["body"] == "message 3"
+    assert snap.by_id[INGESTED_ID_BASE + 1]["body"] == "message 2"
+    assert service.snapshot() is snap
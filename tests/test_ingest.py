@@ -0,0 +1,27 @@
+# tests/test_ingest.py
+import json
+
+from backend.ingest import ingest
+from backend.store import INGESTED_ID_BASE, EmailRepository, Store
+
+
+def test_bad_jsonl_lines_are_skipped_and_counted(tmp_path):
+    path = tmp_path / "mail.jsonl"
+    lines = [
+        json.dumps({"message_id": "a", "from": "a@x.io", "subject": "One", "text": "first"}),
+        '{"message_id": "b", "from": ',  # cut off
+        "[1, 2, 3]",  # not an object
+        json.dumps({"message_id": "c", "from": "c@x.io", "subject": "Two", "text": "second"}),
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    store = Store(tmp_path / "agent.sqlite3")
+    try:
+        stats = ingest(store, path, chunk_size=2)
+        again = ingest(store, path)
+        emails = EmailRepository(store).list()
+    finally:
+        store.close()
+    assert (stats["read"], stats["inserted"], stats["invalid"], stats["duplicates"]) == (4, 2, 2, 0)
+    assert (again["inserted"], again["invalid"], again["duplicates"]) == (0, 2, 2)
+    assert [e["id"] for e in emails] == [INGESTED_ID_BASE + 1, INGESTED_ID_BASE + 2]
+    assert [e["subject"] for e in emails] == ["One", "Two"]
@@ -0,0 +1,150 @@
+# tests/test_jobs.py
+import json
+import os
+import time
+
+import pytest
+
+from backend.jobs import JobQueue, JobRunner
+from backend.prompts import PromptSet
+from backend.store import Store
+
+
+def _crash_once(flag):
+    # unpickled in the worker: the first time, the worker process dies
+    if not os.path.exists(flag):
+        open(flag, "w").close()
+        os._exit(1)
+    return "ok"
+
+
+class CrashOnce:
+    def __init__(self, flag):
+        self.flag = flag
+
+    def __reduce__(self):
+        return _crash_once, (self.flag,)
+
+
+def _wait(queue, job_ids, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = [queue.get(j) for j in job_ids]
+        if all(j["status"] in ("done", "failed", "cancelled") for j in jobs):
+            return jobs
+        time.sleep(0.1)
+    raise AssertionError(f"jobs still pending: {[j['status'] for j in jobs]}")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    store = Store(tmp_path / "agent.sqlite3")
+    yield JobQueue(store)
+    store.close()
+
+
+def _runner(queue, emails, saved, **kwargs):
+    return JobRunner(
+        queue,
+        get_email=emails.get,
+        get_prompts=lambda: {"categorization_prompt": "Categorize: {email_text}", "action_prompt": "Tasks: {email_text}"},
+        save_result=lambda email, r, prompts: saved.append((email["id"], r)),
+        workers=1,
+        **kwargs,
+    )
+
+
+def test_pool_is_replaced_after_a_worker_dies(queue, tmp_path):
+    emails = {
+        1: {"id": 1, "body": "Please review the contract.", "crash": CrashOnce(str(tmp_path / "crashed"))},
+        2: {"id": 2, "body": "Lunch on Friday?"},
+    }
+    saved = []
+    runner = _runner(queue, emails, saved)
+    ids = queue.submit([1, 2])
+    runner.start()
+    try:
+        jobs = _wait(queue, ids)
+    finally:
+        runner.stop()
+    assert [j["status"] for j in jobs] == ["done", "done"]
+    assert runner.pool_restarts >= 1
+    assert sorted(eid for eid, _ in saved) == [1, 2]
+
+
+def test_save_errors_fail_the_job(queue):
+    def save(email, result, prompts):
+        raise ValueError("disk full")
+
+    runner = JobRunner(
+        queue,
+        get_email={1: {"id": 1, "body": "Hello"}}.get,
+        get_prompts=lambda: {"categorization_prompt": "{email_text}", "action_prompt": "{email_text}"},
+        save_result=save,
+        workers=1,
+    )
+    ids = queue.submit([1])
+    runner.start()
+    try:
+        [job] = _wait(queue, ids)
+    finally:
+        runner.stop()
+    assert job["status"] == "failed"
+    assert "disk full" in job["error"]
+
+
+def test_tier1_answers_skip_the_llm(queue):
+    saved = []
+    answer = json.dumps({"category": "Meeting", "reason": "Tier-1 classifier (confidence 0.99)."})
+    runner = _runner(queue, {1: {"id": 1, "body": "Can we meet at 10?"}}, saved, classify=lambda email: answer)
+    ids = queue.submit([1])
+    runner.start()
+    try:
+        _wait(queue, ids)
+    finally:
+        runner.stop()
+    [(_, result)] = saved
+    assert result["category_output"] == answer
+    assert result["category_source"] == "tier1"
+
+
+def test_result_is_stamped_with_the_submitted_prompts(queue):
+    versions = iter(range(1, 100))
+    templates = {"categorization_prompt": "{email_text}", "action_prompt": "{email_text}"}
+    saved = []
+    runner = JobRunner(
+        queue,
+        get_email={1: {"id": 1, "body": "Hello"}}.get,
+        # every call is a newer version, as if the templates were edited while the job ran
+        get_prompts=lambda: PromptSet(templates, next(versions)),
+        save_result=lambda email, r, prompts: saved.append(prompts.version),
+        workers=1,
+    )
+    ids = queue.submit([1])
+    runner.start()
+    try:
+        _wait(queue, ids)
+    finally:
+        runner.stop()
+    assert saved == [1]
+
+
+
+def test_result_is_saved_with_the_email_the_job_ran_on(queue):
+    edits = iter(range(1, 100))
+    saved = []
+    runner = JobRunner(
+        queue,
+        # every lookup is a newer body, as if the email were edited while the job ran
+        get_email=lambda email_id: {"id": email_id, "body": f"Please review draft v{next(edits)}."},
+        get_prompts=lambda: {"categorization_prompt": "{email_text}", "action_prompt": "{email_text}"},
+        save_result=lambda email, r, prompts: saved.append(email["body"]),
+        workers=1,
+    )
+    ids = queue.submit([1])
+    runner.start()
+    try:
+        _wait(queue, ids)
+    finally:
+        runner.stop()
+    assert saved == ["Please review draft v1."]
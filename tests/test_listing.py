@@ -0,0 +1,63 @@
+# tests/test_listing.py
+from backend.listing import paginate, sort_key
+
+
+def test_paginate_walks_every_item_once():
+    items = sorted(range(1, 24), key=sort_key)
+    seen, cursor = [], None
+    while True:
+        page, cursor = paginate(items, lambda i: i, cursor, 5)
+        seen += page
+        if cursor is None:
+            break
+    assert seen == items
+
+
+def test_draft_cursor_paging_over_unsorted_drafts(client):
+    from backend.app import drafts_repo
+
+    # inserted newest first, as an import from another system might be
+    for i in range(7):
+        drafts_repo.create({
+            "id": f"paging-{i}",
+            "subject": f"Draft {i}",
+            "body": "",
+            "created_at": f"2025-01-{20 - i:02d}T00:00:00+00:00",
+            "updated_at": f"2025-01-{20 - i:02d}T00:00:00+00:00",
+            "source_email_id": None,
+            "type": "paging-test",
+            "metadata": {},
+        })
+    seen, cursor = [], None
+    while True:
+        params = {"type": "paging-test", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/drafts", params=params).json()
+        seen += [d["id"] for d in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [f"paging-{i}" for i in reversed(range(7))]
+    plain = [d["id"] for d in client.get("/drafts", params={"type": "paging-test"}).json()]
+    assert plain == seen
+
+
+def test_inbox_time_filter_matches_a_full_scan(client):
+    from backend.app import inbox_service
+    from backend.listing import in_range
+
+    emails = inbox_service.all()
+    stamps = sorted(e["timestamp"] for e in emails if e.get("timestamp"))
+    bounds = [
+        (stamps[0][:10], None),
+        (None, stamps[-1][:10]),
+        (stamps[len(stamps) // 3], stamps[2 * len(stamps) // 3][:10]),
+        (stamps[len(stamps) // 2], stamps[len(stamps) // 2]),
+        ("2999-01-01", None),
+    ]
+    for since, until in bounds:
+        params = {k: v for k, v in (("since", since), ("until", until)) if v}
+        got = [e["id"] for e in client.get("/inbox", params=params).json()]
+        expected = sorted((e["id"] for e in emails if in_range(e.get("timestamp"), since, until)), key=sort_key)
+        assert got == expected, params
@@ -0,0 +1,53 @@
+# tests/test_metrics.py
+import re
+
+from backend.metrics import MetricsRegistry
+
+# name{labels} value, as in the Prometheus text exposition format
+_SAMPLE_RE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"(,[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*")*\})? \S+$')
+
+
+def _well_formed(text):
+    for line in text.strip().splitlines():
+        if line.startswith("#"):
+            assert re.match(r"^# (HELP|TYPE) [a-zA-Z_:][a-zA-Z0-9_:]* .+$", line), line
+        else:
+            assert _SAMPLE_RE.match(line), line
+
+
+def test_counter_and_histogram_exposition():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls.", labels=("backend",))
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    calls.inc(backend="mock")
+    calls.inc(2, backend='say "hi"\n')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    text = registry.render()
+    _well_formed(text)
+    lines = text.splitlines()
+    assert "# TYPE calls_total counter" in lines
+    assert 'calls_total{backend="mock"} 1' in lines
+    assert 'calls_total{backend="say \\"hi\\"\\n"} 2' in lines
+    # buckets are cumulative and end with +Inf
+    assert [l for l in lines if l.startswith("latency_seconds_bucket")] == [
+        'latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1.0"} 2', 'latency_seconds_bucket{le="+Inf"} 3',
+    ]
+    assert "latency_seconds_count 3" in lines and "latency_seconds_sum 5.55" in lines
+
+
+def test_metrics_endpoint(client):
+    client.get("/inbox")
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    _well_formed(r.text)
+    assert re.search(r'^http_request_duration_seconds_count\{method="GET",route="/inbox",status="200"\} \d+$', r.text, re.M)
+    assert "# TYPE email_agent_stage_seconds histogram" in r.text
+
+
+def test_server_timing_header(client, monkeypatch):
+    assert "Server-Timing" not in client.get("/inbox").headers
+    monkeypatch.setenv("SERVER_TIMING", "1")
+    header = client.get("/inbox").headers["Server-Timing"]
+    assert re.fullmatch(r"([a-z_]+;dur=\d+\.\d{2}, )*total;dur=\d+\.\d{2}", header)
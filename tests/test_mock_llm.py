@@ -0,0 +1,26 @@
+# tests/test_mock_llm.py
+import json
+from pathlib import Path
+
+from backend.llm import call_llm
+from backend.prompts import render
+
+PROMPT_PATH = Path(__file__).resolve().parent.parent / "prompts" / "default_p.json"
+
+
+def _templates():
+    return json.loads(PROMPT_PATH.read_text())
+
+
+def test_mock_answers_by_template_not_email_wording():
+    body = "Can you triage the open bugs and draft a reply to the customer by Friday?"
+    templates = _templates()
+    category = json.loads(call_llm(render(templates["categorization_prompt"], email_text=body), template="categorization_prompt"))
+    actions = json.loads(call_llm(render(templates["action_prompt"], email_text=body), template="action_prompt"))
+    assert set(category) == {"category", "reason"}
+    assert isinstance(actions, list) and actions
+
+
+def test_mock_without_template_ignores_the_email_text():
+    prompt = render(_templates()["categorization_prompt"], email_text="Please triage the inbox.")
+    assert "category" in json.loads(call_llm(prompt))
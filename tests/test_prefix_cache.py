@@ -0,0 +1,69 @@
+# tests/test_prefix_cache.py
+from backend.prefix_cache import PrefixCache, template_prefix
+
+TEMPLATE = "You are an email assistant. Categorize the email below.\nEmail:\n{email_text}\nCategory:"
+
+
+def test_prefix_stops_at_the_first_placeholder():
+    assert template_prefix(TEMPLATE) == "You are an email assistant. Categorize the email below.\nEmail:\n"
+    # JSON examples in a template are not placeholders
+    assert template_prefix('Answer like {"category": "Meeting"} for: {email_text}') == 'Answer like {"category": "Meeting"} for: '
+    assert template_prefix("no placeholders") == ""
+
+
+def test_prefix_is_used_only_for_prompts_rendered_from_its_template(monkeypatch):
+    cache = PrefixCache()
+    cache.sync_templates({"categorization_prompt": TEMPLATE})
+    prompt = TEMPLATE.format(email_text="Lunch on Friday?")
+    assert cache.prefix_for(prompt, "categorization_prompt") == template_prefix(TEMPLATE)
+    assert cache.prefix_for("Something else entirely", "categorization_prompt") is None
+    assert cache.prefix_for(prompt, None) is None
+    monkeypatch.setenv("PREFIX_CACHE", "0")
+    assert cache.prefix_for(prompt, "categorization_prompt") is None
+
+
+def test_editing_the_preamble_invalidates_it():
+    cache = PrefixCache()
+    cache.sync_templates({"categorization_prompt": TEMPLATE})
+    cache.sync_templates({"categorization_prompt": TEMPLATE.replace("{email_text}", "{email_text}!")})
+    assert cache.invalidations == 0  # same preamble
+    cache.sync_templates({"categorization_prompt": "Be brief. " + TEMPLATE})
+    assert cache.invalidations == 1
+
+
+def _greedy(gen, enc, n=8):
+    import torch
+
+    with torch.no_grad():
+        out = gen.model.generate(**enc, max_new_tokens=n, do_sample=False, pad_token_id=gen.tokenizer.pad_token_id)
+    return out[0, enc["input_ids"].shape[1]:].tolist()
+
+
+def test_cached_preamble_generates_the_same_tokens(local_model):
+    cache = PrefixCache()
+    cache.sync_templates({"categorization_prompt": TEMPLATE})
+    prompt = TEMPLATE.format(email_text="Can we move the Q4 review to Friday?")
+    prefix = cache.prefix_for(prompt, "categorization_prompt")
+
+    plain = cache.encode(local_model, [prompt], None)
+    cached = cache.encode(local_model, [prompt], prefix)
+    again = cache.encode(local_model, [prompt], prefix)
+    assert "past_key_values" in cached and "past_key_values" not in plain
+    assert cache.builds == 1 and cache.hits == 2 and cache.misses == 1
+    assert _greedy(local_model, cached) == _greedy(local_model, plain)
+    # the stored preamble is copied, not extended, by a generation
+    assert _greedy(local_model, again) == _greedy(local_model, plain)
+
+
+def test_batches_share_the_preamble(local_model):
+    cache = PrefixCache()
+    cache.sync_templates({"categorization_prompt": TEMPLATE})
+    prompts = [TEMPLATE.format(email_text=t) for t in ("Lunch?", "Please pay invoice 42 by Monday.")]
+    enc = cache.encode(local_model, prompts, cache.prefix_for(prompts[0], "categorization_prompt"))
+    assert enc["input_ids"].shape[0] == 2 and cache.hits == 2
+    # the shorter prompt is padded between preamble and suffix, and the padding is masked out
+    lengths = [len(local_model.tokenizer(p).input_ids) for p in prompts]
+    n = len(local_model.tokenizer(template_prefix(TEMPLATE)).input_ids)
+    mask = enc["attention_mask"][0].tolist()
+    assert mask == [1] * n + [0] * (lengths[1] - lengths[0]) + [1] * (lengths[0] - n)
+    assert enc["attention_mask"][1].tolist() == [1] * lengths[1]
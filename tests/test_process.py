@@ -0,0 +1,36 @@
+# tests/test_process.py
+import json
+from datetime import date
+
+from backend.llm import _response_key, call_llm
+
+
+def test_deadlines_resolve_against_the_email_date(client):
+    # email 1 was sent on Friday 2025-01-10 and asks for the report "by Friday"
+    assert client.post("/process/1").status_code == 200
+    actions = json.loads(client.get("/processed/1").json()["action_output"])
+    deadlines = [a["deadline"] for a in actions if a.get("deadline")]
+    assert deadlines and all(d.startswith("2025-01") for d in deadlines)
+
+
+def test_agent_action_query_uses_the_email_date(client):
+    r = client.post("/agent/query", json={"email_id": 1, "prompt_type": "action"})
+    deadlines = [a["deadline"] for a in r.json()["parsed"] if a.get("deadline")]
+    assert deadlines and all(d.startswith("2025-01") for d in deadlines)
+
+
+def test_reference_date_is_part_of_the_cache_key():
+    assert _response_key("p", 256, date(2025, 1, 10)) != _response_key("p", 256, date(2026, 1, 10))
+    assert _response_key("p", 256) == _response_key("p", 256, None)
+
+
+def test_no_tone_line_without_an_instruction(client):
+    r = client.post("/agent/query", json={"email_id": 7, "prompt_type": "auto_reply"})
+    assert "Tone requested" not in r.json()["parsed"]["body"]
+    r = client.post("/agent/query", json={"email_id": 7, "prompt_type": "auto_reply", "user_instruction": "formal"})
+    assert "Tone requested: formal" in r.json()["parsed"]["body"]
+
+
+def test_empty_instruction_is_not_taken_from_the_next_section():
+    prompt = "Draft a reply.\n\nContext:\nHello\n\nUser instruction:\n\n\nRespond as JSON: {}"
+    assert "Tone requested" not in json.loads(call_llm(prompt, template="auto_reply_prompt"))["body"]
@@ -0,0 +1,60 @@
+# tests/test_prompts.py
+import json
+import os
+
+import pytest
+
+from backend.prompts import PromptService
+from backend.store import Store
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = tmp_path / "prompts.json"
+    path.write_text(json.dumps({"categorization_prompt": "Categorize: {email_text}", "action_prompt": "Tasks: {email_text}"}))
+    store = Store(tmp_path / "agent.sqlite3")
+    yield PromptService(path, store)
+    store.close()
+
+
+def test_save_bumps_the_version_once_per_change(service):
+    seen = []
+    service.on_change(lambda prompts: seen.append(prompts.version))
+    assert service.current().version == 1
+    saved = service.save({"action_prompt": "List the tasks: {email_text}"})
+    assert saved.version == 2 and saved["categorization_prompt"] == "Categorize: {email_text}"
+    # saving the same text again is not a new version
+    assert service.save({"action_prompt": "List the tasks: {email_text}"}).version == 2
+    assert seen == [1, 2]
+    assert json.loads(service.path.read_text())["action_prompt"] == "List the tasks: {email_text}"
+
+
+def test_hand_edits_to_the_file_are_a_new_version(service):
+    service.current()
+    service.path.write_text(json.dumps({"categorization_prompt": "Edited by hand: {email_text}"}))
+    os.utime(service.path, ns=(0, 1))  # a different mtime even on coarse clocks
+    assert service.current().version == 2
+
+
+def test_version_survives_a_restart(service):
+    service.save({"action_prompt": "v2 {email_text}"})
+    assert PromptService(service.path, service.store).current().version == 2
+
+
+def test_non_string_templates_are_rejected(service):
+    with pytest.raises(ValueError):
+        service.save({"action_prompt": 3})
+    assert service.current().version == 1
+
+
+def test_post_prompts_bumps_the_version(client, service, monkeypatch):
+    from backend import app as app_module
+
+    monkeypatch.setattr(app_module, "prompt_service", service)
+    before = int(client.get("/prompts").headers["X-Prompts-Version"])
+    r = client.post("/prompts", json={"action_prompt": "Only the tasks: {email_text}"})
+    assert r.json() == {"status": "ok", "version": before + 1, "changed": ["action_prompt"]}
+    after = client.get("/prompts")
+    assert after.headers["X-Prompts-Version"] == str(before + 1)
+    assert after.json()["action_prompt"] == "Only the tasks: {email_text}"
+    assert client.post("/prompts", json={"action_prompt": None}).status_code == 400
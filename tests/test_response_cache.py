@@ -0,0 +1,70 @@
+# tests/test_response_cache.py
+import pytest
+
+from backend import llm, response_cache as rc
+from backend.response_cache import ResponseCache, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(rc.time, "time", lambda: now[0])
+    return now
+
+
+def test_hit_after_put(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=100, ttl_seconds=60)
+    key = cache_key("mock", "Categorize: hello", {"max_tokens": 256})
+    assert cache.get(key) is None
+    cache.put(key, '{"category": "Other"}', "categorization_prompt")
+    assert cache.get(key) == '{"category": "Other"}'
+    assert (cache.hits, cache.misses) == (1, 1)
+    # a different prompt or parameter is a different key
+    assert cache_key("mock", "Categorize: hello", {"max_tokens": 128}) != key
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=100, ttl_seconds=60)
+    cache.put("k", "out")
+    clock[0] += 59
+    assert cache.get("k") == "out"
+    clock[0] += 2
+    assert cache.get("k") is None
+    assert cache.evictions == 1 and cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=2, ttl_seconds=0)
+    for key in ("a", "b"):
+        cache.put(key, key)
+        clock[0] += 1
+    cache.get("a")
+    clock[0] += 1
+    cache.put("c", "c")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ("a", None, "c")
+
+
+def test_editing_a_template_drops_only_its_entries(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite3", max_entries=100, ttl_seconds=0)
+    cache.sync_templates({"categorization_prompt": "v1", "action_prompt": "v1"})
+    cache.put("cat", "x", "categorization_prompt")
+    cache.put("act", "y", "action_prompt")
+    assert cache.sync_templates({"categorization_prompt": "v2", "action_prompt": "v1"}) == 1
+    assert (cache.get("cat"), cache.get("act")) == (None, "y")
+
+
+def test_call_llm_answers_repeats_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "1")
+    monkeypatch.setattr(llm, "response_cache", ResponseCache(tmp_path / "cache.sqlite3", max_entries=100, ttl_seconds=60))
+    calls = []
+    mock = llm._timed_mock
+
+    def counted(*args):
+        calls.append(args)
+        return mock(*args)
+
+    monkeypatch.setattr(llm, "_timed_mock", counted)
+    first = llm.call_llm("Categorize this email: lunch on Friday?", template="categorization_prompt")
+    second = llm.call_llm("Categorize this email: lunch on Friday?", template="categorization_prompt")
+    assert first == second and len(calls) == 1
+    assert llm.response_cache.hits == 1
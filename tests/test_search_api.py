@@ -0,0 +1,19 @@
+# tests/test_search_api.py
+
+
+def test_search_defaults_to_semantic(client):
+    r = client.get("/search", params={"q": "quarterly report deadline", "k": 3})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["mode"] == "semantic" and len(body["results"]) == 3
+    assert {"email_id", "score", "thread", "thread_size"} <= set(body["results"][0])
+
+
+def test_text_search_is_opt_in(client):
+    r = client.get("/search", params={"q": "report", "k": 3, "mode": "text"})
+    assert r.status_code == 200
+    assert r.json()["mode"] == "text"
+
+
+def test_unknown_search_mode_is_rejected(client):
+    assert client.get("/search", params={"q": "report", "mode": "fuzzy"}).status_code == 400
@@ -0,0 +1,59 @@
+# tests/test_search_index.py
+import math
+
+import pytest
+
+from backend.search_index import B, K1, SearchIndex
+from backend.store import Store
+
+DOCS = {"d1": "apple banana", "d2": "apple apple cherry cherry", "d3": "cherry"}
+
+
+def _bm25(tf, dl, avgdl, df, n):
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * dl / avgdl))
+
+
+@pytest.fixture
+def index(tmp_path):
+    idx = SearchIndex(Store(tmp_path / "agent.sqlite3"), tmp_path / "agent.search")
+    for draft_id, body in DOCS.items():
+        idx.put_draft({"id": draft_id, "subject": "", "body": body, "updated_at": "2025-01-01T00:00:00Z"})
+    return idx
+
+
+def _expected():
+    avgdl = 7 / 3  # lengths 2, 4 and 1
+    return {"draft:d2": _bm25(2, 4, avgdl, 2, 3), "draft:d1": _bm25(1, 2, avgdl, 2, 3)}
+
+
+def test_bm25_matches_hand_computed_scores(index):
+    hits = dict(index.search("apple", 10))
+    assert hits == pytest.approx(_expected(), abs=1e-3)
+    assert index.stats()["avgdl"] == pytest.approx(7 / 3, abs=1e-3)
+
+
+def test_scores_survive_merge_and_reopen(index, tmp_path):
+    index.save()
+    assert dict(index.search("apple", 10)) == pytest.approx(_expected(), abs=1e-3)
+    reopened = SearchIndex(index.store, tmp_path / "agent.search")
+    assert dict(reopened.search("apple", 10)) == pytest.approx(_expected(), abs=1e-3)
+
+
+def test_average_length_follows_removals(index):
+    # the first document indexed must not fix the average length for good
+    index.remove_draft("d2")
+    avgdl = 3 / 2
+    # d2 still counts towards document frequency until a merge drops it
+    assert dict(index.search("apple", 10)) == pytest.approx({"draft:d1": _bm25(1, 2, avgdl, 2, 3)}, abs=1e-3)
+    index.save()
+    assert dict(index.search("apple", 10)) == pytest.approx({"draft:d1": _bm25(1, 2, avgdl, 1, 2)}, abs=1e-3)
+
+
+def test_field_weights_and_filters(index):
+    index.put_draft({"id": "d4", "subject": "banana", "body": "", "updated_at": "2025-03-01T00:00:00Z"})
+    hits = index.search("banana", 10)
+    assert [k for k, _ in hits] == ["draft:d4", "draft:d1"]  # subject counts double
+    assert [k for k, _ in index.search("banana", 10, since="2025-02-01")] == ["draft:d4"]
+    assert index.search("banana", 10, kind="email") == []
+    assert [k for k, _ in index.search("ban*", 1)] == ["draft:d4"]
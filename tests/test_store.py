@@ -0,0 +1,58 @@
+# tests/test_store.py
+import json
+
+import pytest
+
+from backend.store import DraftRepository, ProcessedRepository, Store, export_json, import_json
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = Store(tmp_path / "agent.sqlite3")
+    yield s
+    s.close()
+
+
+def _legacy_files(tmp_path):
+    drafts = [{"id": "d1", "subject": "Hi", "body": "..."}, {"id": "d2", "subject": "Re", "body": "..."},
+              {"subject": "no id, skipped"}]
+    processed = {"1": {"category_output": "Meeting"}, "2": {"category_output": "Other"}}
+    (tmp_path / "drafts.json").write_text(json.dumps(drafts))
+    (tmp_path / "processed.json").write_text(json.dumps(processed))
+    return tmp_path / "drafts.json", tmp_path / "processed.json"
+
+
+def test_json_files_are_imported_once(store, tmp_path):
+    drafts_path, processed_path = _legacy_files(tmp_path)
+    assert import_json(store, drafts_path, processed_path) == {"drafts": 2, "processed": 2}
+    assert [d["id"] for d in DraftRepository(store).list()] == ["d1", "d2"]
+    assert ProcessedRepository(store).get(1) == {"category_output": "Meeting"}
+
+    # later edits are not overwritten by a second startup
+    DraftRepository(store).update("d1", {"subject": "Edited"}, "2025-01-01T00:00:00+00:00")
+    assert import_json(store, drafts_path, processed_path) == {"drafts": 0, "processed": 0}
+    assert DraftRepository(store).get("d1")["subject"] == "Edited"
+
+
+def test_missing_json_files_import_nothing(store, tmp_path):
+    assert import_json(store, tmp_path / "none.json", tmp_path / "none2.json") == {"drafts": 0, "processed": 0}
+    assert DraftRepository(store).list() == []
+
+
+def test_export_round_trips(store, tmp_path):
+    drafts_path, processed_path = _legacy_files(tmp_path)
+    import_json(store, drafts_path, processed_path)
+    out = tmp_path / "out"
+    out.mkdir()
+    export_json(store, out / "drafts.json", out / "processed.json")
+    assert [d["id"] for d in json.loads((out / "drafts.json").read_text())] == ["d1", "d2"]
+    assert json.loads((out / "processed.json").read_text()) == json.loads(processed_path.read_text())
+
+
+def test_a_failed_transaction_writes_nothing(store):
+    repo = DraftRepository(store)
+    with pytest.raises(RuntimeError):
+        with store.transaction() as db:
+            db.execute("INSERT INTO drafts (id, data) VALUES ('x', '{}')")
+            raise RuntimeError("boom")
+    assert repo.get("x") is None
@@ -0,0 +1,114 @@
+# tests/test_streaming.py
+import threading
+
+import pytest
+
+from backend import llm
+from backend.model_registry import ModelRegistry
+
+MAX_TOKENS = 200
+
+
+@pytest.fixture
+def generated(local_model, monkeypatch):
+    """
+    New-token counts of each generate() call on the test model, served
+    through a registry of its own.
+    """
+    counts = []
+    generate = local_model.model.generate
+
+    def recording(*args, **kwargs):
+        out = generate(*args, **kwargs)
+        counts.append(out.shape[1] - kwargs["input_ids"].shape[1])
+        return out
+
+    monkeypatch.setattr(local_model.model, "generate", recording)
+    monkeypatch.setattr(llm, "registry", ModelRegistry(loader=lambda name: local_model))
+    return counts
+
+
+def _lock_free():
+    entry = llm.registry._lookup("test")
+    if entry.lock.acquire(blocking=False):
+        entry.lock.release()
+        return True
+    return False
+
+
+def test_stop_event_ends_generation_early(generated):
+    stop = threading.Event()
+    stream = llm.stream_local_model("Write a long story:", max_tokens=MAX_TOKENS, model_name="test", stop=stop)
+    next(stream)
+    stop.set()
+    list(stream)
+    assert generated and generated[0] < MAX_TOKENS
+    assert _lock_free()
+
+
+def test_closing_the_stream_ends_generation(generated):
+    stream = llm.stream_local_model("Write a long story:", max_tokens=MAX_TOKENS, model_name="test")
+    next(stream)
+    stream.close()  # what a disconnected client's response does to it
+    assert generated and generated[0] < MAX_TOKENS
+    assert _lock_free()
+
+
+def test_stopped_output_is_not_cached(generated, tmp_path, monkeypatch):
+    from backend.response_cache import ResponseCache
+
+    monkeypatch.setenv("LOCAL_LLM", "1")
+    monkeypatch.setenv("LLM_CACHE", "1")
+    monkeypatch.setattr(llm, "local_model_name", lambda: "test")
+    monkeypatch.setattr(llm, "response_cache", ResponseCache(tmp_path / "cache.sqlite3", max_entries=10, ttl_seconds=60))
+    stop = threading.Event()
+    stream = llm.stream_llm("Write a long story:", max_tokens=MAX_TOKENS, stop=stop)
+    next(stream)
+    stop.set()
+    list(stream)
+    assert llm.response_cache.stats()["entries"] == 0
+
+
+def test_stream_endpoint_sends_tokens_then_done(client):
+    with client.stream("POST", "/agent/query/stream", json={"email_id": 1, "prompt_type": "categorization"}) as r:
+        events = [line.split(": ", 1)[1] for line in r.iter_lines() if line.startswith("event: ")]
+    assert events[-1] == "done" and set(events[:-1]) == {"token"}
+
+
+def test_client_disconnect_stops_the_stream(monkeypatch):
+    import asyncio
+    import json
+
+    from backend import app as app_module
+
+    state = {"stopped": None, "closed": False}
+
+    def endless(prompt, template=None, reference=None, stop=None):
+        state["stopped"] = stop
+        try:
+            while not stop.is_set():
+                yield "word "
+        finally:
+            state["closed"] = True
+
+    monkeypatch.setattr(app_module, "stream_llm", endless)
+    body = json.dumps({"email_id": 1, "prompt_type": "auto_reply"}).encode()
+    first_token = asyncio.Event()
+    requested = []
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": body, "more_body": False}
+        await first_token.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if b"event: token" in message.get("body", b""):
+            first_token.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": "/agent/query/stream", "raw_path": b"/agent/query/stream", "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json")], "client": ("test", 1), "server": ("test", 80)}
+    asyncio.run(asyncio.wait_for(app_module.app(scope, receive, send), timeout=10))
+    assert state["stopped"].is_set() and state["closed"]
@@ -0,0 +1,54 @@
+# tests/test_sync.py
+from backend.sync import email_hash, plan_sync, stamp, template_version
+
+PROMPTS = {"categorization_prompt": "Categorize: {email_text}", "action_prompt": "Tasks: {email_text}"}
+
+
+def _emails():
+    return [{"id": i, "sender": "a@x.io", "subject": f"Subject {i}", "timestamp": "2025-01-10T09:00:00Z", "body": f"Body {i}"}
+            for i in (1, 2, 3)]
+
+
+def _processed(emails, prompts):
+    version = template_version(prompts, "separate")
+    records = {str(e["id"]): stamp({}, e, version) for e in emails}
+    return {k: (r["content_hash"], r["template_version"]) for k, r in records.items()}
+
+
+def _plan(emails, states, prompts):
+    hashes = {e["id"]: email_hash(e) for e in emails}
+    todo, fresh = plan_sync(emails, hashes, states, template_version(prompts, "separate"))
+    return [(e["id"], reason) for e, reason in todo], fresh
+
+
+def test_unchanged_emails_are_skipped():
+    emails = _emails()
+    assert _plan(emails, _processed(emails, PROMPTS), PROMPTS) == ([], 3)
+
+
+def test_new_and_edited_emails_are_redone():
+    emails = _emails()
+    states = _processed(emails[:2], PROMPTS)
+    emails[1]["body"] = "Body 2, edited"
+    assert _plan(emails, states, PROMPTS) == ([(2, "changed"), (3, "new")], 1)
+
+
+def test_editing_a_template_redoes_everything_it_produced():
+    emails = _emails()
+    states = _processed(emails, PROMPTS)
+    edited = dict(PROMPTS, action_prompt="List the tasks in: {email_text}")
+    assert _plan(emails, states, edited) == ([(1, "stale_template"), (2, "stale_template"), (3, "stale_template")], 0)
+    # a template the mode does not use changes nothing
+    assert _plan(emails, states, dict(PROMPTS, auto_reply_prompt="Reply: {email_text}")) == ([], 3)
+
+
+def test_records_without_hashes_count_as_changed():
+    emails = _emails()
+    assert _plan(emails, {"1": (None, None)}, PROMPTS)[0][0] == (1, "changed")
+
+
+def test_second_sync_processes_nothing(client):
+    first = client.post("/process/sync", json={}).json()
+    second = client.post("/process/sync", json={}).json()
+    assert first["status"] == "ok"
+    assert second["processed"] == 0 and second["up_to_date"] == second["checked"] > 0
@@ -1,9 +1,9 @@
 # ui/app.py
 import streamlit as st
-import requests
-import json
 from datetime import datetime
 
+from backend_client import BackendClient
+
 st.set_page_config(page_title="Email Productivity Agent", layout="wide")
 st.title("Email Productivity Agent — Prototype")
 
@@ -12,12 +12,19 @@ st.title("Email Productivity Agent — Prototype")
 # -------------------------
 st.sidebar.header("Settings")
 BACKEND = st.sidebar.text_input("Backend URL", value="http://127.0.0.1:8000")
+INBOX_PAGE_SIZE = 50
+
+@st.cache_resource
+def get_client(base_url):
+    # one pooled session + read cache per backend URL, shared across reruns
+    return BackendClient(base_url)
+
+client = get_client(BACKEND)
 
 st.sidebar.markdown("---")
 st.sidebar.header("Prompt Brain (edit & save)")
 try:
-    resp = requests.get(f"{BACKEND}/prompts", timeout=3)
-    prompts = resp.json()
+    prompts = client.prompts()
 except Exception:
     prompts = {
         "categorization_prompt": "Categorize the email into: Important, Newsletter, Spam, To-Do, Meeting, Personal. Return JSON: {\"category\":\"...\",\"reason\":\"...\"}\\n\\nEmail:\\n{email_text}",
@@ -32,11 +39,8 @@ auto_prompt = st.sidebar.text_area("Auto Reply Prompt", prompts.get("auto_reply_
 if st.sidebar.button("Save Prompts"):
     payload = {"categorization_prompt": cat_prompt, "action_prompt": act_prompt, "auto_reply_prompt": auto_prompt}
     try:
-        r = requests.post(f"{BACKEND}/prompts", json=payload, timeout=3)
-        if r.ok:
-            st.sidebar.success("Prompts saved")
-        else:
-            st.sidebar.error("Save failed: " + r.text)
+        client.save_prompts(payload)
+        st.sidebar.success("Prompts saved")
     except Exception as e:
         st.sidebar.error("Save failed: " + str(e))
 
@@ -53,11 +57,19 @@ with col_inbox:
     st.header("Inbox")
     if st.button("Load Inbox"):
         try:
-            r = requests.get(f"{BACKEND}/inbox", timeout=5)
-            st.session_state["inbox"] = r.json()
+            page = client.inbox(limit=INBOX_PAGE_SIZE)
+            st.session_state["inbox"] = page["items"]
+            st.session_state["inbox_cursor"] = page["next_cursor"]
             st.success(f"Loaded {len(st.session_state['inbox'])} emails")
         except Exception as e:
             st.error("Failed to load inbox: " + str(e))
+    if st.session_state.get("inbox_cursor") and st.button("Load more"):
+        try:
+            page = client.inbox(limit=INBOX_PAGE_SIZE, cursor=st.session_state["inbox_cursor"])
+            st.session_state["inbox"] = st.session_state.get("inbox", []) + page["items"]
+            st.session_state["inbox_cursor"] = page["next_cursor"]
+        except Exception as e:
+            st.error("Failed to load inbox: " + str(e))
 
     inbox = st.session_state.get("inbox", [])
     if not inbox:
@@ -73,18 +85,14 @@ with col_inbox:
                 btn_col1, btn_col2, btn_col3 = st.columns([1,1,1])
                 if btn_col1.button("Process", key=f"proc-{eid}"):
                     try:
-                        r = requests.post(f"{BACKEND}/process/{eid}", timeout=10)
-                        if r.ok:
-                            st.success("Processed. Click 'Show saved processed' or Refresh processed file on the right.")
-                        else:
-                            st.error("Processing failed: " + r.text)
+                        client.process(eid)
+                        st.success("Processed. Click 'Show saved processed' or Refresh processed file on the right.")
                     except Exception as e:
                         st.error("Processing failed: " + str(e))
 
                 if btn_col2.button("Show saved processed", key=f"showp-{eid}"):
                     try:
-                        p = requests.get(f"{BACKEND}/processed", timeout=5).json()
-                        item = p.get(str(eid), {})
+                        item = client.processed_item(eid)
                         if item:
                             st.subheader("Processed Output")
                             st.write("Category output (raw):")
@@ -106,13 +114,19 @@ with col_inbox:
                     if user_instruction is not None:
                         payload["user_instruction"] = user_instruction
                     try:
-                        r = requests.post(f"{BACKEND}/agent/query", json=payload, timeout=15)
-                        if not r.ok:
-                            st.error("Agent call failed: " + r.text)
-                            return None
-                        resp = r.json()
+                        # stream tokens from /agent/query/stream and render them as they arrive
+                        events = client.agent_stream(payload)
                         st.write("Raw:")
-                        st.code(resp.get("raw"))
+                        raw_box = st.empty()
+                        text = ""
+                        resp = {}
+                        for event, data in events:
+                            if event == "token":
+                                text += data.get("text", "")
+                                raw_box.code(text)
+                            elif event == "done":
+                                resp = data
+                        raw_box.code(resp.get("raw", text))
                         st.write("Parsed:")
                         st.json(resp.get("parsed"))
                         return resp.get("parsed")
@@ -142,11 +156,8 @@ with col_inbox:
                                 "metadata": {"source": "agent", "generated_at": datetime.utcnow().isoformat()}
                             }
                             try:
-                                rd = requests.post(f"{BACKEND}/drafts", json=draft_payload, timeout=5)
-                                if rd.ok:
-                                    st.success("Draft saved.")
-                                else:
-                                    st.error("Failed to save draft: " + rd.text)
+                                client.create_draft(draft_payload)
+                                st.success("Draft saved.")
                             except Exception as e:
                                 st.error("Failed to save draft: " + str(e))
 
@@ -166,11 +177,19 @@ with col_right:
     st.header("Processed & Drafts")
     if st.button("Refresh processed file"):
         try:
-            p = requests.get(f"{BACKEND}/processed", timeout=5).json()
-            st.session_state["processed"] = p
+            page = client.processed(limit=INBOX_PAGE_SIZE)
+            st.session_state["processed"] = page["items"]
+            st.session_state["processed_cursor"] = page["next_cursor"]
             st.success("Loaded processed data")
         except Exception as e:
             st.error("Failed to load processed data: " + str(e))
+    if st.session_state.get("processed_cursor") and st.button("Load more processed"):
+        try:
+            page = client.processed(limit=INBOX_PAGE_SIZE, cursor=st.session_state["processed_cursor"])
+            st.session_state["processed"] = {**st.session_state.get("processed", {}), **page["items"]}
+            st.session_state["processed_cursor"] = page["next_cursor"]
+        except Exception as e:
+            st.error("Failed to load processed data: " + str(e))
 
     processed = st.session_state.get("processed", {})
     if processed:
@@ -194,8 +213,7 @@ with col_right:
     st.markdown("### Drafts")
     if st.button("Refresh drafts"):
         try:
-            drafts = requests.get(f"{BACKEND}/drafts", timeout=5).json()
-            st.session_state["drafts"] = drafts
+            st.session_state["drafts"] = client.drafts()
             st.success("Loaded drafts")
         except Exception as e:
             st.error("Failed to load drafts: " + str(e))
@@ -215,11 +233,8 @@ with col_right:
                 if st.button("Save changes", key=f"save-{d.get('id')}"):
                     payload = {"subject": new_subject, "body": new_body}
                     try:
-                        upd = requests.put(f"{BACKEND}/drafts/{d.get('id')}", json=payload, timeout=5)
-                        if upd.ok:
-                            st.success("Draft updated")
-                        else:
-                            st.error("Update failed: " + upd.text)
+                        client.update_draft(d.get("id"), payload)
+                        st.success("Draft updated")
                     except Exception as e:
                         st.error("Update failed: " + str(e))
             if dcols[1].button("Load to composer", key=f"load-{d.get('id')}"):
@@ -229,13 +244,10 @@ with col_right:
                 st.success("Loaded into composer")
             if dcols[2].button("Delete", key=f"del-{d.get('id')}"):
                 try:
-                    rd = requests.delete(f"{BACKEND}/drafts/{d.get('id')}", timeout=5)
-                    if rd.ok:
-                        st.success("Draft deleted")
-                        # refresh drafts list
-                        st.session_state.pop("drafts", None)
-                    else:
-                        st.error("Delete failed: " + rd.text)
+                    client.delete_draft(d.get("id"))
+                    st.success("Draft deleted")
+                    # refresh drafts list
+                    st.session_state.pop("drafts", None)
                 except Exception as e:
                     st.error("Delete failed: " + str(e))
             st.markdown("---")
@@ -250,14 +262,11 @@ with col_right:
     if c1.button("Save as new draft"):
         payload = {"subject": cs, "body": cb, "type": "custom"}
         try:
-            r = requests.post(f"{BACKEND}/drafts", json=payload, timeout=5)
-            if r.ok:
-                st.success("Draft saved")
-                # clear composer
-                st.session_state.pop("composer_subject", None)
-                st.session_state.pop("composer_body", None)
-            else:
-                st.error("Save failed: " + r.text)
+            client.create_draft(payload)
+            st.success("Draft saved")
+            # clear composer
+            st.session_state.pop("composer_subject", None)
+            st.session_state.pop("composer_body", None)
         except Exception as e:
             st.error("Save failed: " + str(e))
     if c2.button("Clear composer"):
@@ -0,0 +1,178 @@
+# ui/backend_client.py
+import json
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# seconds a cached read is served without asking the backend; after that it is
+# revalidated with If-None-Match, so an unchanged resource costs a 304
+TTLS = {
+    "/prompts": 60.0,
+    "/inbox": 30.0,
+    "/processed": 10.0,
+    "/drafts": 10.0,
+}
+DEFAULT_TTL = 10.0
+
+
+class BackendError(Exception):
+    """
+    A non-2xx answer from the backend; the message is the response body.
+    """
+
+    def __init__(self, status_code: int, text: str):
+        super().__init__(text)
+        self.status_code = status_code
+
+
+class BackendClient:
+    """
+    The UI's connection to the FastAPI backend.
+
+    One pooled requests.Session (keep-alive, so buttons reuse connections),
+    and a TTL cache of GET responses keyed by path + query. Every write drops
+    the cached reads it can affect: saving prompts clears /prompts, processing
+    clears /processed, draft CRUD clears /drafts.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 8, timeout: float = 5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        # (path, query) -> (expires_at, etag, data)
+        self._cache: Dict[Tuple[str, Tuple], Tuple[float, Optional[str], Any]] = {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    # ---- Transport ----
+    def _request(self, method: str, path: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        r = self.session.request(method, self.base_url + path, timeout=timeout or self.timeout, **kwargs)
+        if r.status_code >= 400:
+            raise BackendError(r.status_code, r.text)
+        return r
+
+    def get(self, path: str, params: Optional[Dict[str, Any]] = None, ttl: Optional[float] = None) -> Any:
+        """
+        GET `path` as JSON, from the cache while fresh. A stale entry is
+        revalidated with its ETag rather than downloaded again.
+        """
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = (path, tuple(sorted(params.items())))
+        ttl = TTLS.get("/" + path.strip("/").split("/")[0], DEFAULT_TTL) if ttl is None else ttl
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry and entry[0] > now:
+            self.hits += 1
+            return entry[2]
+        headers = {"If-None-Match": entry[1]} if entry and entry[1] else {}
+        r = self._request("GET", path, params=params, headers=headers)
+        if r.status_code == 304 and entry:
+            self.revalidated += 1
+            data, etag = entry[2], entry[1]
+        else:
+            self.misses += 1
+            data, etag = r.json(), r.headers.get("ETag")
+        with self._lock:
+            self._cache[key] = (now + ttl, etag, data)
+        return data
+
+    def invalidate(self, *prefixes: str):
+        """
+        Drop cached reads under the given path prefixes (all when none given).
+        """
+        with self._lock:
+            if not prefixes:
+                self._cache.clear()
+                return
+            for key in [k for k in self._cache if k[0].startswith(prefixes)]:
+                del self._cache[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "revalidated": self.revalidated, "misses": self.misses}
+
+    # ---- Prompts ----
+    def prompts(self) -> Dict[str, str]:
+        return self.get("/prompts")
+
+    def save_prompts(self, templates: Dict[str, str]) -> Dict[str, Any]:
+        r = self._request("POST", "/prompts", json=templates)
+        self.invalidate("/prompts")
+        return r.json()
+
+    # ---- Inbox ----
+    def inbox(self, **params) -> Any:
+        return self.get("/inbox", params)
+
+    def email(self, email_id) -> Optional[Dict[str, Any]]:
+        try:
+            return self.get(f"/inbox/{email_id}")
+        except BackendError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    # ---- Processing ----
+    def process(self, email_id, mode: Optional[str] = None) -> Dict[str, Any]:
+        r = self._request("POST", f"/process/{email_id}", params={"mode": mode} if mode else None, timeout=max(self.timeout, 60.0))
+        self.invalidate("/processed")
+        return r.json()
+
+    def processed(self, **params) -> Any:
+        return self.get("/processed", params)
+
+    def processed_item(self, email_id) -> Optional[Dict[str, Any]]:
+        """
+        One email's processed record, or None if it has not been processed.
+        """
+        try:
+            return self.get(f"/processed/{email_id}")
+        except BackendError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    # ---- Agent ----
+    def agent_stream(self, payload: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        (event, data) pairs from /agent/query/stream: "token" events, then "done".
+        """
+        r = self._request("POST", "/agent/query/stream", json=payload, stream=True, timeout=(5, 60))
+        # SSE is always UTF-8; requests would guess ISO-8859-1 for text/event-stream
+        r.encoding = "utf-8"
+        event = None
+        with r:
+            for line in r.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):])
+
+    # ---- Drafts ----
+    def drafts(self, **params) -> Any:
+        return self.get("/drafts", params)
+
+    def create_draft(self, draft: Dict[str, Any]) -> Dict[str, Any]:
+        r = self._request("POST", "/drafts", json=draft)
+        self.invalidate("/drafts")
+        return r.json()
+
+    def update_draft(self, draft_id: str, changes: Dict[str, Any]) -> Dict[str, Any]:
+        r = self._request("PUT", f"/drafts/{draft_id}", json=changes)
+        self.invalidate("/drafts")
+        return r.json()
+
+    def delete_draft(self, draft_id: str) -> Dict[str, Any]:
+        r = self._request("DELETE", f"/drafts/{draft_id}")
+        self.invalidate("/drafts")
+        return r.json()